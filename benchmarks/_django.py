@@ -0,0 +1,38 @@
+"""
+Boots the project against a throwaway SQLite database so benchmarks can run
+without touching the development database. Import and call `setup()` before
+importing any models.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup() -> None:
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "books_project.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+
+    database = tempfile.NamedTemporaryFile(suffix=".sqlite3", delete=False)
+    settings.DATABASES["default"]["NAME"] = database.name
+    settings.DATABASES["default"]["OPTIONS"] = {"timeout": 30}
+    django.setup()
+    call_command("migrate", verbosity=0)
+
+
+class QueryCounter:
+    """Counts queries executed on every connection it is installed on."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
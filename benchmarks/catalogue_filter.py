@@ -0,0 +1,166 @@
+"""
+Book list filtering: SQL against the in-process catalogue index.
+
+Grows a synthetic catalogue through the given sizes and, at each size,
+times the id lookup of a few list filters on the SQL path
+(BookRepository._filter_books) and on books.catalogue.Catalogue. Only
+filtering is measured, hydrating the matching books costs the same on both
+paths.
+
+    python -m benchmarks.catalogue_filter [size ...]
+"""
+from benchmarks import _django
+
+_django.setup()
+
+import datetime  # noqa: E402
+import statistics  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+
+import numpy as np  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+
+from books import models  # noqa: E402
+from books.catalogue import EPOCH, Catalogue  # noqa: E402
+from books.repos.book import BookRepository  # noqa: E402
+
+SIZES = (100_000, 1_000_000, 10_000_000)
+AUTHORS = 50_000
+CATEGORIES = 100
+RUNS = 5
+INSERT_BATCH_SIZE = 50_000
+START = datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc)
+SPAN = datetime.timedelta(days=3650)
+
+FILTERS = {
+    "month":
+    dict(created_after=datetime.datetime(2020,
+                                         3,
+                                         1,
+                                         tzinfo=datetime.timezone.utc),
+         created_before=datetime.datetime(2020,
+                                          3,
+                                          31,
+                                          tzinfo=datetime.timezone.utc)),
+    "authors":
+    dict(authors=[7, 70, 700]),
+    "categories":
+    dict(categories=["category-3", "category-30"]),
+    "year+category":
+    dict(created_after=datetime.datetime(2019,
+                                         1,
+                                         1,
+                                         tzinfo=datetime.timezone.utc),
+         created_before=datetime.datetime(2019,
+                                          12,
+                                          31,
+                                          tzinfo=datetime.timezone.utc),
+         categories=["category-3"]),
+}
+
+
+def seed_lookups() -> None:
+    models.Category.objects.bulk_create(
+        models.Category(id=category_id, name=f"category-{category_id}")
+        for category_id in range(1, CATEGORIES + 1))
+    models.Author.objects.bulk_create(
+        models.Author(
+            id=author_id, first_name="Author", last_name=str(author_id))
+        for author_id in range(1, AUTHORS + 1))
+
+
+def grow(columns: dict[str, np.ndarray], size: int,
+         rng: np.random.Generator) -> dict[str, np.ndarray]:
+    start = len(columns["book_ids"])
+    added = {
+        "book_ids":
+        np.arange(start + 1, size + 1, dtype=np.int64),
+        "author_ids":
+        rng.integers(1, AUTHORS + 1, size - start, dtype=np.int64),
+        "category_ids":
+        rng.integers(1, CATEGORIES + 1, size - start, dtype=np.int64),
+        "created_at": (rng.integers(
+            0, SPAN // datetime.timedelta(microseconds=1), size - start) +
+                       (START - EPOCH) // datetime.timedelta(microseconds=1)),
+    }
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(0, size - start, INSERT_BATCH_SIZE):
+            rows = slice(offset, offset + INSERT_BATCH_SIZE)
+            created_at = (
+                added["created_at"][rows].astype("datetime64[us]").astype(str))
+            cursor.executemany(
+                "INSERT INTO books (id, author_id, category_id, name, "
+                "description, created_at, updated_at) "
+                "VALUES (%s, %s, %s, %s, '', %s, %s)",
+                [(int(book_id), int(author_id), int(category_id),
+                  f"book-{book_id}", created.replace("T", " "),
+                  created.replace("T", " "))
+                 for book_id, author_id, category_id, created in zip(
+                     added["book_ids"][rows], added["author_ids"][rows],
+                     added["category_ids"][rows], created_at)])
+    return {
+        name: np.concatenate([columns[name], added[name]])
+        for name in columns
+    }
+
+
+def timed(fn) -> float:
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    sizes = [int(size) for size in sys.argv[1:]] or SIZES
+    rng = np.random.default_rng(0)
+    repo = BookRepository()
+    seed_lookups()
+    columns = {
+        name: np.empty(0, dtype=np.int64)
+        for name in ("book_ids", "author_ids", "category_ids", "created_at")
+    }
+    print(f"{'books':>10} {'filter':>14} {'matches':>9} {'sql ms':>9} "
+          f"{'index ms':>9}")
+    for size in sizes:
+        columns = grow(columns, size, rng)
+        catalogue = Catalogue.from_columns(ratings=np.zeros(size,
+                                                            dtype=np.float32),
+                                           **columns)
+        for name, filters in FILTERS.items():
+            params = dict(created_before=None,
+                          created_after=None,
+                          authors=None,
+                          categories=None)
+            params.update(filters)
+            category_ids = None
+            if params["categories"]:
+                category_ids = [
+                    int(category.split("-")[1])
+                    for category in params["categories"]
+                ]
+            index_ids = catalogue.filter(
+                created_before=params["created_before"],
+                created_after=params["created_after"],
+                author_ids=params["authors"],
+                category_ids=category_ids)
+            sql_ids = list(
+                repo._filter_books(**params).order_by("id").values_list(
+                    "id", flat=True))
+            assert sql_ids == index_ids.tolist(), name
+            sql_ms = timed(lambda: list(
+                repo._filter_books(**params).values_list("id", flat=True)))
+            index_ms = timed(lambda: catalogue.filter(
+                created_before=params["created_before"],
+                created_after=params["created_after"],
+                author_ids=params["authors"],
+                category_ids=category_ids))
+            print(f"{size:>10} {name:>14} {len(index_ids):>9} "
+                  f"{sql_ms:>9.2f} {index_ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
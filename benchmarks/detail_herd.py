@@ -0,0 +1,80 @@
+"""
+Thundering herd on a single book detail.
+
+Starts N threads at once on a cold cache, all requesting the same book, and
+reports how many database queries the detail loads issued. With request
+coalescing the count should stay flat as N grows.
+
+    python -m benchmarks.detail_herd
+"""
+from benchmarks import _django
+
+_django.setup()
+
+import threading  # noqa: E402
+import time  # noqa: E402
+
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+
+from books import models  # noqa: E402
+from books.dtos.book import User  # noqa: E402
+from books.repos.book import BookRepository  # noqa: E402
+from books.use_cases.books import get_book_use_case  # noqa: E402
+from users.models import CustomUser  # noqa: E402
+
+CONCURRENCY = (1, 10, 50, 200)
+
+
+def seed() -> tuple[int, User]:
+    author = models.Author.objects.create(first_name="Лев",
+                                          last_name="Толстой")
+    category = models.Category.objects.create(name="classics")
+    book = models.Book.objects.create(author=author,
+                                      category=category,
+                                      name="Война и мир",
+                                      description="...")
+    users = [
+        CustomUser.objects.create_user(email=f"reader{i}@example.com",
+                                       password="password") for i in range(20)
+    ]
+    models.BookReview.objects.bulk_create(
+        models.BookReview(user=user, book=book, rating=5, review="...")
+        for user in users)
+    return book.id, User(id=users[0].id, email=users[0].email)
+
+
+def run(concurrency: int, book_id: int, user: User) -> tuple[int, float]:
+    cache.clear()
+    # Warm the lookups and favourites caches, only detail loads are measured.
+    get_book_use_case(BookRepository(), user=user, book_id=book_id)
+    cache.delete(f"books:detail:{book_id}")
+
+    counter = _django.QueryCounter()
+    barrier = threading.Barrier(concurrency)
+
+    def worker():
+        barrier.wait()
+        with connection.execute_wrapper(counter):
+            get_book_use_case(BookRepository(), user=user, book_id=book_id)
+        connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counter.count, time.perf_counter() - started
+
+
+def main():
+    book_id, user = seed()
+    print(f"{'concurrency':>12} {'queries':>8} {'seconds':>8}")
+    for concurrency in CONCURRENCY:
+        queries, elapsed = run(concurrency, book_id, user)
+        print(f"{concurrency:>12} {queries:>8} {elapsed:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Feed scoring latency.
+
+Builds synthetic catalogues and times `rank_feed` for a user with a few
+dozen author and category affinities and a hundred favourites. Only the
+scoring is measured, the catalogue is cached in process by the API.
+
+    python -m benchmarks.feed
+"""
+import time
+
+import numpy as np
+
+from books.catalogue import Catalogue
+from books.recommendations import rank_feed
+
+SIZES = (10_000, 100_000, 1_000_000)
+RUNS = 50
+LIMIT = 20
+
+
+def build(size: int, rng: np.random.Generator) -> Catalogue:
+    return Catalogue.from_columns(book_ids=np.arange(1,
+                                                     size + 1,
+                                                     dtype=np.int64),
+                                  author_ids=rng.integers(1,
+                                                          size // 10 + 2,
+                                                          size,
+                                                          dtype=np.int64),
+                                  category_ids=rng.integers(1,
+                                                            200,
+                                                            size,
+                                                            dtype=np.int64),
+                                  ratings=rng.uniform(0, 5,
+                                                      size).astype(np.float32),
+                                  created_at=np.arange(size, dtype=np.int64))
+
+
+def run(size: int) -> tuple[float, float]:
+    rng = np.random.default_rng(size)
+    catalogue = build(size, rng)
+    authors = {
+        int(author_id): float(weight)
+        for author_id, weight in zip(rng.choice(catalogue.author_ids, 30),
+                                     rng.uniform(-1, 3, 30))
+    }
+    categories = {
+        int(category_id): float(weight)
+        for category_id, weight in zip(rng.choice(catalogue.category_ids, 10),
+                                       rng.uniform(0, 3, 10))
+    }
+    favourites = rng.choice(catalogue.book_ids, 100).tolist()
+
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        rank_feed(catalogue, authors, categories, favourites, LIMIT)
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings)), float(np.percentile(timings, 99))
+
+
+def main() -> None:
+    print(f"{'books':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in SIZES:
+        p50, p99 = run(size)
+        print(f"{size:>10} {p50:>8.2f} {p99:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
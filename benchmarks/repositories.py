@@ -0,0 +1,115 @@
+"""
+ORM overhead per endpoint: BookRepository against SqlBookRepository.
+
+Seeds a catalogue and times the repository calls behind the book list, the
+book detail and the two writes, bypassing the use case caches. The SQL
+detail reads the average rating in the book query, one query less; the
+rest of the difference is query compilation and model instantiation.
+
+    python -m benchmarks.repositories
+"""
+from benchmarks import _django
+
+_django.setup()
+
+import random  # noqa: E402
+import statistics  # noqa: E402
+import time  # noqa: E402
+
+from django.db import connection  # noqa: E402
+
+from books import models  # noqa: E402
+from books.dtos.book import BookReview, User  # noqa: E402
+from books.repos.book import BookRepository  # noqa: E402
+from books.repos.sql import SqlBookRepository  # noqa: E402
+from users.models import CustomUser  # noqa: E402
+
+BOOKS = 5_000
+AUTHORS = 100
+CATEGORIES = 20
+READERS = 200
+REVIEWS_PER_BOOK = 4
+RUNS = 200
+
+
+def seed() -> tuple[list[User], list[int]]:
+    rng = random.Random(0)
+    authors = models.Author.objects.bulk_create(
+        models.Author(first_name=f"Имя {i}", last_name=f"Фамилия {i}")
+        for i in range(AUTHORS))
+    categories = models.Category.objects.bulk_create(
+        models.Category(name=f"category {i}") for i in range(CATEGORIES))
+    books = models.Book.objects.bulk_create(
+        models.Book(author=rng.choice(authors),
+                    category=rng.choice(categories),
+                    name=f"Книга {i}",
+                    description="...") for i in range(BOOKS))
+    readers = CustomUser.objects.bulk_create(
+        CustomUser(email=f"reader{i}@example.com") for i in range(READERS))
+    models.BookReview.objects.bulk_create(
+        models.BookReview(
+            user=reader, book=book, rating=rng.randint(1, 5), review="...")
+        for book in books for reader in rng.sample(readers, REVIEWS_PER_BOOK))
+    writers = CustomUser.objects.bulk_create(
+        CustomUser(email=f"writer{i}@example.com") for i in range(RUNS * 2))
+    return ([User(id=writer.id, email=writer.email)
+             for writer in writers], [book.id for book in books])
+
+
+def measure(call) -> tuple[float, float]:
+    counter = _django.QueryCounter()
+    timings = []
+    with connection.execute_wrapper(counter):
+        for run in range(RUNS):
+            started = time.perf_counter()
+            call(run)
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), counter.count / RUNS
+
+
+def endpoints(repo, writers: list[User], book_ids: list[int],
+              author_id: int) -> dict:
+    return {
+        "list_books":
+        lambda run: repo.list_books(user=writers[0],
+                                    created_before=None,
+                                    created_after=None,
+                                    authors=None,
+                                    categories=None),
+        "list_books by author":
+        lambda run: repo.list_books(user=writers[0],
+                                    created_before=None,
+                                    created_after=None,
+                                    authors=[author_id],
+                                    categories=None),
+        "get_book_detail":
+        lambda run: repo.get_book_detail(user=writers[0],
+                                         book_id=book_ids[run]),
+        "create_review":
+        lambda run: repo.create_review(
+            user=writers[run],
+            review=BookReview(book_id=book_ids[run], rating=5, review="...")),
+        "add_to_favourite":
+        lambda run: repo.add_to_favourite(user_id=writers[run].id,
+                                          book_id=book_ids[run]),
+    }
+
+
+def main():
+    writers, book_ids = seed()
+    author_id = models.Book.objects.get(id=book_ids[0]).author_id
+    print(f"{BOOKS} books, {BOOKS * REVIEWS_PER_BOOK} reviews, "
+          "median ms (queries)")
+    print(f"{'':<22}{'ORM':>14}{'SQL':>14}")
+
+    # Each implementation writes as its own users, every write is new.
+    orm = endpoints(BookRepository(), writers[:RUNS], book_ids, author_id)
+    sql = endpoints(SqlBookRepository(), writers[RUNS:], book_ids, author_id)
+    for label in orm:
+        results = [measure(orm[label]), measure(sql[label])]
+        print(f"{label:<22}" + "".join(f"{median:>9.2f} ({queries:.0f})"
+                                       for median, queries in results))
+
+
+if __name__ == "__main__":
+    main()
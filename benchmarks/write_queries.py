@@ -0,0 +1,107 @@
+"""
+Queries per write for add_to_favourite and create_review, and the outcome of
+firing the same write from many threads at once (exactly one must succeed,
+the rest must fail with AlreadyExistsException).
+
+    python -m benchmarks.write_queries
+"""
+from benchmarks import _django
+
+_django.setup()
+
+import threading  # noqa: E402
+
+from django.db import connection  # noqa: E402
+
+from books import models  # noqa: E402
+from books.dtos.book import BookReview, User  # noqa: E402
+from books.exceptions import AlreadyExistsException  # noqa: E402
+from books.repos.book import BookRepository  # noqa: E402
+from books.use_cases.books import add_to_favourite_use_case, create_review_use_case  # noqa: E402
+from users.models import CustomUser  # noqa: E402
+
+THREADS = 20
+
+
+def create_user(email: str) -> User:
+    user = CustomUser.objects.create_user(email=email, password="password")
+    return User(id=user.id, email=user.email)
+
+
+def add_to_favourite(user: User, book_id: int) -> None:
+    add_to_favourite_use_case(BookRepository(), user=user, book_id=book_id)
+
+
+def create_review(user: User, book_id: int) -> None:
+    create_review_use_case(BookRepository(),
+                           user=user,
+                           review=BookReview(book_id=book_id,
+                                             rating=5,
+                                             review="..."))
+
+
+def count_queries(write, user: User, book_id: int) -> tuple[int, str]:
+    counter = _django.QueryCounter()
+    with connection.execute_wrapper(counter):
+        try:
+            write(user, book_id)
+            outcome = "created"
+        except AlreadyExistsException:
+            outcome = "already exists"
+        except models.Book.DoesNotExist:
+            outcome = "not found"
+    return counter.count, outcome
+
+
+def race(write, user: User, book_id: int) -> dict[str, int]:
+    outcomes = {"created": 0, "already exists": 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(THREADS)
+
+    def worker():
+        barrier.wait()
+        try:
+            write(user, book_id)
+            outcome = "created"
+        except AlreadyExistsException:
+            outcome = "already exists"
+        finally:
+            connection.close()
+        with lock:
+            outcomes[outcome] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def main():
+    author = models.Author.objects.create(first_name="Лев",
+                                          last_name="Толстой")
+    category = models.Category.objects.create(name="classics")
+    book_ids = [
+        models.Book.objects.create(author=author,
+                                   category=category,
+                                   name=f"Книга {i}",
+                                   description="...").id for i in range(2)
+    ]
+
+    for name, write in (("add_to_favourite", add_to_favourite),
+                        ("create_review", create_review)):
+        user = create_user(f"{name}@example.com")
+        print(name)
+        for label, book_id in (("new", book_ids[0]),
+                               ("duplicate", book_ids[0]), ("missing book",
+                                                            0)):
+            queries, outcome = count_queries(write, user, book_id)
+            print(f"  {label:<13} {queries:>2} queries  ({outcome})")
+        print(
+            f"  {THREADS} parallel duplicates:",
+            race(write, create_user(f"race-{name}@example.com"), book_ids[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,67 @@
 from django.contrib import admin
+from django.db.models import Q
 
 from books import models
+from books_project.pagination import EstimatedCountPaginator
+
+
+class PrefixSearchMixin:
+    """
+    Looks the whole search term up in every search field, instead of each
+    word of it in some field as the admin does, so that names with spaces
+    can be searched by their beginning with the prefix lookup.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        query = Q()
+        for field in self.get_search_fields(request):
+            query |= Q(**{field: search_term})
+        return queryset.filter(query), False
 
 
 @admin.register(models.Book)
-class BookAdmin(admin.ModelAdmin):
-    pass
+class BookAdmin(PrefixSearchMixin, admin.ModelAdmin):
+    list_display = ("id", "name", "author", "category", "created_at")
+    list_select_related = ("author", "category")
+    list_filter = ("category", )
+    search_fields = ("name__prefix", )
+    search_help_text = "Начало названия, с учётом регистра"
+    autocomplete_fields = ("author", "category")
+    ordering = ("-id", )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(models.Category)
-class CategoryAdmin(admin.ModelAdmin):
-    pass
+class CategoryAdmin(PrefixSearchMixin, admin.ModelAdmin):
+    list_display = ("id", "name")
+    search_fields = ("name__prefix", )
+    search_help_text = "Начало названия, с учётом регистра"
+    ordering = ("name", )
 
 
 @admin.register(models.Author)
-class AuthorAdmin(admin.ModelAdmin):
-    pass
+class AuthorAdmin(PrefixSearchMixin, admin.ModelAdmin):
+    list_display = ("id", "last_name", "first_name", "created_at")
+    search_fields = ("last_name__prefix", "first_name__prefix")
+    search_help_text = "Начало фамилии или имени, с учётом регистра"
+    ordering = ("last_name", "first_name")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(models.BookReview)
-class BookReviewAdmin(admin.ModelAdmin):
-    pass
+class BookReviewAdmin(PrefixSearchMixin, admin.ModelAdmin):
+    list_display = ("id", "book", "user", "rating", "created_at")
+    list_select_related = ("book", "user")
+    list_filter = ("rating", )
+    search_fields = ("book__name__prefix", "user__email__prefix")
+    search_help_text = ("Начало названия книги или email пользователя, "
+                        "с учётом регистра")
+    raw_id_fields = ("book", "user")
+    ordering = ("-id", )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,177 @@
+"""
+OpenAPI annotations for the books API views.
+
+Kept apart from books.api.views so that drf-yasg is only imported when the
+documentation routes are enabled (see books_project.docs).
+"""
+from drf_yasg import openapi
+
+from books_project.docs import document
+from books.api import views
+from books.dtos.book import FACETS
+from books.api.serializers import BookBatchItemSerializer, ChangesSerializer, BookDetailSerializer, BookStatsSerializer, BookReviewCreateSerializer, BookSerializer, FavouriteCreateSerializer, ReviewPageSerializer, SuggestionSerializer
+
+document(views.get_book_list,
+         method="get",
+         description="Get the list of the books",
+         manual_parameters=[
+             openapi.Parameter("category",
+                               openapi.IN_QUERY,
+                               description="Filter by category",
+                               type=openapi.TYPE_ARRAY,
+                               items=openapi.Items(type=openapi.TYPE_STRING)),
+             openapi.Parameter("author",
+                               openapi.IN_QUERY,
+                               description="Filter by author",
+                               type=openapi.TYPE_ARRAY,
+                               items=openapi.Items(type=openapi.TYPE_INTEGER)),
+             openapi.Parameter(
+                 "created_before",
+                 openapi.IN_QUERY,
+                 description="Get books created before date. Format in Y-m-d",
+                 type=openapi.TYPE_STRING),
+             openapi.Parameter("created_after",
+                               openapi.IN_QUERY,
+                               description="Get books created before date",
+                               type=openapi.TYPE_STRING),
+             openapi.Parameter(
+                 "facets",
+                 openapi.IN_QUERY,
+                 description="Also count the filtered books per facet value. "
+                 "The response then becomes an object with `results` and "
+                 "`facets`",
+                 type=openapi.TYPE_ARRAY,
+                 items=openapi.Items(type=openapi.TYPE_STRING,
+                                     enum=list(FACETS))),
+         ],
+         responses={200: BookSerializer(many=True)})
+
+document(views.get_book_detail,
+         method="get",
+         description="Get Book detail",
+         responses={200: BookDetailSerializer()})
+
+document(views.get_book_reviews,
+         method="get",
+         description="Get the reviews of a book page by page, newest first, "
+         "archived reviews included. Pass `next` of a page as `before` to "
+         "get the following one",
+         manual_parameters=[
+             openapi.Parameter("before",
+                               openapi.IN_QUERY,
+                               description="Only reviews with a lower id",
+                               type=openapi.TYPE_INTEGER),
+             openapi.Parameter("limit",
+                               openapi.IN_QUERY,
+                               description="Reviews per page, 20 by default "
+                               "and at most 100",
+                               type=openapi.TYPE_INTEGER),
+         ],
+         responses={200: ReviewPageSerializer()})
+
+document(views.get_book_stats,
+         method="get",
+         description="Get rating histogram and review statistics of a book",
+         responses={200: BookStatsSerializer()})
+
+document(views.get_similar_books,
+         method="get",
+         description="Get books liked by the same readers",
+         responses={200: BookSerializer(many=True)})
+
+document(views.get_book_batch,
+         method="get",
+         description="Get details of several books in one request",
+         manual_parameters=[
+             openapi.Parameter("ids",
+                               openapi.IN_QUERY,
+                               description="Comma separated book ids",
+                               type=openapi.TYPE_ARRAY,
+                               items=openapi.Items(type=openapi.TYPE_INTEGER),
+                               required=True),
+         ],
+         responses={200: BookBatchItemSerializer(many=True)})
+
+document(views.get_book_feed,
+         method="get",
+         description="Get books recommended for the user from the authors "
+         "and categories of their favourites and reviews, and the rating",
+         manual_parameters=[
+             openapi.Parameter("limit",
+                               openapi.IN_QUERY,
+                               description="Number of books, 20 by default, "
+                               "at most 100",
+                               type=openapi.TYPE_INTEGER),
+         ],
+         responses={200: BookSerializer(many=True)})
+
+document(views.get_book_changes,
+         method="get",
+         description="Get books, reviews, rating statistics and favourites "
+         "changed or deleted since a sync token. Without `since` only the "
+         "current token is returned, take it before downloading the "
+         "catalogue. Repeat with the returned token while `has_more` is set. "
+         "Tokens older than the retained change log get 410: take a new "
+         "token and download the catalogue again",
+         manual_parameters=[
+             openapi.Parameter("since",
+                               openapi.IN_QUERY,
+                               description="Token of the previous sync",
+                               type=openapi.TYPE_STRING),
+         ],
+         responses={
+             200: ChangesSerializer(),
+             410: "Changes after the token were pruned"
+         })
+
+document(views.get_suggestions,
+         method="get",
+         description="Typeahead: books, authors and categories whose name "
+         "has a word starting with the prefix, best rated first",
+         manual_parameters=[
+             openapi.Parameter("prefix",
+                               openapi.IN_QUERY,
+                               description="Text typed so far, case "
+                               "insensitive",
+                               type=openapi.TYPE_STRING,
+                               required=True),
+             openapi.Parameter("limit",
+                               openapi.IN_QUERY,
+                               description="Number of suggestions, 10 by "
+                               "default and at most 20",
+                               type=openapi.TYPE_INTEGER),
+         ],
+         responses={200: SuggestionSerializer(many=True)})
+
+document(views.get_book_events,
+         method="get",
+         description="Stream new reviews (`review` events) and rating "
+         "statistics changes (`rating` events) of books as server-sent "
+         "events. The stream is closed after a few minutes or when the "
+         "client falls behind; reconnect and catch up with the changes "
+         "endpoint",
+         manual_parameters=[
+             openapi.Parameter("books",
+                               openapi.IN_QUERY,
+                               description="Comma separated book ids, at "
+                               "most 100",
+                               type=openapi.TYPE_ARRAY,
+                               items=openapi.Items(type=openapi.TYPE_INTEGER),
+                               required=True),
+         ],
+         responses={
+             200: "text/event-stream",
+             501: "Not served through ASGI"
+         })
+
+document(views.add_to_favourite,
+         method="post",
+         description="Add book to favourites",
+         responses={200: FavouriteCreateSerializer()},
+         request_body=FavouriteCreateSerializer())
+
+document(views.create_review,
+         method="post",
+         description="Create a review for a book",
+         responses={200: BookReviewCreateSerializer()},
+         request_body=BookReviewCreateSerializer())
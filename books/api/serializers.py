@@ -78,5 +78,125 @@ class BookDetailSerializer(serializers.Serializer):
         return cls(asdict(dto))
 
 
+class BookBatchItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    found = serializers.BooleanField()
+    book = BookDetailSerializer(allow_null=True)
+
+    @classmethod
+    def from_dto(
+            cls, book_id: int,
+            dto: book_dtos.BookDetail | None) -> 'BookBatchItemSerializer':
+        return cls({
+            "id": book_id,
+            "found": dto is not None,
+            "book": asdict(dto) if dto else None
+        })
+
+
+class BookStatsSerializer(serializers.Serializer):
+    book_id = serializers.IntegerField()
+    review_count = serializers.IntegerField()
+    average_rating = serializers.FloatField()
+    histogram = serializers.DictField(child=serializers.IntegerField())
+    recent_rating = serializers.FloatField()
+    trend = serializers.FloatField()
+    last_review_at = serializers.DateTimeField(allow_null=True)
+
+    @classmethod
+    def from_dto(cls, dto: book_dtos.BookStats) -> 'BookStatsSerializer':
+        return cls(asdict(dto))
+
+
+class FacetValueSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    count = serializers.IntegerField()
+
+
+class FacetsSerializer(serializers.Serializer):
+    category = FacetValueSerializer(many=True, required=False)
+    author = FacetValueSerializer(many=True, required=False)
+    rating_bucket = FacetValueSerializer(many=True, required=False)
+
+    @classmethod
+    def from_dto(cls, dto: book_dtos.Facets) -> 'FacetsSerializer':
+        return cls({
+            facet: [asdict(value) for value in values]
+            for facet, values in dto.items()
+        })
+
+
 class FavouriteCreateSerializer(serializers.Serializer):
     book_id = serializers.IntegerField()
+
+
+class ChangedBookSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    category = serializers.CharField()
+    author = AuthorSerializer()
+    average_rating = serializers.FloatField()
+    favourite = serializers.BooleanField()
+    description = serializers.CharField()
+    created_at = serializers.DateTimeField()
+    updated_at = serializers.DateTimeField()
+
+
+class ChangedReviewSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    book_id = serializers.IntegerField()
+    rating = serializers.IntegerField()
+    review = serializers.CharField()
+    created_at = serializers.DateTimeField()
+    updated_at = serializers.DateTimeField()
+
+
+class DeletedObjectsSerializer(serializers.Serializer):
+    books = serializers.ListField(child=serializers.IntegerField())
+    reviews = serializers.ListField(child=serializers.IntegerField())
+    stats = serializers.ListField(child=serializers.IntegerField())
+    favourites = serializers.ListField(child=serializers.IntegerField())
+
+
+class ChangesSerializer(serializers.Serializer):
+    token = serializers.CharField()
+    has_more = serializers.BooleanField()
+    books = ChangedBookSerializer(many=True)
+    reviews = ChangedReviewSerializer(many=True)
+    stats = BookStatsSerializer(many=True)
+    favourites = serializers.ListField(child=serializers.IntegerField())
+    deleted = DeletedObjectsSerializer()
+
+    @classmethod
+    def from_dto(cls, dto: book_dtos.ChangeSet) -> 'ChangesSerializer':
+        data = asdict(dto)
+        data["deleted"] = {
+            "books": data.pop("deleted_books"),
+            "reviews": data.pop("deleted_reviews"),
+            "stats": data.pop("deleted_stats"),
+            "favourites": data.pop("deleted_favourites"),
+        }
+        return cls(data)
+
+
+class ReviewPageSerializer(serializers.Serializer):
+    results = ChangedReviewSerializer(many=True)
+    next = serializers.IntegerField(allow_null=True)
+
+    @classmethod
+    def from_dto(cls, dto: book_dtos.ReviewPage) -> 'ReviewPageSerializer':
+        return cls({
+            "results": [asdict(review) for review in dto.reviews],
+            "next": dto.next
+        })
+
+
+class SuggestionSerializer(serializers.Serializer):
+    type = serializers.CharField()
+    id = serializers.IntegerField()
+    text = serializers.CharField()
+
+    @classmethod
+    def from_dto(cls, dto: book_dtos.Suggestion) -> 'SuggestionSerializer':
+        return cls(asdict(dto))
@@ -0,0 +1,32 @@
+from books_project.throttling import TokenBucketThrottle
+
+
+class BookListThrottle(TokenBucketThrottle):
+    scope = "books_read"
+    cost = 10
+
+
+class BookBatchThrottle(TokenBucketThrottle):
+    scope = "books_read"
+    cost = 5
+
+
+class BookFeedThrottle(TokenBucketThrottle):
+    scope = "books_read"
+    cost = 5
+
+
+class BookDetailThrottle(TokenBucketThrottle):
+    scope = "books_read"
+    cost = 1
+
+
+class BookSuggestThrottle(TokenBucketThrottle):
+    # One request per keystroke
+    scope = "books_read"
+    cost = 1
+
+
+class BookWriteThrottle(TokenBucketThrottle):
+    scope = "books_write"
+    cost = 1
@@ -3,7 +3,18 @@ from books.api import views
 
 urlpatterns = [
     path("", views.get_book_list, name="list-books"),
+    path("batch/", views.get_book_batch, name="book-batch"),
+    path("feed/", views.get_book_feed, name="book-feed"),
+    path("changes/", views.get_book_changes, name="book-changes"),
+    path("events/", views.get_book_events, name="book-events"),
+    path("suggest/", views.get_suggestions, name="book-suggest"),
     path("<int:book_id>/", views.get_book_detail, name="book-detail"),
+    path("<int:book_id>/stats/", views.get_book_stats, name="book-stats"),
+    path("<int:book_id>/reviews/", views.get_book_reviews,
+         name="book-reviews"),
+    path("<int:book_id>/similar/",
+         views.get_similar_books,
+         name="similar-books"),
     path("favourites/", views.add_to_favourite, name='add-favourite'),
     path("reviews/", views.create_review, name="create-review")
 ]
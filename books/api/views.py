@@ -1,56 +1,48 @@
+import asyncio
 import datetime
+import json
+import time
 
 from dataclasses import asdict
 
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models import ObjectDoesNotExist
+from django.http import StreamingHttpResponse
 from rest_framework.views import Request
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
-from books.exceptions import AlreadyExistsException
-
-from books.repos.book import BookRepository
-from books.api.serializers import BookDetailSerializer, BookReviewCreateSerializer, BookSerializer, FavouriteCreateSerializer
-from books.use_cases.books import add_to_favourite_use_case, get_book_use_case, list_books_use_case, create_review_use_case
-from books.dtos.book import BookReview
-
-
-@swagger_auto_schema(
-    method="get",
-    description="Get the list of the books",
-    manual_parameters=[
-        openapi.Parameter("category",
-                          openapi.IN_QUERY,
-                          description="Filter by category",
-                          type=openapi.TYPE_ARRAY,
-                          items=openapi.Items(type=openapi.TYPE_STRING)),
-        openapi.Parameter("author",
-                          openapi.IN_QUERY,
-                          description="Filter by author",
-                          type=openapi.TYPE_ARRAY,
-                          items=openapi.Items(type=openapi.TYPE_INTEGER)),
-        openapi.Parameter(
-            "created_before",
-            openapi.IN_QUERY,
-            description="Get books created before date. Format in Y-m-d",
-            type=openapi.TYPE_STRING),
-        openapi.Parameter("created_after",
-                          openapi.IN_QUERY,
-                          description="Get books created before date",
-                          type=openapi.TYPE_STRING),
-    ],
-    responses={200: BookSerializer(many=True)})
+from books.exceptions import AlreadyExistsException, ChangesExpiredException
+from books.api.throttles import BookBatchThrottle, BookDetailThrottle, BookFeedThrottle, BookListThrottle, BookSuggestThrottle, BookWriteThrottle
+
+from books.repos.book import get_book_repository
+from books.api.serializers import BookBatchItemSerializer, ChangedReviewSerializer, ChangesSerializer, BookDetailSerializer, BookStatsSerializer, FacetsSerializer, BookReviewCreateSerializer, BookSerializer, FavouriteCreateSerializer, ReviewPageSerializer, SuggestionSerializer
+from books.use_cases.books import add_to_favourite_use_case, count_facets_use_case, get_book_stats_use_case, get_change_token_use_case, get_changes_use_case, get_similar_books_use_case, get_book_use_case, get_book_reviews_use_case, get_books_use_case, get_feed_use_case, list_books_use_case, create_review_use_case, suggest_use_case
+from books.dtos.book import FACETS, BookReview
+from books.events import REVIEW_CREATED, Event, broker
+from books import suggest
+
+BATCH_MAX_BOOKS = 100
+FEED_DEFAULT_LIMIT = 20
+FEED_MAX_LIMIT = 100
+CHANGES_LIMIT = 1000
+SUGGEST_DEFAULT_LIMIT = 10
+REVIEWS_DEFAULT_LIMIT = 20
+REVIEWS_MAX_LIMIT = 100
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([BookListThrottle])
 def get_book_list(request: Request):
     category_param = request.GET.get("category")
     author_param = request.GET.get("author")
     created_before_param: str | None = request.GET.get("created_before")
     created_after_param: str | None = request.GET.get("created_after")
+    facets_param = request.GET.get("facets")
 
     authors: list[int] | None = None
     if author_param:
@@ -60,6 +52,12 @@ def get_book_list(request: Request):
     if category_param:
         categories = category_param.split(",")
 
+    facets: list[str] = []
+    if facets_param:
+        facets = facets_param.split(",")
+        if not set(facets) <= set(FACETS):
+            raise ValidationError(f"Допустимые фасеты: {', '.join(FACETS)}")
+
     created_before = None
     if created_before_param:
         created_before = datetime.datetime.strptime(created_before_param,
@@ -75,7 +73,7 @@ def get_book_list(request: Request):
         created_after = datetime.datetime.combine(created_after,
                                                   datetime.time.min)
 
-    repo = BookRepository()
+    repo = get_book_repository()
     books = list_books_use_case(repo=repo,
                                 user=request.user,
                                 categories=categories,
@@ -85,17 +83,28 @@ def get_book_list(request: Request):
     converted_books = [asdict(book) for book in books]
     serializer = BookSerializer(data=converted_books, many=True)
     serializer.is_valid(raise_exception=True)
-    return Response(data=serializer.data, status=status.HTTP_200_OK)
+    if not facets:
+        return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+    facet_counts = count_facets_use_case(repo=repo,
+                                         facets=facets,
+                                         categories=categories,
+                                         authors=authors,
+                                         created_before=created_before,
+                                         created_after=created_after)
+    data = {
+        "results": serializer.data,
+        "facets": FacetsSerializer.from_dto(facet_counts).data
+    }
+    return Response(data=data, status=status.HTTP_200_OK)
 
 
-@swagger_auto_schema(method="get",
-                     description="Get Book detail",
-                     responses={200: BookDetailSerializer()})
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([BookDetailThrottle])
 def get_book_detail(request: Request, book_id: int):
 
-    repo = BookRepository()
+    repo = get_book_repository()
     try:
         book = get_book_use_case(repo=repo, user=request.user, book_id=book_id)
     except ObjectDoesNotExist:
@@ -105,16 +114,166 @@ def get_book_detail(request: Request, book_id: int):
     return Response(data=serializer.data, status=status.HTTP_200_OK)
 
 
-@swagger_auto_schema(method="post",
-                     description="Add book to favourites",
-                     responses={200: FavouriteCreateSerializer()},
-                     request_body=FavouriteCreateSerializer())
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@throttle_classes([BookDetailThrottle])
+def get_book_stats(request: Request, book_id: int):
+    repo = get_book_repository()
+    try:
+        stats = get_book_stats_use_case(repo=repo, book_id=book_id)
+    except ObjectDoesNotExist:
+        raise ValidationError("Книга не найдена")
+
+    serializer = BookStatsSerializer.from_dto(stats)
+    return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@throttle_classes([BookDetailThrottle])
+def get_similar_books(request: Request, book_id: int):
+    repo = get_book_repository()
+    try:
+        books = get_similar_books_use_case(repo=repo,
+                                           user=request.user,
+                                           book_id=book_id)
+    except ObjectDoesNotExist:
+        raise ValidationError("Книга не найдена")
+
+    serializer = BookSerializer([asdict(book) for book in books], many=True)
+    return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@throttle_classes([BookDetailThrottle])
+def get_book_reviews(request: Request, book_id: int):
+    try:
+        limit = int(request.GET.get("limit", REVIEWS_DEFAULT_LIMIT))
+        before = request.GET.get("before")
+        if before is not None:
+            before = int(before)
+    except ValueError:
+        raise ValidationError("Некорректные параметры страницы")
+    if not 1 <= limit <= REVIEWS_MAX_LIMIT:
+        raise ValidationError(f"Лимит должен быть от 1 до {REVIEWS_MAX_LIMIT}")
+
+    repo = get_book_repository()
+    try:
+        page = get_book_reviews_use_case(repo=repo,
+                                         book_id=book_id,
+                                         before=before,
+                                         limit=limit)
+    except ObjectDoesNotExist:
+        raise ValidationError("Книга не найдена")
+
+    serializer = ReviewPageSerializer.from_dto(page)
+    return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@throttle_classes([BookBatchThrottle])
+def get_book_batch(request: Request):
+    ids_param = request.GET.get("ids", "")
+    try:
+        book_ids = [
+            int(book_id) for book_id in ids_param.split(",") if book_id
+        ]
+    except ValueError:
+        raise ValidationError("Некорректный список книг")
+    if not book_ids:
+        raise ValidationError("Не указаны книги")
+    if len(book_ids) > BATCH_MAX_BOOKS:
+        raise ValidationError(f"Не больше {BATCH_MAX_BOOKS} книг за запрос")
+
+    repo = get_book_repository()
+    books = get_books_use_case(repo=repo, user=request.user, book_ids=book_ids)
+    data = [
+        BookBatchItemSerializer.from_dto(book_id, book).data
+        for book_id, book in zip(book_ids, books)
+    ]
+    return Response(data=data, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@throttle_classes([BookFeedThrottle])
+def get_book_feed(request: Request):
+    try:
+        limit = int(request.GET.get("limit", FEED_DEFAULT_LIMIT))
+    except ValueError:
+        raise ValidationError("Некорректный лимит")
+    if not 1 <= limit <= FEED_MAX_LIMIT:
+        raise ValidationError(f"Лимит должен быть от 1 до {FEED_MAX_LIMIT}")
+
+    repo = get_book_repository()
+    books = get_feed_use_case(repo=repo, user=request.user, limit=limit)
+    serializer = BookSerializer([asdict(book) for book in books], many=True)
+    return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@throttle_classes([BookSuggestThrottle])
+def get_suggestions(request: Request):
+    prefix = request.GET.get("prefix", "")
+    if not prefix.strip():
+        raise ValidationError("Не указан префикс")
+    try:
+        limit = int(request.GET.get("limit", SUGGEST_DEFAULT_LIMIT))
+    except ValueError:
+        raise ValidationError("Некорректный лимит")
+    if not 1 <= limit <= suggest.MAX_LIMIT:
+        raise ValidationError(f"Лимит должен быть от 1 до {suggest.MAX_LIMIT}")
+
+    repo = get_book_repository()
+    suggestions = suggest_use_case(repo=repo, prefix=prefix, limit=limit)
+    data = [
+        SuggestionSerializer.from_dto(suggestion).data
+        for suggestion in suggestions
+    ]
+    return Response(data=data, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@throttle_classes([BookBatchThrottle])
+def get_book_changes(request: Request):
+    repo = get_book_repository()
+    since_param = request.GET.get("since")
+    if since_param is None:
+        # A client starting from scratch takes the token first, then
+        # downloads the catalogue and syncs from the token.
+        return Response(data={"token": get_change_token_use_case(repo=repo)},
+                        status=status.HTTP_200_OK)
+    try:
+        since = int(since_param)
+    except ValueError:
+        raise ValidationError("Некорректный токен")
+    if since < 0:
+        raise ValidationError("Некорректный токен")
+
+    try:
+        changes = get_changes_use_case(repo=repo,
+                                       user=request.user,
+                                       since=since,
+                                       limit=CHANGES_LIMIT)
+    except ChangesExpiredException as e:
+        # The client takes a new token and downloads the catalogue again.
+        return Response(data={"detail": e.message},
+                        status=status.HTTP_410_GONE)
+    return Response(data=ChangesSerializer.from_dto(changes).data,
+                    status=status.HTTP_200_OK)
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([BookWriteThrottle])
 def add_to_favourite(request: Request):
     data = FavouriteCreateSerializer(data=request.data)
     data.is_valid(raise_exception=True)
-    repo = BookRepository()
+    repo = get_book_repository()
     try:
         add_to_favourite_use_case(repo=repo,
                                   user=request.user,
@@ -127,16 +286,13 @@ def add_to_favourite(request: Request):
     return Response(data=data.data, status=status.HTTP_200_OK)
 
 
-@swagger_auto_schema(method="post",
-                     description="Create a review for a book",
-                     responses={200: BookReviewCreateSerializer()},
-                     request_body=BookReviewCreateSerializer())
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([BookWriteThrottle])
 def create_review(request: Request):
     data = BookReviewCreateSerializer(data=request.data)
     data.is_valid(raise_exception=True)
-    repo = BookRepository()
+    repo = get_book_repository()
     review = BookReview(book_id=data.validated_data["book_id"],
                         rating=data.validated_data["rating"],
                         review=data.validated_data["review"])
@@ -148,3 +304,63 @@ def create_review(request: Request):
         raise ValidationError("Книга не найдена")
 
     return Response(data=data.data, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@throttle_classes([BookBatchThrottle])
+def get_book_events(request: Request):
+    if not isinstance(request._request, ASGIRequest):
+        # A WSGI server buffers the stream and holds a worker thread for
+        # each subscriber until the stream closes.
+        return Response(data={"detail": "События доступны только через ASGI"},
+                        status=status.HTTP_501_NOT_IMPLEMENTED)
+    books_param = request.GET.get("books", "")
+    try:
+        book_ids = {
+            int(book_id)
+            for book_id in books_param.split(",") if book_id
+        }
+    except ValueError:
+        raise ValidationError("Некорректный список книг")
+    if not book_ids:
+        raise ValidationError("Не указаны книги")
+    if len(book_ids) > BATCH_MAX_BOOKS:
+        raise ValidationError(f"Не больше {BATCH_MAX_BOOKS} книг за запрос")
+
+    response = StreamingHttpResponse(_event_stream(book_ids),
+                                     content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def _event_stream(book_ids: set[int]):
+    # Subscribed on the server loop, which the view does not run on.
+    subscription = broker.subscribe(book_ids)
+    closes_at = time.monotonic() + settings.BOOKS_EVENTS_MAX_AGE
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            remaining = closes_at - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = await subscription.get(
+                    min(settings.BOOKS_EVENTS_KEEPALIVE, remaining))
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                return
+            yield _format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def _format_event(event: Event) -> str:
+    if event.type == REVIEW_CREATED:
+        data = ChangedReviewSerializer(asdict(event.data)).data
+    else:
+        data = BookStatsSerializer.from_dto(event.data).data
+    return f"event: {event.type}\ndata: {json.dumps(data)}\n\n"
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BooksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "books"
+
+    def ready(self):
+        from books import backfills, handlers, signals  # noqa: F401
+        from books_project import lookups  # noqa: F401
@@ -0,0 +1,193 @@
+"""
+Online backfills of large tables, driven by `manage.py backfill`.
+
+A backfill is a function registered under a name with the model it walks.
+`run` calls it with querysets of consecutive primary key ranges of
+`chunk_size` rows, each in its own transaction, so locks are held on one
+chunk at a time and writers are never blocked for the whole table. The
+last primary key done is saved in the backfills table in the same
+transaction as the chunk, so a stopped run resumes after it. Between
+chunks it sleeps, to keep to `max_rows_per_second` or at least `pause`,
+and leaves room to the site and to replicas.
+
+A run walks the primary keys up to the largest one found when it started.
+Rows written after that are the application's job: schema changes go in
+three deployments,
+
+    1. a migration adds the column nullable or with a default, and the
+       code fills it on every write
+    2. `manage.py backfill <name>` fills the existing rows
+    3. a migration adds the constraints, the code starts reading it
+
+Backfills must be idempotent: a chunk interrupted before its commit runs
+again on resume.
+"""
+import dataclasses
+import time
+from typing import Callable
+
+from django.db import models as db_models
+from django.db import transaction
+from django.db.models import Max, QuerySet
+from django.utils import timezone
+
+from books import models
+
+Backfill = Callable[[QuerySet], None]
+
+
+@dataclasses.dataclass(frozen=True)
+class Registered:
+    name: str
+    model: type[db_models.Model]
+    fn: Backfill
+    description: str
+
+
+@dataclasses.dataclass
+class Progress:
+    name: str
+    last_pk: int
+    end_pk: int
+    # Rows done since the backfill was started, across resumes
+    rows: int
+    # Rows done and seconds spent by this run
+    run_rows: int
+    elapsed: float
+    finished: bool
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.run_rows / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def percent(self) -> float:
+        # Of the primary key range, rows are not evenly spread over it
+        if self.finished or not self.end_pk:
+            return 100.0
+        return min(100.0, self.last_pk / self.end_pk * 100)
+
+
+_backfills: dict[str, Registered] = {}
+
+
+def register(name: str,
+             model: type[db_models.Model]) -> Callable[[Backfill], Backfill]:
+    """
+    Registers a function called with a queryset of `model` restricted to
+    a chunk of primary keys, to fill in the rows of the chunk.
+    """
+
+    def add(fn: Backfill) -> Backfill:
+        if name in _backfills:
+            raise ValueError(f"Backfill {name} is already registered")
+        _backfills[name] = Registered(name=name,
+                                      model=model,
+                                      fn=fn,
+                                      description=(fn.__doc__ or "").strip())
+        return fn
+
+    return add
+
+
+def registered() -> list[Registered]:
+    return sorted(_backfills.values(), key=lambda item: item.name)
+
+
+def get(name: str) -> Registered:
+    try:
+        return _backfills[name]
+    except KeyError:
+        raise LookupError(f"Unknown backfill {name}") from None
+
+
+def reset(name: str) -> None:
+    """
+    Forgets the checkpoint, the next run starts over from the first row.
+    """
+    get(name)
+    models.BackfillCheckpoint.objects.filter(name=name).delete()
+
+
+def run(name: str,
+        chunk_size: int = 1000,
+        max_rows_per_second: float | None = None,
+        pause: float = 0.0,
+        max_chunks: int | None = None,
+        report: Callable[[Progress], None] | None = None) -> Progress:
+    """
+    Runs or resumes the backfill until it is done, or for `max_chunks`
+    chunks. `report` is called after every chunk.
+    """
+    item = get(name)
+    checkpoint = _start(item)
+    started_at = time.perf_counter()
+    run_rows = 0
+    chunks = 0
+    while checkpoint.finished_at is None:
+        if max_chunks is not None and chunks >= max_chunks:
+            break
+        chunk_started_at = time.perf_counter()
+        checkpoint, done = _run_chunk(item, chunk_size)
+        run_rows += done
+        chunks += 1
+        if report is not None:
+            report(_progress(checkpoint, run_rows, started_at))
+        if checkpoint.finished_at is None:
+            time.sleep(
+                _delay(done,
+                       time.perf_counter() - chunk_started_at,
+                       max_rows_per_second, pause))
+    return _progress(checkpoint, run_rows, started_at)
+
+
+def _start(item: Registered) -> models.BackfillCheckpoint:
+    end_pk = item.model._default_manager.aggregate(end=Max("pk"))["end"]
+    checkpoint, _ = models.BackfillCheckpoint.objects.get_or_create(
+        name=item.name, defaults={"end_pk": end_pk or 0})
+    return checkpoint
+
+
+def _run_chunk(item: Registered,
+               chunk_size: int) -> tuple[models.BackfillCheckpoint, int]:
+    with transaction.atomic():
+        # Read under lock, so concurrent runs of a backfill take turns
+        # instead of doing the same chunk.
+        checkpoint = models.BackfillCheckpoint.objects.select_for_update().get(
+            name=item.name)
+        if checkpoint.finished_at is not None:
+            return checkpoint, 0
+        rows = item.model._default_manager.filter(
+            pk__gt=checkpoint.last_pk,
+            pk__lte=checkpoint.end_pk).order_by("pk")
+        # Only the primary keys of the chunk are read, from the index,
+        # gaps in the keys do not make chunks smaller.
+        pks = list(rows.values_list("pk", flat=True)[:chunk_size])
+        if pks:
+            item.fn(
+                item.model._default_manager.filter(pk__gt=checkpoint.last_pk,
+                                                   pk__lte=pks[-1]))
+            checkpoint.last_pk = pks[-1]
+            checkpoint.rows += len(pks)
+        if len(pks) < chunk_size or checkpoint.last_pk >= checkpoint.end_pk:
+            checkpoint.finished_at = timezone.now()
+        checkpoint.save()
+    return checkpoint, len(pks)
+
+
+def _progress(checkpoint: models.BackfillCheckpoint, run_rows: int,
+              started_at: float) -> Progress:
+    return Progress(name=checkpoint.name,
+                    last_pk=checkpoint.last_pk,
+                    end_pk=checkpoint.end_pk,
+                    rows=checkpoint.rows,
+                    run_rows=run_rows,
+                    elapsed=time.perf_counter() - started_at,
+                    finished=checkpoint.finished_at is not None)
+
+
+def _delay(rows: int, spent: float, max_rows_per_second: float | None,
+           pause: float) -> float:
+    if not max_rows_per_second:
+        return pause
+    return max(pause, rows / max_rows_per_second - spent)
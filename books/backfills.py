@@ -0,0 +1,14 @@
+from django.db.models import QuerySet
+
+from books import backfill, models
+from books.repos.book import BookRepository
+
+
+@backfill.register("book_listing", models.Book)
+def fill_book_listing(books: QuerySet[models.Book]) -> None:
+    """
+    Rewrites the book_listing rows from the normalized tables, without
+    the table-wide batches of rebuild_book_listing.
+    """
+    BookRepository().refresh_book_listings(
+        list(books.values_list("id", flat=True)))
@@ -0,0 +1,154 @@
+import threading
+import time
+from typing import Callable, Hashable, TypeVar
+
+from django.core.cache import cache
+from django.db import transaction
+
+from books.caches.versions import bump_version, get_version
+from books.dtos import book as book_dtos
+
+T = TypeVar("T")
+DetailLoader = Callable[[], book_dtos.BookDetail]
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one. The first caller
+    runs the function, the others wait for it and share its result or
+    exception.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class BookDetailCache:
+    """
+    Shared cache of user independent book details with stale-while-revalidate.
+
+    Entries are fresh for `fresh_timeout` seconds and then served stale for
+    up to `stale_timeout` more while a single worker, holding a lease in the
+    shared cache, reloads them. On a cold miss the workers that did not get
+    the lease poll for the leader's result instead of querying the database.
+    Inside a process identical lookups are coalesced by SingleFlight.
+
+    Invalidations drop the entry once their transaction commits and move a
+    per-book generation on. A load that started before is returned to its
+    caller but not stored, so it cannot bring the old detail back.
+    """
+
+    fresh_timeout = 60
+    stale_timeout = 60 * 10
+    lease_timeout = 10
+    poll_interval = 0.02
+
+    def __init__(self):
+        self._flight = SingleFlight()
+
+    @staticmethod
+    def _key(book_id: int) -> str:
+        return f"books:detail:{book_id}"
+
+    @staticmethod
+    def _lease_key(book_id: int) -> str:
+        return f"books:detail:{book_id}:lease"
+
+    @staticmethod
+    def _generation_key(book_id: int) -> str:
+        return f"books:detail:{book_id}:generation"
+
+    def get_or_load(self, book_id: int,
+                    loader: DetailLoader) -> book_dtos.BookDetail:
+        return self._flight.do(book_id,
+                               lambda: self._get_or_load(book_id, loader))
+
+    def refresh(self, book_id: int, loader: DetailLoader) -> None:
+        """
+        Reloads an entry ahead of readers. Skipped when another worker is
+        already loading it.
+        """
+        if self._acquire_lease(book_id):
+            self._load(book_id, loader)
+
+    def invalidate(self, book_id: int) -> None:
+        transaction.on_commit(lambda: self._invalidate(book_id))
+
+    def _invalidate(self, book_id: int) -> None:
+        bump_version(self._generation_key(book_id),
+                     self.fresh_timeout + self.stale_timeout)
+        cache.delete(self._key(book_id))
+
+    def _get_or_load(self, book_id: int,
+                     loader: DetailLoader) -> book_dtos.BookDetail:
+        entry = cache.get(self._key(book_id))
+        if entry is not None:
+            fresh_until, detail = entry
+            if fresh_until > time.time() or not self._acquire_lease(book_id):
+                return detail
+            return self._load(book_id, loader)
+
+        deadline = time.monotonic() + self.lease_timeout
+        while not self._acquire_lease(book_id):
+            if time.monotonic() >= deadline:
+                return loader()
+            time.sleep(self.poll_interval)
+            entry = cache.get(self._key(book_id))
+            if entry is not None:
+                return entry[1]
+        return self._load(book_id, loader)
+
+    def _acquire_lease(self, book_id: int) -> bool:
+        return cache.add(self._lease_key(book_id), 1, self.lease_timeout)
+
+    def _load(self, book_id: int,
+              loader: DetailLoader) -> book_dtos.BookDetail:
+        generation_key = self._generation_key(book_id)
+        generation = get_version(generation_key,
+                                 self.fresh_timeout + self.stale_timeout)
+        try:
+            detail = loader()
+            if cache.get(generation_key) == generation:
+                cache.set(self._key(book_id),
+                          (time.time() + self.fresh_timeout, detail),
+                          self.fresh_timeout + self.stale_timeout)
+        finally:
+            cache.delete(self._lease_key(book_id))
+        return detail
+
+
+book_detail_cache = BookDetailCache()
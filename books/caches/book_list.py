@@ -0,0 +1,75 @@
+import datetime
+import hashlib
+import json
+from typing import Callable
+
+from django.core.cache import cache
+from django.db import transaction
+
+from books.caches.book_detail import SingleFlight
+from books.caches.versions import bump_version, get_version
+from books.dtos import book as book_dtos
+
+ListLoader = Callable[[], list[book_dtos.BookInfo]]
+
+
+def canonical_filters(created_before: datetime.datetime | None,
+                      created_after: datetime.datetime | None,
+                      authors: list[int] | None,
+                      categories: list[str] | None) -> str:
+    """
+    Spells list filters the same way whatever the order, duplicates and
+    time of day they were given with. Dates are bucketed by day, the
+    granularity of the list API.
+    """
+    return json.dumps([
+        sorted(set(authors or [])),
+        sorted(set(categories or [])),
+        created_after.date().isoformat() if created_after else None,
+        created_before.date().isoformat() if created_before else None,
+    ])
+
+
+class BookListCache:
+    """
+    Shared cache of user independent book lists per filter combination.
+
+    Keys embed a global catalogue version, which a change of any book,
+    author, category or review bumps (see books.signals). A write makes
+    every cached list unreachable at once without looking them up, and
+    the orphaned entries expire after `timeout`.
+    """
+
+    version_key = "books:list:version"
+    timeout = 60 * 10
+
+    def __init__(self):
+        self._flight = SingleFlight()
+
+    @staticmethod
+    def _key(version: int, filters: str) -> str:
+        digest = hashlib.sha1(filters.encode()).hexdigest()
+        return f"books:list:{version}:{digest}"
+
+    def get_or_load(self, filters: str,
+                    loader: ListLoader) -> list[book_dtos.BookInfo]:
+        key = self._key(get_version(self.version_key), filters)
+        books = cache.get(key)
+        if books is None:
+            books = self._flight.do(key, lambda: self._load(key, loader))
+        return books
+
+    def invalidate(self) -> None:
+        # After commit, or a reader could cache the old rows under the new
+        # version.
+        transaction.on_commit(lambda: bump_version(self.version_key))
+
+    def _load(self, key: str, loader: ListLoader) -> list[book_dtos.BookInfo]:
+        books = cache.get(key)
+        if books is None:
+            books = loader()
+            cache.set(key, books, self.timeout)
+        return books
+
+
+book_list_cache = BookListCache()
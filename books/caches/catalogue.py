@@ -0,0 +1,106 @@
+import threading
+import time
+from typing import Callable
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+
+from books.caches.versions import bump_version, get_version
+from books.catalogue import Catalogue
+
+# Loads the rows of the given book ids, or of every book when None.
+CatalogueLoader = Callable[[list[int] | None], Catalogue]
+
+
+class CatalogueCache:
+    """
+    In-process copy of the catalogue columns, used to score the feed and to
+    filter the book list.
+
+    Every change of a book (see books.signals and books.handlers) bumps the
+    shared version counter and stores the book id under the new version.
+    A reader behind by a few versions reloads only the rows of those books
+    and patches its copy (see Catalogue.patch). When the gap is too large,
+    a change is missing from the shared cache or the copy is older than
+    `max_age`, the whole catalogue is reloaded.
+    """
+
+    version_key = "books:catalogue:version"
+    change_timeout = 60 * 60
+    max_changes = 1000
+    max_age = 60 * 60
+
+    def __init__(self):
+        self._catalogue: Catalogue | None = None
+        self._version: int | None = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _change_key(version: int) -> str:
+        return f"books:catalogue:change:{version}"
+
+    def get(self, loader: CatalogueLoader) -> Catalogue:
+        version = get_version(self.version_key)
+        if self._version == version and not self._expired():
+            return self._catalogue
+        # While one thread refreshes, the others keep reading the previous
+        # copy. Only the very first load is waited for.
+        if not self._lock.acquire(blocking=self._catalogue is None):
+            return self._catalogue
+        try:
+            if self._version == version and not self._expired():
+                return self._catalogue
+            changed = self._changes_since(version)
+            if changed is None:
+                self._catalogue = loader(None)
+                self._loaded_at = time.monotonic()
+            elif changed:
+                self._catalogue = self._catalogue.patch(
+                    np.array(changed, dtype=np.int64), loader(changed))
+            self._version = version
+            return self._catalogue
+        finally:
+            self._lock.release()
+
+    def record_change(self, book_id: int) -> None:
+        """
+        Publishes the change once the current transaction commits, so
+        readers never patch in rows they cannot see yet.
+        """
+        transaction.on_commit(lambda: self._publish(book_id))
+
+    def _publish(self, book_id: int) -> None:
+        version = bump_version(self.version_key)
+        cache.set(self._change_key(version),
+                  book_id,
+                  timeout=self.change_timeout)
+
+    def invalidate(self) -> None:
+        """Makes every reader reload the whole catalogue."""
+        bump_version(self.version_key)
+
+    def _expired(self) -> bool:
+        return time.monotonic() - self._loaded_at >= self.max_age
+
+    def _changes_since(self, version: int) -> list[int] | None:
+        """
+        Returns the ids of the books changed between the local copy and
+        `version`, or None when the copy has to be reloaded whole.
+        """
+        if self._catalogue is None or self._expired():
+            return None
+        if not 0 <= version - self._version <= self.max_changes:
+            return None
+        keys = [
+            self._change_key(changed)
+            for changed in range(self._version + 1, version + 1)
+        ]
+        changes = cache.get_many(keys)
+        if len(changes) < len(keys):
+            return None
+        return sorted(set(changes.values()))
+
+
+catalogue_cache = CatalogueCache()
@@ -0,0 +1,147 @@
+import array
+import bisect
+import collections
+import threading
+from typing import Iterable
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+from books.caches.versions import bump_version, get_version
+
+User = get_user_model()
+
+
+class FavouritesSet:
+    """
+    Compact membership structure over the book ids favourited by one user.
+    Ids are kept in a sorted int64 array, so a lookup is a binary search.
+    """
+
+    __slots__ = ("_ids", )
+
+    def __init__(self, book_ids: Iterable[int] = ()):
+        self._ids = array.array("q", sorted(set(book_ids)))
+
+    def __contains__(self, book_id: int) -> bool:
+        index = bisect.bisect_left(self._ids, book_id)
+        return index < len(self._ids) and self._ids[index] == book_id
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def with_added(self, book_id: int) -> "FavouritesSet":
+        if book_id in self:
+            return self
+        updated = FavouritesSet()
+        updated._ids = array.array("q", self._ids)
+        updated._ids.insert(bisect.bisect_left(self._ids, book_id), book_id)
+        return updated
+
+    def to_bytes(self) -> bytes:
+        return self._ids.tobytes()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "FavouritesSet":
+        favourites = cls()
+        favourites._ids.frombytes(payload)
+        return favourites
+
+
+class FavouritesCache:
+    """
+    Two level cache of FavouritesSet per user.
+
+    The shared cache holds a version number and the serialized set for that
+    version. The in-process level keeps the deserialized set and is reused
+    while the shared version stays the same, so a warm lookup costs one
+    small cache read and no database query.
+
+    Readers take the version before loading the set from the database and
+    store the set under that version. Writers move the version on after
+    their commit, so a set loaded before a write can only be stored under
+    a version readers have already left.
+    """
+
+    timeout = 60 * 60 * 24
+    max_local_entries = 10_000
+
+    def __init__(self):
+        self._local: collections.OrderedDict[int, tuple[
+            int, FavouritesSet]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version_key(user_id: int) -> str:
+        return f"books:favourites:{user_id}:version"
+
+    @staticmethod
+    def _data_key(user_id: int, version: int) -> str:
+        return f"books:favourites:{user_id}:{version}"
+
+    def get(self, user_id: int) -> FavouritesSet:
+        version = get_version(self._version_key(user_id), self.timeout)
+        return self._get(user_id, version)
+
+    def add(self, user_id: int, book_id: int) -> None:
+        """
+        Adds a favourite to the cached set once the current transaction
+        commits.
+        """
+        transaction.on_commit(lambda: self._add(user_id, book_id))
+
+    def invalidate(self, user_id: int) -> None:
+        bump_version(self._version_key(user_id), self.timeout)
+        with self._lock:
+            self._local.pop(user_id, None)
+
+    def _get(self, user_id: int, version: int) -> FavouritesSet:
+        with self._lock:
+            local = self._local.get(user_id)
+            if local and local[0] == version:
+                self._local.move_to_end(user_id)
+                return local[1]
+        payload = cache.get(self._data_key(user_id, version))
+        if payload is not None:
+            favourites = FavouritesSet.from_bytes(payload)
+        else:
+            favourites = FavouritesSet(
+                User.favourites.through.objects.filter(
+                    customuser_id=user_id).values_list("book_id", flat=True))
+            cache.add(self._data_key(user_id, version), favourites.to_bytes(),
+                      self.timeout)
+        self._remember(user_id, version, favourites)
+        return favourites
+
+    def _add(self, user_id: int, book_id: int) -> None:
+        version_key = self._version_key(user_id)
+        base_version = cache.get(version_key)
+        if base_version is None:
+            # Nothing to update, but a reader may be loading the set from
+            # before the write: the new version leaves it behind.
+            bump_version(version_key, self.timeout)
+            return
+        favourites = self._get(user_id, base_version).with_added(book_id)
+        version = bump_version(version_key, self.timeout)
+        if version != base_version + 1:
+            # Concurrent update from another worker, the next read loads
+            # the set of the new version from the database.
+            return
+        cache.set(self._data_key(user_id, version), favourites.to_bytes(),
+                  self.timeout)
+        self._remember(user_id, version, favourites)
+
+    def _remember(self, user_id: int, version: int,
+                  favourites: FavouritesSet) -> None:
+        with self._lock:
+            self._local[user_id] = (version, favourites)
+            self._local.move_to_end(user_id)
+            while len(self._local) > self.max_local_entries:
+                self._local.popitem(last=False)
+
+
+favourites_cache = FavouritesCache()
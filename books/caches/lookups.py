@@ -0,0 +1,110 @@
+import dataclasses
+import threading
+
+from django.db import transaction
+
+from books.caches.versions import bump_version, get_version
+from books.dtos import book as book_dtos
+from books import models
+
+
+class Lookups:
+    """
+    Categories and authors as of one version of the tables. Ids created
+    since are loaded on first use.
+    """
+
+    def __init__(self, cache: "LookupCache",
+                 categories: dict[int, book_dtos.Category],
+                 authors: dict[int, book_dtos.Author]):
+        self._cache = cache
+        self._categories = categories
+        self._category_ids = {
+            category.name: category_id
+            for category_id, category in categories.items()
+        }
+        self._authors = authors
+
+    def category_ids(self, names: list[str]) -> list[int]:
+        return [
+            self._category_ids[name] for name in dict.fromkeys(names)
+            if name in self._category_ids
+        ]
+
+    def category(self, category_id: int) -> book_dtos.Category:
+        categories = self._categories
+        if category_id not in categories:
+            categories = self._cache.snapshot(force=True)._categories
+        return categories[category_id]
+
+    def author(self, author_id: int) -> book_dtos.Author:
+        authors = self._authors
+        if author_id not in authors:
+            authors = self._cache.snapshot(force=True)._authors
+        return dataclasses.replace(authors[author_id])
+
+
+class LookupCache:
+    """
+    In-process dictionaries of categories and authors.
+
+    Both tables are small and rarely change, so they are loaded whole and
+    reused until the shared version counter moves. Saving or deleting a
+    category or an author bumps the counter once its transaction commits
+    (see books.signals).
+
+    Every version check is a shared cache read: code mapping many rows
+    takes a snapshot once and reads the names from it.
+    """
+
+    version_key = "books:lookups:version"
+
+    def __init__(self):
+        self._version: int | None = None
+        self._lookups = Lookups(self, categories={}, authors={})
+        self._lock = threading.Lock()
+
+    def snapshot(self, force: bool = False) -> Lookups:
+        version = get_version(self.version_key)
+        if not force and version == self._version:
+            return self._lookups
+        with self._lock:
+            if not force and version == self._version:
+                return self._lookups
+            categories = {
+                category.id: book_dtos.Category(id=category.id,
+                                                name=category.name)
+                for category in models.Category.objects.all()
+            }
+            authors = {
+                author.id:
+                book_dtos.Author(author_id=author.id,
+                                 first_name=author.first_name,
+                                 last_name=author.last_name,
+                                 created_at=author.created_at)
+                for author in models.Author.objects.all()
+            }
+            self._lookups = Lookups(self,
+                                    categories=categories,
+                                    authors=authors)
+            self._version = version
+            return self._lookups
+
+    def category_ids(self, names: list[str]) -> list[int]:
+        return self.snapshot().category_ids(names)
+
+    def category(self, category_id: int) -> book_dtos.Category:
+        return self.snapshot().category(category_id)
+
+    def author(self, author_id: int) -> book_dtos.Author:
+        return self.snapshot().author(author_id)
+
+    def invalidate(self) -> None:
+        """
+        Bumps the version once the current transaction commits, so no
+        reader reloads the tables before the change is visible.
+        """
+        transaction.on_commit(lambda: bump_version(self.version_key))
+
+
+lookups_cache = LookupCache()
@@ -0,0 +1,14 @@
+from books.caches.catalogue import CatalogueCache
+
+
+class SuggestCache(CatalogueCache):
+    """
+    In-process typeahead index, see books.suggest.
+
+    Follows the change stream of the catalogue cache, which covers every
+    change of a book name, author, category or rating: readers patch in the
+    books changed since their copy, or rebuild it whole like the catalogue.
+    """
+
+
+suggest_cache = SuggestCache()
@@ -0,0 +1,29 @@
+import time
+
+from django.core.cache import cache
+
+
+def _initial_version() -> int:
+    # Counters start from the current time, so a counter evicted from the
+    # shared cache never comes back with a value an old reader has seen.
+    return time.time_ns() // 1000
+
+
+def get_version(key: str, timeout: int | None = None) -> int:
+    """
+    Returns the current value of a version counter kept in the shared
+    cache, initialising it when it is missing.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=timeout)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key: str, timeout: int | None = None) -> int:
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=timeout)
+        return cache.get(key)
@@ -0,0 +1,281 @@
+"""
+Columnar copy of the catalogue.
+
+Every book is a row across parallel NumPy arrays sorted by book id. Permutations
+of the rows by creation time, by author and by category serve as indexes:
+the most selective filter is answered with a binary search, the others are
+boolean masks over the candidate rows, and the matching ids are then
+hydrated from the database.
+"""
+import dataclasses
+import datetime
+
+import numpy as np
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+COLUMNS = ("book_ids", "author_ids", "category_ids", "ratings", "created_at")
+
+# (column, rows in column order, column in that order)
+INDEXES = (
+    ("created_at", "created_order", "created_sorted"),
+    ("author_ids", "author_order", "author_sorted"),
+    ("category_ids", "category_order", "category_sorted"),
+)
+
+
+def to_timestamp(value: datetime.datetime) -> int:
+    """Microseconds since the epoch, the unit of Catalogue.created_at."""
+    return (value - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+@dataclasses.dataclass(frozen=True)
+class Catalogue:
+    """
+    Columns of the whole catalogue aligned by row, rows sorted by book id.
+    `created_order` lists the rows by `created_at` and `created_sorted` is
+    `created_at` in that order, the `author_` and `category_` pairs do the
+    same for their columns.
+    """
+    book_ids: np.ndarray
+    author_ids: np.ndarray
+    category_ids: np.ndarray
+    ratings: np.ndarray
+    created_at: np.ndarray
+    created_order: np.ndarray
+    created_sorted: np.ndarray
+    author_order: np.ndarray
+    author_sorted: np.ndarray
+    category_order: np.ndarray
+    category_sorted: np.ndarray
+
+    @classmethod
+    def from_columns(cls, book_ids: np.ndarray, author_ids: np.ndarray,
+                     category_ids: np.ndarray, ratings: np.ndarray,
+                     created_at: np.ndarray) -> "Catalogue":
+        by_id = np.argsort(book_ids, kind="stable")
+        author_ids = author_ids[by_id]
+        category_ids = category_ids[by_id]
+        created_at = created_at[by_id]
+        created_order = np.argsort(created_at, kind="stable")
+        author_order = np.argsort(author_ids, kind="stable")
+        category_order = np.argsort(category_ids, kind="stable")
+        return cls(book_ids=book_ids[by_id],
+                   author_ids=author_ids,
+                   category_ids=category_ids,
+                   ratings=ratings[by_id],
+                   created_at=created_at,
+                   created_order=created_order,
+                   created_sorted=created_at[created_order],
+                   author_order=author_order,
+                   author_sorted=author_ids[author_order],
+                   category_order=category_order,
+                   category_sorted=category_ids[category_order])
+
+    def __len__(self) -> int:
+        return len(self.book_ids)
+
+    def rows_of(self, book_ids: np.ndarray) -> np.ndarray:
+        """Returns the rows of the given ids, skipping unknown ids."""
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        rows = np.searchsorted(self.book_ids, book_ids)
+        found = rows < len(self)
+        found[found] = self.book_ids[rows[found]] == book_ids[found]
+        return rows[found]
+
+    def filter(self, created_before: datetime.datetime | None,
+               created_after: datetime.datetime | None,
+               author_ids: list[int] | None,
+               category_ids: list[int] | None) -> np.ndarray:
+        """
+        Returns the ids of the books matching all given filters, in id
+        order. Filters left as None are not applied, while an empty list
+        matches nothing.
+
+        The candidate rows come from whichever index yields fewest of them,
+        the remaining filters are checked on the candidates only.
+        """
+        after = to_timestamp(created_after) if created_after else None
+        before = to_timestamp(created_before) if created_before else None
+
+        candidates = []
+        if after is not None or before is not None:
+            start, stop = 0, len(self)
+            if after is not None:
+                start = np.searchsorted(self.created_sorted, after, "left")
+            if before is not None:
+                stop = np.searchsorted(self.created_sorted, before, "right")
+            candidates.append(("created", self.created_order[start:stop]))
+        if author_ids is not None:
+            candidates.append(("author",
+                               _lookup(self.author_order, self.author_sorted,
+                                       author_ids)))
+        if category_ids is not None:
+            candidates.append(("category",
+                               _lookup(self.category_order,
+                                       self.category_sorted, category_ids)))
+        if not candidates:
+            return self.book_ids
+
+        driver, rows = min(candidates, key=lambda item: len(item[1]))
+        mask = np.ones(len(rows), dtype=bool)
+        if driver != "created" and after is not None:
+            mask &= self.created_at[rows] >= after
+        if driver != "created" and before is not None:
+            mask &= self.created_at[rows] <= before
+        if driver != "author" and author_ids is not None:
+            mask &= _matches(self.author_ids[rows], author_ids)
+        if driver != "category" and category_ids is not None:
+            mask &= _matches(self.category_ids[rows], category_ids)
+        return self.book_ids[np.sort(rows[mask])]
+
+    def patch(self, book_ids: np.ndarray, changed: "Catalogue") -> "Catalogue":
+        """
+        Returns a copy with the rows of `book_ids` replaced by the rows of
+        `changed`. Ids missing from `changed` are removed.
+
+        The indexes are updated rather than sorted again. When books are
+        only updated or appended after the last id, which is the usual
+        case, rows keep their numbers and only the changed index entries
+        move, otherwise every index entry is renumbered in a linear pass.
+        """
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        rows = self.rows_of(book_ids)
+        sources = changed.rows_of(self.book_ids[rows])
+        last_id = self.book_ids[-1] if len(self) else 0
+        appended = changed.book_ids > last_id
+        if (len(sources) == len(rows)
+                and len(sources) + appended.sum() == len(changed)):
+            return self._update(rows, changed, sources, appended)
+        return self._rebuild(rows, changed)
+
+    def _update(self, rows: np.ndarray, changed: "Catalogue",
+                sources: np.ndarray, appended: np.ndarray) -> "Catalogue":
+        columns = {}
+        for name in COLUMNS:
+            column = np.concatenate(
+                [getattr(self, name),
+                 getattr(changed, name)[appended]])
+            column[rows] = getattr(changed, name)[sources]
+            columns[name] = column
+        new_rows = np.concatenate(
+            [rows, len(self) + np.arange(appended.sum())])
+
+        indexes = {}
+        for key, order_name, sorted_name in INDEXES:
+            order = getattr(self, order_name)
+            sorted_keys = getattr(self, sorted_name)
+            removed = _positions(order, sorted_keys, rows,
+                                 getattr(self, key)[rows])
+            keys = columns[key][new_rows]
+            by_key = np.argsort(keys, kind="stable")
+            keys, added = keys[by_key], new_rows[by_key]
+            # Positions in the index before the removal keep the order
+            # once the removed entries are gone.
+            insert_at = np.searchsorted(sorted_keys, keys, "right")
+            indexes[order_name] = _splice(order, removed, insert_at, added)
+            indexes[sorted_name] = _splice(sorted_keys, removed, insert_at,
+                                           keys)
+        return Catalogue(**columns, **indexes)
+
+    def _rebuild(self, rows: np.ndarray, changed: "Catalogue") -> "Catalogue":
+        keep = np.ones(len(self), dtype=bool)
+        keep[rows] = False
+        kept_ids = self.book_ids[keep]
+
+        # Changed rows go before the kept rows with larger ids, which moves
+        # every kept row down by the number of changed ids below it.
+        insert_at = np.searchsorted(kept_ids, changed.book_ids)
+        new_rows = insert_at + np.arange(len(changed))
+        remap = np.full(len(self), -1, dtype=np.int64)
+        remap[keep] = np.arange(len(kept_ids)) + np.searchsorted(
+            changed.book_ids, kept_ids)
+
+        columns = {
+            name:
+            np.insert(
+                getattr(self, name)[keep], insert_at, getattr(changed, name))
+            for name in COLUMNS
+        }
+        indexes = {}
+        for key, order_name, sorted_name in INDEXES:
+            order = getattr(self, order_name)
+            kept = remap[order] >= 0
+            indexes[order_name], indexes[sorted_name] = _insert_rows(
+                remap[order[kept]],
+                getattr(self, sorted_name)[kept], new_rows,
+                getattr(changed, key))
+        return Catalogue(**columns, **indexes)
+
+
+def _positions(order: np.ndarray, sorted_keys: np.ndarray, rows: np.ndarray,
+               keys: np.ndarray) -> np.ndarray:
+    """Returns the positions of the given rows, with their keys, in an index."""
+    starts = np.searchsorted(sorted_keys, keys, "left")
+    stops = np.searchsorted(sorted_keys, keys, "right")
+    return np.fromiter((start + np.flatnonzero(order[start:stop] == row)[0]
+                        for row, start, stop in zip(rows, starts, stops)),
+                       dtype=np.int64,
+                       count=len(rows))
+
+
+def _splice(array: np.ndarray, removed: np.ndarray, insert_at: np.ndarray,
+            values: np.ndarray) -> np.ndarray:
+    """
+    Copies `array` without the entries at `removed` and with `values`
+    inserted before the entries at `insert_at`, in one pass. Both position
+    lists refer to `array` and `insert_at` is sorted.
+    """
+    pieces = []
+    start = 0
+    events = sorted([(position, 0, index)
+                     for index, position in enumerate(insert_at)] +
+                    [(position, 1, None) for position in removed])
+    for position, kind, index in events:
+        pieces.append(array[start:position])
+        if kind == 0:
+            pieces.append(values[index:index + 1])
+            start = position
+        else:
+            start = position + 1
+    pieces.append(array[start:])
+    return np.concatenate(pieces)
+
+
+def _insert_rows(order: np.ndarray, sorted_keys: np.ndarray, rows: np.ndarray,
+                 keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Inserts rows into an index at the positions of their keys."""
+    by_key = np.argsort(keys, kind="stable")
+    keys, rows = keys[by_key], rows[by_key]
+    insert_at = np.searchsorted(sorted_keys, keys, "right")
+    return (np.insert(order, insert_at,
+                      rows), np.insert(sorted_keys, insert_at, keys))
+
+
+def _lookup(order: np.ndarray, sorted_keys: np.ndarray,
+            values: list[int]) -> np.ndarray:
+    """Returns the rows of an index whose key is one of `values`."""
+    values = np.unique(np.asarray(values, dtype=np.int64))
+    starts = np.searchsorted(sorted_keys, values, "left")
+    stops = np.searchsorted(sorted_keys, values, "right")
+    return np.concatenate([np.empty(0, dtype=np.int64)] + [
+        order[start:stop] for start, stop in zip(starts, stops) if start < stop
+    ])
+
+
+def _matches(column: np.ndarray, values: list[int]) -> np.ndarray:
+    """
+    Boolean mask of the rows of `column` holding one of `values`. A few
+    values are compared directly, more are looked up in a table indexed by
+    id, both a single pass each instead of the sort np.isin falls back to.
+    """
+    values = np.unique(np.asarray(values, dtype=np.int64))
+    if len(values) <= 16:
+        mask = np.zeros(len(column), dtype=bool)
+        for value in values:
+            mask |= column == value
+        return mask
+    table = np.zeros(int(max(column.max(initial=0), values[-1])) + 1,
+                     dtype=bool)
+    table[values[values >= 0]] = True
+    return table[column]
@@ -0,0 +1,62 @@
+"""
+Change log behind the delta sync endpoint.
+
+Writes append an entry per changed object in their own transaction (see
+books.signals), so the log order is the change sequence clients sync by.
+A client keeps the id of the last entry it has seen as its token and asks
+for the entries after it, which costs as much as the changes since then,
+not the size of the catalogue.
+
+Entries older than the retention period are removed by
+`manage.py prune_changes`. Tokens from before them are refused and their
+clients download the catalogue again.
+"""
+from typing import Iterable
+
+from books import models
+
+BOOK = "book"
+REVIEW = "review"
+STATS = "stats"
+FAVOURITE = "favourite"
+
+EXPIRED_MESSAGE = "Изменения после токена удалены, загрузите каталог заново"
+
+
+def record(entity: str,
+           object_ids: Iterable[int],
+           deleted: bool = False,
+           user_id: int | None = None) -> None:
+    models.Change.objects.bulk_create(
+        models.Change(entity=entity,
+                      object_id=object_id,
+                      user_id=user_id,
+                      deleted=deleted) for object_id in object_ids)
+
+
+def pruned_through() -> int:
+    """
+    Returns the id of the last entry removed from the log, 0 before the
+    first pruning.
+    """
+    return models.PrunedChanges.objects.filter(id=1).values_list(
+        "last_id", flat=True).first() or 0
+
+
+def merge(
+    entries: Iterable[tuple[str, int, bool]]
+) -> tuple[dict[str, list[int]], dict[str, list[int]]]:
+    """
+    Returns the ids of the live and of the deleted objects per entity, from
+    (entity, object_id, deleted) entries in log order. The last change of
+    an object decides whether it is deleted.
+    """
+    latest: dict[tuple[str, int], bool] = {}
+    for entity, object_id, is_deleted in entries:
+        latest[(entity, object_id)] = is_deleted
+    live: dict[str, list[int]] = {}
+    deleted: dict[str, list[int]] = {}
+    for (entity, object_id), is_deleted in latest.items():
+        (deleted if is_deleted else live).setdefault(entity,
+                                                     []).append(object_id)
+    return live, deleted
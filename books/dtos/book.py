@@ -36,6 +36,8 @@ class BookReview:
     rating: int
     review: str
     created_at: datetime.datetime | None = None
+    id: int | None = None
+    updated_at: datetime.datetime | None = None
 
 
 @dataclasses.dataclass
@@ -49,9 +51,75 @@ class BookDetail:
     reviews: list[BookReview] = dataclasses.field(default_factory=list)
     average_rating: int = 0
     favourite: bool = False
+    updated_at: datetime.datetime | None = None
+
+
+@dataclasses.dataclass
+class ReviewPage:
+    reviews: list[BookReview]
+    # `before` of the next page, None on the last one
+    next: int | None = None
 
 
 @dataclasses.dataclass
 class User:
     id: int
     email: str
+
+
+@dataclasses.dataclass
+class BookStats:
+    book_id: int
+    histogram: dict[int, int]
+    review_count: int = 0
+    average_rating: float = 0
+    recent_rating: float = 0
+    trend: float = 0
+    last_review_at: datetime.datetime | None = None
+
+
+@dataclasses.dataclass
+class UserAffinity:
+    user_id: int
+    authors: dict[int, float] = dataclasses.field(default_factory=dict)
+    categories: dict[int, float] = dataclasses.field(default_factory=dict)
+
+
+@dataclasses.dataclass
+class ChangeSet:
+    """
+    Objects changed after a sync token. Books come without their reviews,
+    which are listed in `reviews`, and `favourites` are the ids of books
+    the user has added to their favourites.
+    """
+    token: str
+    has_more: bool = False
+    books: list[BookDetail] = dataclasses.field(default_factory=list)
+    reviews: list[BookReview] = dataclasses.field(default_factory=list)
+    stats: list[BookStats] = dataclasses.field(default_factory=list)
+    favourites: list[int] = dataclasses.field(default_factory=list)
+    deleted_books: list[int] = dataclasses.field(default_factory=list)
+    deleted_reviews: list[int] = dataclasses.field(default_factory=list)
+    deleted_stats: list[int] = dataclasses.field(default_factory=list)
+    deleted_favourites: list[int] = dataclasses.field(default_factory=list)
+
+
+FACETS = ("category", "author", "rating_bucket")
+
+
+@dataclasses.dataclass
+class FacetValue:
+    id: int
+    name: str
+    count: int
+
+
+Facets = dict[str, list[FacetValue]]
+
+
+@dataclasses.dataclass
+class Suggestion:
+    # "book", "author" or "category"
+    type: str
+    id: int
+    text: str
@@ -0,0 +1,217 @@
+"""
+In-process fan-out of book events to server-sent event streams.
+
+Every stream holds a `Subscription` to a few books, an asyncio queue on
+the event loop of the ASGI server. The broker indexes subscriptions by
+book, so publishing an event touches only the streams of that book and an
+idle stream costs a queue and a suspended coroutine, no thread and no
+database queries.
+
+Where events come from is up to the backend, settings.BOOKS_EVENTS_BACKEND:
+
+- `LocalBackend` hands published events straight to the broker. Writers
+  and streams have to share the process, which suits a single ASGI worker.
+- `ChangeLogBackend` ignores published events and follows the change log
+  instead (see books.changes), one query per interval and process whatever
+  the number of streams. It sees the writes of every worker and of
+  `manage.py process_outbox`, which updates the ratings.
+
+Delivery is best effort: a stream that falls behind is closed, and clients
+catch up from /api/v1/books/changes/ when they reconnect.
+"""
+import asyncio
+import dataclasses
+import logging
+import threading
+import time
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+from books.exceptions import ChangesExpiredException
+from books.repos.book import BookRepository
+
+REVIEW_CREATED = "review"
+RATING_CHANGED = "rating"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class Event:
+    type: str
+    book_id: int
+    # BookReview for REVIEW_CREATED, BookStats for RATING_CHANGED
+    data: Any
+
+
+class Subscription:
+    """
+    Events of some books for one stream. Bound to the event loop it was
+    created on, events are handed over to it from any thread.
+    """
+
+    def __init__(self, book_ids: frozenset[int], max_pending: int):
+        self.book_ids = book_ids
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue[Event | None] = asyncio.Queue(max_pending +
+                                                                 1)
+        self._max_pending = max_pending
+        self.closed = False
+
+    def deliver(self, event: Event | None) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The loop is gone, the stream with it.
+            self.closed = True
+
+    def close(self) -> None:
+        self.deliver(None)
+
+    def _put(self, event: Event | None) -> None:
+        if self.closed:
+            return
+        if event is None or self._queue.qsize() >= self._max_pending:
+            # None wakes the stream up to end it, the client reconnects.
+            self.closed = True
+            self._queue.put_nowait(None)
+            return
+        self._queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> Event | None:
+        """
+        Returns the next event, or None when the subscription was closed.
+        Raises asyncio.TimeoutError after `timeout` seconds without one.
+        """
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+
+class Broker:
+
+    def __init__(self, backend: "LocalBackend | ChangeLogBackend"):
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._subscriptions: dict[int, set[Subscription]] = {}
+
+    def subscribe(self, book_ids: Iterable[int]) -> Subscription:
+        """
+        Must be called on the event loop that reads the subscription.
+        """
+        subscription = Subscription(frozenset(book_ids),
+                                    settings.BOOKS_EVENTS_MAX_PENDING)
+        with self._lock:
+            for book_id in subscription.book_ids:
+                self._subscriptions.setdefault(book_id,
+                                               set()).add(subscription)
+        self._backend.start(self)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            for book_id in subscription.book_ids:
+                subscriptions = self._subscriptions.get(book_id)
+                if subscriptions is None:
+                    continue
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[book_id]
+
+    def subscribed_books(self) -> set[int]:
+        with self._lock:
+            return set(self._subscriptions)
+
+    def publish(self, event: Event) -> None:
+        """
+        Called by writers once their transaction has committed.
+        """
+        self._backend.publish(self, event)
+
+    def deliver(self, event: Event) -> None:
+        """
+        Called by the backend, hands the event to the streams of its book.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(event.book_id, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+
+class LocalBackend:
+    """
+    Delivers the events published in this process.
+    """
+
+    def start(self, broker: Broker) -> None:
+        pass
+
+    def publish(self, broker: Broker, event: Event) -> None:
+        broker.deliver(event)
+
+
+class ChangeLogBackend:
+    """
+    Turns the review and rating statistics entries of the change log into
+    events. A thread polls the log every settings.BOOKS_EVENTS_POLL_INTERVAL
+    seconds while the process has subscribers, and starts from the latest
+    entry after being idle rather than replaying what nobody listened to.
+    """
+
+    batch_size = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def start(self, broker: Broker) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                args=(broker, ),
+                                                name="book-events",
+                                                daemon=True)
+                self._thread.start()
+
+    def publish(self, broker: Broker, event: Event) -> None:
+        # The write is already in the change log.
+        pass
+
+    def _run(self, broker: Broker) -> None:
+        token = None
+        while True:
+            time.sleep(settings.BOOKS_EVENTS_POLL_INTERVAL)
+            if not broker.subscribed_books():
+                token = None
+                continue
+            try:
+                close_old_connections()
+                token = self._poll(broker, token)
+            except Exception:
+                logger.exception("Polling the change log for events failed")
+
+    def _poll(self, broker: Broker, token: str | None) -> str:
+        repo = BookRepository()
+        if token is None:
+            return repo.get_change_token()
+        while True:
+            try:
+                changes = repo.get_changes(user=None,
+                                           since=int(token),
+                                           limit=self.batch_size)
+            except ChangesExpiredException:
+                # Stopped for longer than the change log is kept, the events
+                # in between are lost to the subscribers.
+                logger.warning("Change log pruned past the events token")
+                return repo.get_change_token()
+            for review in changes.reviews:
+                broker.deliver(Event(REVIEW_CREATED, review.book_id, review))
+            for stats in changes.stats:
+                broker.deliver(Event(RATING_CHANGED, stats.book_id, stats))
+            token = changes.token
+            if not changes.has_more:
+                return token
+
+
+broker = Broker(import_string(settings.BOOKS_EVENTS_BACKEND)())
@@ -7,3 +7,7 @@ class BookException(Exception):
 
 class AlreadyExistsException(BookException):
     _message = "Уже существует"
+
+
+class ChangesExpiredException(BookException):
+    _message = "Изменения удалены"
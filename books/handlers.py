@@ -0,0 +1,60 @@
+import datetime
+
+from django.db import transaction
+
+from books import models
+from books import outbox
+from books.caches.book_detail import book_detail_cache
+from books.caches.catalogue import catalogue_cache
+from books.events import RATING_CHANGED, Event, broker
+from books.recommendations import FAVOURITE_AFFINITY, review_affinity
+from books.repos.book import BookRepository
+
+
+@outbox.handler(outbox.REVIEW_CREATED)
+def refresh_book_detail(book_id: int,
+                        events: list[models.OutboxEvent]) -> None:
+    """
+    Reloads the cached detail once for a batch of new reviews, so readers
+    find the new average and reviews already cached.
+    """
+    book_detail_cache.refresh(
+        book_id,
+        lambda: BookRepository().get_book_detail(user=None, book_id=book_id))
+
+
+@outbox.handler(outbox.REVIEW_CREATED)
+def update_book_stats(book_id: int, events: list[models.OutboxEvent]) -> None:
+    repo = BookRepository()
+    repo.update_book_stats(
+        book_id,
+        [(event.payload["rating"],
+          datetime.datetime.fromisoformat(event.payload["created_at"]))
+         for event in events])
+    catalogue_cache.record_change(book_id)
+    stats = repo.get_book_stats(book_id)
+    transaction.on_commit(
+        lambda: broker.publish(Event(RATING_CHANGED, book_id, stats)))
+
+
+@outbox.handler(outbox.REVIEW_CREATED)
+def refresh_listing_ratings(book_id: int,
+                            events: list[models.OutboxEvent]) -> None:
+    BookRepository().refresh_listing_ratings(book_id)
+
+
+@outbox.handler(outbox.FAVOURITE_ADDED)
+@outbox.handler(outbox.REVIEW_CREATED)
+def update_user_affinity(book_id: int,
+                         events: list[models.OutboxEvent]) -> None:
+    """
+    Moves the affinity of each user towards the author and category of the
+    book, see books.recommendations.
+    """
+    weights = []
+    for event in events:
+        weight = FAVOURITE_AFFINITY
+        if event.topic == outbox.REVIEW_CREATED:
+            weight = review_affinity(event.payload["rating"])
+        weights.append((event.payload["user_id"], weight))
+    BookRepository().update_user_affinities(book_id, weights)
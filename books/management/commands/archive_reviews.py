@@ -0,0 +1,28 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from books.repos.book import BookRepository
+
+
+class Command(BaseCommand):
+    help = ("Moves old reviews to the compressed archive table, keeping "
+            "their ratings in the book averages")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days",
+                            type=int,
+                            required=True,
+                            help="Archive reviews created earlier")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, older_than_days, batch_size, **options):
+        if older_than_days < 1:
+            raise CommandError("--older-than-days must be at least 1")
+        created_before = timezone.now() - datetime.timedelta(
+            days=older_than_days)
+        archived = BookRepository().archive_reviews(
+            created_before=created_before, batch_size=batch_size)
+        self.stdout.write(f"Archived {archived} reviews created before "
+                          f"{created_before:%Y-%m-%d}")
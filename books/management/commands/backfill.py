@@ -0,0 +1,89 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books import backfill, models
+
+
+class Command(BaseCommand):
+    help = ("Runs or resumes a registered backfill in primary key chunks, "
+            "or lists the backfills and their progress")
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", nargs="?")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--max-rows-per-second",
+                            type=float,
+                            help="Sleep between chunks to keep to this rate")
+        parser.add_argument("--pause",
+                            type=float,
+                            default=0.0,
+                            help="Seconds to sleep between chunks at least")
+        parser.add_argument("--restart",
+                            action="store_true",
+                            help="Start over instead of resuming")
+        parser.add_argument("--report-every",
+                            type=float,
+                            default=5.0,
+                            help="Seconds between progress lines")
+
+    def handle(self, *args, name, chunk_size, max_rows_per_second, pause,
+               restart, report_every, **options):
+        if name is None:
+            self._list()
+            return
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        try:
+            if restart:
+                backfill.reset(name)
+            reported_at = time.monotonic()
+
+            def report(progress: backfill.Progress) -> None:
+                nonlocal reported_at
+                if time.monotonic() - reported_at >= report_every:
+                    reported_at = time.monotonic()
+                    self._write_progress(progress)
+
+            progress = backfill.run(name,
+                                    chunk_size=chunk_size,
+                                    max_rows_per_second=max_rows_per_second,
+                                    pause=pause,
+                                    report=report)
+        except LookupError as error:
+            raise CommandError(error) from None
+        self._write_progress(progress)
+
+    def _list(self) -> None:
+        checkpoints = {
+            checkpoint.name: checkpoint
+            for checkpoint in models.BackfillCheckpoint.objects.all()
+        }
+        for item in backfill.registered():
+            checkpoint = checkpoints.get(item.name)
+            if checkpoint is None:
+                state = "not started"
+            elif checkpoint.finished_at is not None:
+                state = (f"finished {checkpoint.finished_at:%Y-%m-%d %H:%M}, "
+                         f"{checkpoint.rows} rows")
+            else:
+                state = (f"at {item.model._meta.label} pk "
+                         f"{checkpoint.last_pk}/{checkpoint.end_pk}, "
+                         f"{checkpoint.rows} rows")
+            self.stdout.write(f"{item.name}: {state}")
+            if item.description:
+                self.stdout.write(f"    {' '.join(item.description.split())}")
+
+    def _write_progress(self, progress: backfill.Progress) -> None:
+        line = (f"{progress.name}: pk {progress.last_pk}/{progress.end_pk} "
+                f"({progress.percent:.1f}%), {progress.rows} rows, "
+                f"{progress.rows_per_second:.0f} rows/s")
+        if progress.finished:
+            line += ", finished"
+        elif progress.rows_per_second and progress.last_pk:
+            # Assumes the keys ahead are as dense as the keys done
+            remaining = (progress.rows * (progress.end_pk - progress.last_pk) /
+                         progress.last_pk)
+            line += (f", about {remaining / progress.rows_per_second:.0f}s "
+                     "left")
+        self.stdout.write(line)
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from books.recommendations import similar_books
+from books.repos.book import BookRepository
+
+
+class Command(BaseCommand):
+    help = ("Builds the similar books table from co-favourites and "
+            "positive reviews")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k",
+                            type=int,
+                            default=20,
+                            help="Neighbours kept per book")
+        parser.add_argument("--min-common",
+                            type=int,
+                            default=2,
+                            help="Users two books must share to be similar")
+        parser.add_argument("--min-rating",
+                            type=int,
+                            default=4,
+                            help="Lowest review rating counted as a like")
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, top_k, min_common, min_rating, batch_size,
+               **options):
+        repo = BookRepository()
+        pairs = repo.get_interactions(min_rating=min_rating)
+        self.stdout.write(f"Loaded {len(pairs)} interactions")
+        similar = similar_books(pairs, top_k=top_k, min_common=min_common)
+        saved = repo.replace_similar_books(similar, batch_size=batch_size)
+        self.stdout.write(f"Saved {saved} similar books")
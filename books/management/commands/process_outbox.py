@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from books import outbox
+
+
+class Command(BaseCommand):
+    help = "Processes queued outbox events, batching them per book"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--interval",
+                            type=float,
+                            default=1.0,
+                            help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--once",
+                            action="store_true",
+                            help="Drain the queue and exit")
+
+    def handle(self, *args, batch_size, interval, once, **options):
+        while True:
+            processed = outbox.process_batch(batch_size=batch_size)
+            if processed:
+                self.stdout.write(f"Processed {processed} events")
+                continue
+            if once:
+                return
+            time.sleep(interval)
@@ -0,0 +1,64 @@
+import collections
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from books_project import profiling
+
+
+class Command(BaseCommand):
+    help = ("Ranks the frames with the most CPU samples and allocated bytes "
+            "across the captures of ProfilingMiddleware")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=settings.PROFILING_DIR)
+        parser.add_argument("--view",
+                            help="Only captures of this URL name, such as "
+                            "list-books")
+        parser.add_argument("--top", type=int, default=15)
+
+    def handle(self, *args, dir, view, top, **options):
+        if not dir:
+            raise CommandError("Set PROFILING_DIR or pass --dir")
+        captures = []
+        for path in sorted(Path(dir).glob("*.json")):
+            metadata = json.loads(path.read_text())
+            if view is None or metadata.get("view") == view:
+                captures.append(metadata)
+        if not captures:
+            raise CommandError(f"No captures in {dir}")
+
+        durations = sorted(capture["duration_ms"] for capture in captures)
+        self.stdout.write(f"{len(captures)} captures, median "
+                          f"{durations[len(durations) // 2]:.1f} ms, slowest "
+                          f"{durations[-1]:.1f} ms")
+        self._summarize(dir, captures, "cpu", "samples", top)
+        self._summarize(dir, captures, "alloc", "bytes", top)
+
+    def _summarize(self, dir: str, captures: list[dict], kind: str, unit: str,
+                   top: int) -> None:
+        """
+        Self weight goes to the innermost frame of a stack, total weight to
+        every distinct frame of it.
+        """
+        own: collections.Counter[str] = collections.Counter()
+        total: collections.Counter[str] = collections.Counter()
+        for capture in captures:
+            path = Path(dir) / f"{capture['id']}.{kind}.folded"
+            if not path.exists():
+                continue
+            for stack, weight in profiling.read_folded(path):
+                own[stack[-1]] += weight
+                for frame in set(stack):
+                    total[frame] += weight
+        overall = sum(own.values())
+        if not overall:
+            return
+
+        self.stdout.write(f"\n{kind}: {overall} {unit}")
+        self.stdout.write(f"{'self %':>7} {'total %':>7}  frame")
+        for frame, weight in own.most_common(top):
+            self.stdout.write(f"{100 * weight / overall:>7.1f} "
+                              f"{100 * total[frame] / overall:>7.1f}  {frame}")
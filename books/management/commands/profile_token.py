@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from books_project import profiling
+
+
+class Command(BaseCommand):
+    help = ("Prints an X-Profile header value that makes the API profile "
+            "the requests carrying it")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--memory",
+                            action="store_true",
+                            help="Also trace allocations, which slows the "
+                            "profiled requests down several times")
+
+    def handle(self, *args, memory, **options):
+        self.stdout.write(f"X-Profile: {profiling.make_token(memory=memory)}")
+        self.stdout.write(
+            f"Valid for {settings.PROFILING_TOKEN_MAX_AGE} seconds, captures "
+            f"go to {settings.PROFILING_DIR or 'nowhere, PROFILING_DIR is unset'}"
+        )
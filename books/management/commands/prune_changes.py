@@ -0,0 +1,28 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from books.repos.book import BookRepository
+
+
+class Command(BaseCommand):
+    help = ("Removes old entries of the change log. Clients holding a token "
+            "from before them download the catalogue again")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days",
+                            type=int,
+                            required=True,
+                            help="Remove entries made earlier")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, older_than_days, batch_size, **options):
+        if older_than_days < 1:
+            raise CommandError("--older-than-days must be at least 1")
+        created_before = timezone.now() - datetime.timedelta(
+            days=older_than_days)
+        pruned = BookRepository().prune_changes(created_before=created_before,
+                                                batch_size=batch_size)
+        self.stdout.write(f"Pruned {pruned} changes made before "
+                          f"{created_before:%Y-%m-%d}")
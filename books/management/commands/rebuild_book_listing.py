@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books.repos.book import BookRepository
+
+
+class Command(BaseCommand):
+    help = ("Rebuilds the denormalized book_listing table, or with --check "
+            "compares it with the normalized tables")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--check",
+                            action="store_true",
+                            help="Only report books whose listing is stale")
+
+    def handle(self, *args, batch_size, check, **options):
+        repo = BookRepository()
+        if not check:
+            rebuilt = repo.rebuild_book_listing(batch_size=batch_size)
+            self.stdout.write(f"Rebuilt listing of {rebuilt} books")
+            return
+
+        stale = repo.find_stale_listings(batch_size=batch_size)
+        if stale:
+            shown = ", ".join(str(book_id) for book_id in stale[:20])
+            raise CommandError(f"{len(stale)} stale listings, books: {shown}")
+        self.stdout.write("Listing matches the normalized tables")
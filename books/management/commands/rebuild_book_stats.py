@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from books.caches.book_list import book_list_cache
+from books.caches.catalogue import catalogue_cache
+from books.repos.book import BookRepository
+
+
+class Command(BaseCommand):
+    help = "Recomputes the review statistics of every book"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        rebuilt = BookRepository().rebuild_book_stats(batch_size=batch_size)
+        catalogue_cache.invalidate()
+        book_list_cache.invalidate()
+        self.stdout.write(f"Rebuilt stats of {rebuilt} books")
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.5 on 2026-10-19 11:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("topic", models.CharField(max_length=100, verbose_name="Тип события")),
+                ("book_id", models.BigIntegerField(verbose_name="Книга")),
+                ("payload", models.JSONField(default=dict, verbose_name="Данные")),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(default=0, verbose_name="Попытки"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата создания"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Событие",
+                "verbose_name_plural": "События",
+                "db_table": "outbox_events",
+            },
+        ),
+    ]
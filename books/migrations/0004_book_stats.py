@@ -0,0 +1,77 @@
+# Generated by Django 4.2.5 on 2026-10-19 11:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0003_outbox_event"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookStats",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="books.book",
+                        verbose_name="Книга",
+                    ),
+                ),
+                (
+                    "rating_1",
+                    models.PositiveIntegerField(default=0, verbose_name="Оценок 1"),
+                ),
+                (
+                    "rating_2",
+                    models.PositiveIntegerField(default=0, verbose_name="Оценок 2"),
+                ),
+                (
+                    "rating_3",
+                    models.PositiveIntegerField(default=0, verbose_name="Оценок 3"),
+                ),
+                (
+                    "rating_4",
+                    models.PositiveIntegerField(default=0, verbose_name="Оценок 4"),
+                ),
+                (
+                    "rating_5",
+                    models.PositiveIntegerField(default=0, verbose_name="Оценок 5"),
+                ),
+                (
+                    "review_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Отзывов"),
+                ),
+                (
+                    "rating_sum",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Сумма оценок"
+                    ),
+                ),
+                (
+                    "recent_rating",
+                    models.FloatField(
+                        default=0, verbose_name="Скользящее среднее оценок"
+                    ),
+                ),
+                (
+                    "last_review_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Последний отзыв"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Статистика книги",
+                "verbose_name_plural": "Статистика книг",
+                "db_table": "book_stats",
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.5 on 2026-10-19 11:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0004_book_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimilarBook",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rank", models.PositiveSmallIntegerField(verbose_name="Место")),
+                ("score", models.FloatField(verbose_name="Сходство")),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_books",
+                        to="books.book",
+                        verbose_name="Книга",
+                    ),
+                ),
+                (
+                    "similar_book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="books.book",
+                        verbose_name="Похожая книга",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Похожая книга",
+                "verbose_name_plural": "Похожие книги",
+                "db_table": "similar_books",
+                "unique_together": {("book", "rank")},
+            },
+        ),
+    ]
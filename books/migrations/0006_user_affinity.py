@@ -0,0 +1,46 @@
+# Generated by Django 4.2.5 on 2026-10-19 11:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+        ("books", "0005_similar_books"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserAffinity",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="affinity",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+                ("authors", models.JSONField(default=dict, verbose_name="Авторы")),
+                (
+                    "categories",
+                    models.JSONField(default=dict, verbose_name="Категории"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Дата обновления"),
+                ),
+            ],
+            options={
+                "verbose_name": "Предпочтения пользователя",
+                "verbose_name_plural": "Предпочтения пользователей",
+                "db_table": "user_affinities",
+            },
+        ),
+    ]
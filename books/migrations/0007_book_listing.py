@@ -0,0 +1,72 @@
+# Generated by Django 4.2.5 on 2026-10-19 11:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0006_user_affinity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookListing",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="listing",
+                        serialize=False,
+                        to="books.book",
+                        verbose_name="Книга",
+                    ),
+                ),
+                ("name", models.CharField(max_length=300, verbose_name="Название")),
+                (
+                    "author_id",
+                    models.BigIntegerField(db_index=True, verbose_name="Автор"),
+                ),
+                (
+                    "author_first_name",
+                    models.CharField(max_length=200, verbose_name="Имя автора"),
+                ),
+                (
+                    "author_last_name",
+                    models.CharField(max_length=200, verbose_name="Фамилия автора"),
+                ),
+                (
+                    "author_created_at",
+                    models.DateTimeField(verbose_name="Дата создания автора"),
+                ),
+                (
+                    "category_name",
+                    models.CharField(
+                        db_index=True, max_length=300, verbose_name="Категория"
+                    ),
+                ),
+                (
+                    "review_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Отзывов"),
+                ),
+                (
+                    "rating_sum",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Сумма оценок"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(db_index=True, verbose_name="Дата создания"),
+                ),
+            ],
+            options={
+                "verbose_name": "Строка каталога",
+                "verbose_name_plural": "Каталог",
+                "db_table": "book_listing",
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.5 on 2026-10-19 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0007_book_listing"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="author",
+            index=models.Index(fields=["last_name"], name="authors_last_na_679db7_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(fields=["name"], name="books_name_fa281b_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="bookreview",
+            index=models.Index(
+                fields=["rating", "id"], name="reviews_rating_34de90_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.5 on 2026-10-19 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0008_admin_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Change",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("entity", models.CharField(max_length=20, verbose_name="Сущность")),
+                ("object_id", models.BigIntegerField(verbose_name="Объект")),
+                (
+                    "user_id",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="Пользователь"
+                    ),
+                ),
+                ("deleted", models.BooleanField(default=False, verbose_name="Удален")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата создания"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Изменение",
+                "verbose_name_plural": "Изменения",
+                "db_table": "changes",
+            },
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Дата изменения"),
+        ),
+        migrations.AddField(
+            model_name="bookreview",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Дата изменения"),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.5 on 2026-10-19 12:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("books", "0009_change_log"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedRatings",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="archived_ratings",
+                        serialize=False,
+                        to="books.book",
+                        verbose_name="Книга",
+                    ),
+                ),
+                (
+                    "review_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Отзывов"),
+                ),
+                (
+                    "rating_sum",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Сумма оценок"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Оценки архивных отзывов",
+                "verbose_name_plural": "Оценки архивных отзывов",
+                "db_table": "archived_ratings",
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedReview",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("rating", models.IntegerField(verbose_name="Рейтинг")),
+                ("review", models.BinaryField(verbose_name="Текст отзыва")),
+                ("created_at", models.DateTimeField(verbose_name="Дата создания")),
+                ("updated_at", models.DateTimeField(verbose_name="Дата изменения")),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_reviews",
+                        to="books.book",
+                        verbose_name="Книга",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_reviews",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Автор отзыва",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Архивный отзыв",
+                "verbose_name_plural": "Архивные отзывы",
+                "db_table": "reviews_archive",
+                "indexes": [
+                    models.Index(
+                        fields=["book", "id"], name="reviews_arc_book_id_fa62ba_idx"
+                    )
+                ],
+                "unique_together": {("user_id", "book_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.5 on 2026-10-19 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0010_review_archive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BackfillCheckpoint",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        max_length=100,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Название",
+                    ),
+                ),
+                (
+                    "last_pk",
+                    models.BigIntegerField(
+                        default=0, verbose_name="Последний обработанный id"
+                    ),
+                ),
+                (
+                    "end_pk",
+                    models.BigIntegerField(verbose_name="Последний id на старте"),
+                ),
+                (
+                    "rows",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Обработано строк"
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Дата начала"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Дата изменения"),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Дата завершения"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Заполнение данных",
+                "verbose_name_plural": "Заполнения данных",
+                "db_table": "backfills",
+            },
+        ),
+    ]
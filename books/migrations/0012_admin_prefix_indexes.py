@@ -0,0 +1,45 @@
+# Generated by Django 4.2.5 on 2026-10-19 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0011_backfill_checkpoints"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="author",
+            name="authors_last_na_679db7_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="book",
+            name="books_name_fa281b_idx",
+        ),
+        migrations.AddIndex(
+            model_name="author",
+            index=models.Index(
+                fields=["last_name"],
+                name="authors_last_name_prefix_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="author",
+            index=models.Index(
+                fields=["first_name"],
+                name="authors_first_name_prefix_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["name"],
+                name="books_name_prefix_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.5 on 2026-10-19 12:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0012_admin_prefix_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PrunedChanges",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "last_id",
+                    models.BigIntegerField(
+                        default=0, verbose_name="Последнее удаленное"
+                    ),
+                ),
+                (
+                    "pruned_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Дата очистки"),
+                ),
+            ],
+            options={
+                "verbose_name": "Очистка журнала изменений",
+                "verbose_name_plural": "Очистки журнала изменений",
+                "db_table": "pruned_changes",
+            },
+        ),
+    ]
@@ -14,6 +14,15 @@ class Author(models.Model):
         verbose_name = "Автор"
         verbose_name_plural = "Авторы"
         unique_together = ("first_name", "last_name")
+        # varchar_pattern_ops lets PostgreSQL use them for prefix searches
+        indexes = [
+            models.Index(fields=["last_name"],
+                         name="authors_last_name_prefix_idx",
+                         opclasses=["varchar_pattern_ops"]),
+            models.Index(fields=["first_name"],
+                         name="authors_first_name_prefix_idx",
+                         opclasses=["varchar_pattern_ops"]),
+        ]
 
     def __str__(self):
         return f"{self.last_name} {self.first_name}"
@@ -35,12 +44,15 @@ class BookReview(models.Model):
     review = models.TextField(verbose_name="Текст отзыва")
     created_at = models.DateTimeField(verbose_name="Дата создания",
                                       auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name="Дата изменения",
+                                      auto_now=True)
 
     class Meta:
         db_table = "reviews"
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
         unique_together = ("user_id", "book_id")
+        indexes = [models.Index(fields=["rating", "id"])]
 
     def __str__(self):
         return f"{self.id} {self.book.name}"
@@ -73,11 +85,289 @@ class Book(models.Model):
     description = models.TextField(verbose_name="Описание")
     created_at = models.DateTimeField(verbose_name="Дата создания",
                                       auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name="Дата изменения",
+                                      auto_now=True)
 
     class Meta:
         db_table = "books"
         verbose_name = "Книга"
         verbose_name_plural = "Книги"
+        indexes = [
+            models.Index(fields=["name"],
+                         name="books_name_prefix_idx",
+                         opclasses=["varchar_pattern_ops"])
+        ]
 
     def __str__(self):
         return self.name
+
+
+class OutboxEvent(models.Model):
+    """
+    Work queued in the same transaction as a write and processed later by
+    `manage.py process_outbox`.
+    """
+    topic = models.CharField(verbose_name="Тип события", max_length=100)
+    book_id = models.BigIntegerField(verbose_name="Книга")
+    payload = models.JSONField(verbose_name="Данные", default=dict)
+    attempts = models.PositiveSmallIntegerField(verbose_name="Попытки",
+                                                default=0)
+    created_at = models.DateTimeField(verbose_name="Дата создания",
+                                      auto_now_add=True)
+
+    class Meta:
+        db_table = "outbox_events"
+        verbose_name = "Событие"
+        verbose_name_plural = "События"
+
+    def __str__(self):
+        return f"{self.id} {self.topic}"
+
+
+class BookStats(models.Model):
+    """
+    Review statistics of a book, maintained incrementally by the outbox
+    worker and rebuilt with `manage.py rebuild_book_stats`.
+    """
+    book = models.OneToOneField("books.Book",
+                                verbose_name="Книга",
+                                related_name="stats",
+                                primary_key=True,
+                                on_delete=models.CASCADE)
+    rating_1 = models.PositiveIntegerField(verbose_name="Оценок 1", default=0)
+    rating_2 = models.PositiveIntegerField(verbose_name="Оценок 2", default=0)
+    rating_3 = models.PositiveIntegerField(verbose_name="Оценок 3", default=0)
+    rating_4 = models.PositiveIntegerField(verbose_name="Оценок 4", default=0)
+    rating_5 = models.PositiveIntegerField(verbose_name="Оценок 5", default=0)
+    review_count = models.PositiveIntegerField(verbose_name="Отзывов",
+                                               default=0)
+    rating_sum = models.PositiveBigIntegerField(verbose_name="Сумма оценок",
+                                                default=0)
+    recent_rating = models.FloatField(verbose_name="Скользящее среднее оценок",
+                                      default=0)
+    last_review_at = models.DateTimeField(verbose_name="Последний отзыв",
+                                          null=True,
+                                          blank=True)
+
+    class Meta:
+        db_table = "book_stats"
+        verbose_name = "Статистика книги"
+        verbose_name_plural = "Статистика книг"
+
+    def __str__(self):
+        return f"{self.book_id} {self.review_count}"
+
+
+class SimilarBook(models.Model):
+    """
+    Top-K neighbours of a book by co-favourite and co-review similarity,
+    built offline with `manage.py build_similar_books`.
+    """
+    book = models.ForeignKey("books.Book",
+                             verbose_name="Книга",
+                             related_name="similar_books",
+                             on_delete=models.CASCADE)
+    similar_book = models.ForeignKey("books.Book",
+                                     verbose_name="Похожая книга",
+                                     related_name="+",
+                                     on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField(verbose_name="Место")
+    score = models.FloatField(verbose_name="Сходство")
+
+    class Meta:
+        db_table = "similar_books"
+        verbose_name = "Похожая книга"
+        verbose_name_plural = "Похожие книги"
+        unique_together = ("book", "rank")
+
+    def __str__(self):
+        return f"{self.book_id} {self.rank} {self.similar_book_id}"
+
+
+class UserAffinity(models.Model):
+    """
+    How much a user likes each author and category, accumulated from their
+    favourites and reviews by the outbox worker. Keys are author and
+    category ids.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL,
+                                verbose_name="Пользователь",
+                                related_name="affinity",
+                                primary_key=True,
+                                on_delete=models.CASCADE)
+    authors = models.JSONField(verbose_name="Авторы", default=dict)
+    categories = models.JSONField(verbose_name="Категории", default=dict)
+    updated_at = models.DateTimeField(verbose_name="Дата обновления",
+                                      auto_now=True)
+
+    class Meta:
+        db_table = "user_affinities"
+        verbose_name = "Предпочтения пользователя"
+        verbose_name_plural = "Предпочтения пользователей"
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class BookListing(models.Model):
+    """
+    Denormalized row per book serving the book list without joins.
+    Kept up to date by books.signals and the outbox worker, rebuilt with
+    `manage.py rebuild_book_listing`.
+    """
+    book = models.OneToOneField("books.Book",
+                                verbose_name="Книга",
+                                related_name="listing",
+                                primary_key=True,
+                                on_delete=models.CASCADE)
+    name = models.CharField(verbose_name="Название", max_length=300)
+    author_id = models.BigIntegerField(verbose_name="Автор", db_index=True)
+    author_first_name = models.CharField(verbose_name="Имя автора",
+                                         max_length=200)
+    author_last_name = models.CharField(verbose_name="Фамилия автора",
+                                        max_length=200)
+    author_created_at = models.DateTimeField(
+        verbose_name="Дата создания автора")
+    category_name = models.CharField(verbose_name="Категория",
+                                     max_length=300,
+                                     db_index=True)
+    review_count = models.PositiveIntegerField(verbose_name="Отзывов",
+                                               default=0)
+    rating_sum = models.PositiveBigIntegerField(verbose_name="Сумма оценок",
+                                                default=0)
+    created_at = models.DateTimeField(verbose_name="Дата создания",
+                                      db_index=True)
+
+    class Meta:
+        db_table = "book_listing"
+        verbose_name = "Строка каталога"
+        verbose_name_plural = "Каталог"
+
+    def __str__(self):
+        return self.name
+
+
+class Change(models.Model):
+    """
+    Entry of the change log read by the delta sync endpoint. The id is the
+    change sequence, deletes are kept as tombstones. Favourites carry the
+    id of their user, other entities are visible to everyone.
+    """
+    entity = models.CharField(verbose_name="Сущность", max_length=20)
+    object_id = models.BigIntegerField(verbose_name="Объект")
+    user_id = models.BigIntegerField(verbose_name="Пользователь",
+                                     null=True,
+                                     blank=True)
+    deleted = models.BooleanField(verbose_name="Удален", default=False)
+    created_at = models.DateTimeField(verbose_name="Дата создания",
+                                      auto_now_add=True)
+
+    class Meta:
+        db_table = "changes"
+        verbose_name = "Изменение"
+        verbose_name_plural = "Изменения"
+
+    def __str__(self):
+        return f"{self.id} {self.entity} {self.object_id}"
+
+
+class PrunedChanges(models.Model):
+    """
+    Id of the last change log entry removed by prune_changes, in a single
+    row. Tokens before it may have missed changes.
+    """
+    last_id = models.BigIntegerField(verbose_name="Последнее удаленное",
+                                     default=0)
+    pruned_at = models.DateTimeField(verbose_name="Дата очистки",
+                                     auto_now=True)
+
+    class Meta:
+        db_table = "pruned_changes"
+        verbose_name = "Очистка журнала изменений"
+        verbose_name_plural = "Очистки журнала изменений"
+
+    def __str__(self):
+        return str(self.last_id)
+
+
+class ArchivedReview(models.Model):
+    """
+    Review moved out of the reviews table by `manage.py archive_reviews`,
+    with its id. The text is zlib compressed.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE,
+                             verbose_name="Автор отзыва",
+                             related_name="archived_reviews")
+    book = models.ForeignKey("books.Book",
+                             on_delete=models.CASCADE,
+                             verbose_name="Книга",
+                             related_name="archived_reviews")
+    rating = models.IntegerField(verbose_name="Рейтинг")
+    review = models.BinaryField(verbose_name="Текст отзыва")
+    created_at = models.DateTimeField(verbose_name="Дата создания")
+    updated_at = models.DateTimeField(verbose_name="Дата изменения")
+
+    class Meta:
+        db_table = "reviews_archive"
+        verbose_name = "Архивный отзыв"
+        verbose_name_plural = "Архивные отзывы"
+        unique_together = ("user_id", "book_id")
+        indexes = [models.Index(fields=["book", "id"])]
+
+    def __str__(self):
+        return f"{self.book_id} {self.user_id} {self.rating}"
+
+
+class ArchivedRatings(models.Model):
+    """
+    Ratings of the archived reviews of a book, added to the reviews table
+    wherever average ratings are computed from it.
+    """
+    book = models.OneToOneField("books.Book",
+                                verbose_name="Книга",
+                                related_name="archived_ratings",
+                                primary_key=True,
+                                on_delete=models.CASCADE)
+    review_count = models.PositiveIntegerField(verbose_name="Отзывов",
+                                               default=0)
+    rating_sum = models.PositiveBigIntegerField(verbose_name="Сумма оценок",
+                                                default=0)
+
+    class Meta:
+        db_table = "archived_ratings"
+        verbose_name = "Оценки архивных отзывов"
+        verbose_name_plural = "Оценки архивных отзывов"
+
+    def __str__(self):
+        return f"{self.book_id} {self.review_count}"
+
+
+class BackfillCheckpoint(models.Model):
+    """
+    Progress of a backfill run by `manage.py backfill`, see books.backfill.
+    """
+    name = models.CharField(verbose_name="Название",
+                            max_length=100,
+                            primary_key=True)
+    last_pk = models.BigIntegerField(verbose_name="Последний обработанный id",
+                                     default=0)
+    end_pk = models.BigIntegerField(verbose_name="Последний id на старте")
+    rows = models.PositiveBigIntegerField(verbose_name="Обработано строк",
+                                          default=0)
+    started_at = models.DateTimeField(verbose_name="Дата начала",
+                                      auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name="Дата изменения",
+                                      auto_now=True)
+    finished_at = models.DateTimeField(verbose_name="Дата завершения",
+                                       null=True,
+                                       blank=True)
+
+    class Meta:
+        db_table = "backfills"
+        verbose_name = "Заполнение данных"
+        verbose_name_plural = "Заполнения данных"
+
+    def __str__(self):
+        return f"{self.name} {self.last_pk}/{self.end_pk}"
@@ -0,0 +1,77 @@
+"""
+Local durable work queue.
+
+Writers call `publish` inside their own transaction, so an event exists if
+and only if the write committed. `process_batch`, driven by
+`manage.py process_outbox`, takes the oldest events, groups them per topic
+and book and hands every group to the registered handlers at once.
+"""
+import itertools
+import logging
+from typing import Callable
+
+from django.db import transaction
+from django.db.models import F
+
+from books import models
+
+REVIEW_CREATED = "review_created"
+FAVOURITE_ADDED = "favourite_added"
+
+MAX_ATTEMPTS = 5
+
+Handler = Callable[[int, list[models.OutboxEvent]], None]
+
+logger = logging.getLogger(__name__)
+
+_handlers: dict[str, list[Handler]] = {}
+
+
+def handler(topic: str) -> Callable[[Handler], Handler]:
+    """
+    Registers a function called with a book id and the batch of events of
+    `topic` for that book.
+    """
+
+    def register(fn: Handler) -> Handler:
+        _handlers.setdefault(topic, []).append(fn)
+        return fn
+
+    return register
+
+
+def publish(topic: str, book_id: int, payload: dict | None = None) -> None:
+    models.OutboxEvent.objects.create(topic=topic,
+                                      book_id=book_id,
+                                      payload=payload or {})
+
+
+def process_batch(batch_size: int = 500) -> int:
+    """
+    Processes up to `batch_size` pending events and returns how many were
+    taken. Events of a failing group stay queued and are retried until
+    MAX_ATTEMPTS.
+    """
+    with transaction.atomic():
+        events = list(
+            models.OutboxEvent.objects.select_for_update(
+                skip_locked=True).filter(
+                    attempts__lt=MAX_ATTEMPTS).order_by("id")[:batch_size])
+        events.sort(key=lambda event: (event.topic, event.book_id, event.id))
+        for (topic, book_id), group in itertools.groupby(
+                events, key=lambda event: (event.topic, event.book_id)):
+            group = list(group)
+            try:
+                with transaction.atomic():
+                    for fn in _handlers.get(topic, []):
+                        fn(book_id, group)
+            except Exception:
+                logger.exception("Outbox handlers failed for %s of book %s",
+                                 topic, book_id)
+                models.OutboxEvent.objects.filter(
+                    id__in=[event.id for event in group]).update(
+                        attempts=F("attempts") + 1)
+            else:
+                models.OutboxEvent.objects.filter(
+                    id__in=[event.id for event in group]).delete()
+    return len(events)
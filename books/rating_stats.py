@@ -0,0 +1,45 @@
+"""
+Rating statistics of a book (models.BookStats), folded in one rating at a
+time by the outbox worker and by the in-memory repository.
+"""
+import datetime
+
+from books import models
+from books.dtos import book as book_dtos
+
+RATINGS = (1, 2, 3, 4, 5)
+
+# Weight of the newest rating in BookStats.recent_rating
+RECENT_RATING_WEIGHT = 0.2
+
+
+def fold(stats_db: models.BookStats, rating: int,
+         created_at: datetime.datetime) -> None:
+    field = f"rating_{rating}"
+    setattr(stats_db, field, getattr(stats_db, field) + 1)
+    stats_db.review_count += 1
+    stats_db.rating_sum += rating
+    if stats_db.review_count == 1:
+        stats_db.recent_rating = rating
+    else:
+        stats_db.recent_rating += RECENT_RATING_WEIGHT * (
+            rating - stats_db.recent_rating)
+    if not stats_db.last_review_at or created_at > stats_db.last_review_at:
+        stats_db.last_review_at = created_at
+
+
+def to_dto(stats_db: models.BookStats) -> book_dtos.BookStats:
+    average_rating = 0.0
+    if stats_db.review_count:
+        average_rating = stats_db.rating_sum / stats_db.review_count
+    return book_dtos.BookStats(book_id=stats_db.book_id,
+                               histogram={
+                                   rating: getattr(stats_db,
+                                                   f"rating_{rating}")
+                                   for rating in RATINGS
+                               },
+                               review_count=stats_db.review_count,
+                               average_rating=average_rating,
+                               recent_rating=stats_db.recent_rating,
+                               trend=stats_db.recent_rating - average_rating,
+                               last_review_at=stats_db.last_review_at)
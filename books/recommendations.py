@@ -0,0 +1,135 @@
+"""
+Item-item similarity from user interactions and the personal feed.
+
+Interactions are (user_id, book_id) pairs, such as favourites and positive
+reviews. Books are compared by the cosine of their user sets,
+
+    similarity(a, b) = |users(a) & users(b)| / sqrt(|users(a)| * |users(b)|)
+
+computed with sparse matrix products over blocks of books, so memory stays
+bounded by the block size rather than the square of the catalogue.
+
+The feed scores every book of the catalogue for one user as the dot product
+of the user's affinity vector with the book's one-hot author and category
+features, plus its average rating. With one author and one category per
+book the product reduces to two gathers over the catalogue columns.
+"""
+from typing import Collection, Iterator
+
+import numpy as np
+from scipy import sparse
+
+from books.catalogue import Catalogue
+
+# (book_id, neighbour_ids, scores)
+Neighbours = tuple[int, np.ndarray, np.ndarray]
+
+AUTHOR_WEIGHT = 1.0
+CATEGORY_WEIGHT = 0.5
+RATING_WEIGHT = 0.2
+
+# Affinity a favourite adds to the author and category of its book
+FAVOURITE_AFFINITY = 1.0
+
+
+def review_affinity(rating: int) -> float:
+    """
+    Affinity a review adds to the author and category of its book, from -1
+    for one star to 1 for five stars.
+    """
+    return (rating - 3) / 2
+
+
+def similar_books(pairs: np.ndarray,
+                  top_k: int,
+                  min_common: int = 1,
+                  block_size: int = 1024) -> Iterator[Neighbours]:
+    """
+    Yields (book_id, neighbour_ids, scores) for every book with at least one
+    neighbour sharing `min_common` users, neighbours sorted by descending
+    score and cut to `top_k`.
+
+    `pairs` is an (n, 2) int64 array of (user_id, book_id), duplicates are
+    allowed.
+    """
+    if not len(pairs):
+        return
+    user_ids, user_index = np.unique(pairs[:, 0], return_inverse=True)
+    book_ids, book_index = np.unique(pairs[:, 1], return_inverse=True)
+
+    interactions = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (user_index, book_index)),
+        shape=(len(user_ids), len(book_ids)))
+    # Duplicated pairs were summed, only membership matters.
+    interactions.data[:] = 1
+    by_book = interactions.T.tocsr()
+    norms = np.sqrt(np.asarray(interactions.sum(axis=0)).ravel())
+
+    for start in range(0, len(book_ids), block_size):
+        stop = min(start + block_size, len(book_ids))
+        common = (by_book[start:stop] @ interactions).tocsr()
+        for row in range(stop - start):
+            book = start + row
+            begin, end = common.indptr[row], common.indptr[row + 1]
+            neighbours = common.indices[begin:end]
+            counts = common.data[begin:end]
+            keep = (neighbours != book) & (counts >= min_common)
+            neighbours, counts = neighbours[keep], counts[keep]
+            if not len(neighbours):
+                continue
+            scores = counts / (norms[book] * norms[neighbours])
+            if len(scores) > top_k:
+                best = np.argpartition(-scores, top_k - 1)[:top_k]
+                neighbours, scores = neighbours[best], scores[best]
+            order = np.argsort(-scores, kind="stable")
+            yield (int(book_ids[book]), book_ids[neighbours[order]],
+                   scores[order])
+
+
+def rank_feed(catalogue: Catalogue, authors: dict[int, float],
+              categories: dict[int, float], exclude: Collection[int],
+              limit: int) -> np.ndarray:
+    """
+    Returns the ids of the `limit` best scored books for a user with the
+    given author and category affinities, best first. Books in `exclude`
+    are left out.
+    """
+    if not len(catalogue.book_ids) or limit <= 0:
+        return np.empty(0, dtype=np.int64)
+    scores = (RATING_WEIGHT / 5) * catalogue.ratings
+    if authors:
+        scores += _dense_weights(authors, catalogue.author_ids,
+                                 AUTHOR_WEIGHT)[catalogue.author_ids]
+    if categories:
+        scores += _dense_weights(categories, catalogue.category_ids,
+                                 CATEGORY_WEIGHT)[catalogue.category_ids]
+    if exclude:
+        scores[catalogue.rows_of(np.fromiter(exclude,
+                                             dtype=np.int64))] = -np.inf
+
+    if limit < len(scores):
+        best = np.argpartition(-scores, limit - 1)[:limit]
+    else:
+        best = np.arange(len(scores))
+    best = best[np.argsort(-scores[best], kind="stable")]
+    best = best[np.isfinite(scores[best])]
+    return catalogue.book_ids[best]
+
+
+def _dense_weights(weights: dict[int, float], ids: np.ndarray,
+                   scale: float) -> np.ndarray:
+    """
+    Spreads sparse weights over an array indexed by id, normalised so that
+    their absolute values sum to `scale`.
+    """
+    dense = np.zeros(int(ids.max()) + 1, dtype=np.float32)
+    keys = np.fromiter(weights.keys(), dtype=np.int64, count=len(weights))
+    values = np.fromiter(weights.values(),
+                         dtype=np.float32,
+                         count=len(weights))
+    total = np.abs(values).sum()
+    if not total:
+        return dense
+    keep = (keys >= 0) & (keys < len(dense))
+    dense[keys[keep]] = values[keep] * (scale / total)
+    return dense
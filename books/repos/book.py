@@ -1,51 +1,305 @@
 import abc
 import datetime
+import heapq
+import itertools
+import zlib
+from typing import Container, Iterable, Iterator
 
+import numpy as np
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Avg, ObjectDoesNotExist, Case, When
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.db.models import Count, Exists, F, Max, ObjectDoesNotExist, OuterRef, Q, QuerySet, Sum, Window
 from django.db.models import FloatField
+from django.db.models.functions import Cast, Coalesce, Floor, NullIf, RowNumber
 
+from books.caches.book_detail import book_detail_cache
+from books.caches.favourites import favourites_cache
+from books.caches.lookups import lookups_cache
 from books.dtos import book as book_dtos
+from books.caches.catalogue import catalogue_cache
+from books.catalogue import Catalogue, to_timestamp
+from books.recommendations import Neighbours
+from books.suggest import SuggestBook, SuggestIndex
+from books.exceptions import AlreadyExistsException, ChangesExpiredException
+from books import changes
 from books import models
+from books import outbox
+from books import rating_stats
 
 User = get_user_model()
 
+# Seconds a change log entry waits before it is served, see get_changes
+CHANGES_SETTLE_SECONDS = 2
+
+# Books hydrated per query, below the bound parameter limit of SQLite
+HYDRATE_BATCH_SIZE = 1000
+
 
 class IBookRepository(abc.ABC):
 
-    def list_books(self, user: book_dtos.User,
+    def list_books(self, user: book_dtos.User | None,
                    created_before: datetime.datetime | None,
                    created_after: datetime.datetime | None,
                    authors: list[int] | None,
                    categories: list[str] | None) -> list[book_dtos.BookInfo]:
+        """
+        Filters with the in-process catalogue index when
+        settings.BOOKS_LIST_FROM_INDEX is set, reads the book_listing table
+        when settings.BOOKS_LIST_FROM_LISTING is set, and the normalized
+        tables otherwise. Without a user `favourite` is always False.
+        """
         raise NotImplementedError
 
-    def get_book_detail(self, user: book_dtos.User,
+    def count_facets(self, facets: list[str],
+                     created_before: datetime.datetime | None,
+                     created_after: datetime.datetime | None,
+                     authors: list[int] | None,
+                     categories: list[str] | None) -> book_dtos.Facets:
+        """
+        Counts the books matching the filters of list_books per value of
+        each requested facet (see book_dtos.FACETS). Rating buckets follow
+        the rating statistics, new reviews count once the outbox worker has
+        applied them.
+        """
+        raise NotImplementedError
+
+    def refresh_book_listings(self, book_ids: list[int]) -> None:
+        """
+        Rewrites the book_listing rows of the books from the normalized
+        tables.
+        """
+        raise NotImplementedError
+
+    def refresh_listing_ratings(self, book_id: int) -> None:
+        """
+        Recounts the ratings of a book in its book_listing row, if it has
+        one.
+        """
+        raise NotImplementedError
+
+    def rebuild_book_listing(self, batch_size: int) -> int:
+        """
+        Rewrites every book_listing row, returns the number of books.
+        """
+        raise NotImplementedError
+
+    def find_stale_listings(self, batch_size: int) -> list[int]:
+        """
+        Returns the ids of books whose book_listing row is missing or
+        differs from the normalized tables.
+        """
+        raise NotImplementedError
+
+    def get_book_detail(self, user: book_dtos.User | None,
                         book_id: int) -> book_dtos.BookDetail:
+        """
+        Without a user the detail is user independent and `favourite` is
+        always False.
+        """
+        raise NotImplementedError
+
+    def get_book_details(
+            self, user: book_dtos.User, book_ids: list[int],
+            reviews_limit: int) -> list[book_dtos.BookDetail | None]:
+        """
+        Returns details in the order of `book_ids`, with None in place of
+        books that do not exist. Only the top `reviews_limit` reviews of
+        each book are included.
+        """
+        raise NotImplementedError
+
+    def get_book_stats(self, book_id: int) -> book_dtos.BookStats:
+        raise NotImplementedError
+
+    def update_book_stats(
+            self, book_id: int,
+            ratings: list[tuple[int, datetime.datetime]]) -> None:
+        """
+        Folds new (rating, created_at) pairs into the stats of a book.
+        """
+        raise NotImplementedError
+
+    def rebuild_book_stats(self, batch_size: int) -> int:
+        """
+        Recomputes the stats of every book from its reviews, returns the
+        number of books with reviews. Reviews still queued for the outbox
+        worker are left to it, so they are not counted twice.
+        """
+        raise NotImplementedError
+
+    def get_similar_books(self, user: book_dtos.User,
+                          book_id: int) -> list[book_dtos.BookInfo]:
+        """
+        Returns the precomputed neighbours of a book, most similar first.
+        """
+        raise NotImplementedError
+
+    def get_interactions(self, min_rating: int) -> np.ndarray:
+        """
+        Returns an (n, 2) array of (user_id, book_id) pairs for favourites
+        and reviews rated at least `min_rating`.
+        """
+        raise NotImplementedError
+
+    def replace_similar_books(self, similar: Iterable[Neighbours],
+                              batch_size: int) -> int:
+        """
+        Replaces all neighbour lists with (book_id, neighbour_ids, scores)
+        rows, returns the number of neighbours saved.
+        """
+        raise NotImplementedError
+
+    def get_catalogue(self, book_ids: list[int] | None = None) -> Catalogue:
+        """
+        Loads the catalogue columns of the given books, or of every book.
+        """
+        raise NotImplementedError
+
+    def get_suggest_index(self,
+                          book_ids: list[int] | None = None) -> SuggestIndex:
+        """
+        Builds the typeahead index of the given books, or of every book.
+        """
+        raise NotImplementedError
+
+    def get_books(self, user: book_dtos.User | None,
+                  book_ids: list[int]) -> list[book_dtos.BookInfo]:
+        """
+        Returns the books in the order of `book_ids`, skipping books that
+        do not exist.
+        """
+        raise NotImplementedError
+
+    def get_user_affinity(self, user_id: int) -> book_dtos.UserAffinity:
+        raise NotImplementedError
+
+    def update_user_affinities(self, book_id: int,
+                               weights: list[tuple[int, float]]) -> None:
+        """
+        Adds each (user_id, weight) to the user's affinity for the author
+        and the category of the book.
+        """
+        raise NotImplementedError
+
+    def get_favourite_ids(self, user_id: int) -> list[int]:
+        raise NotImplementedError
+
+    def get_change_token(self) -> str:
+        """
+        Returns the token of the latest change, to take before downloading
+        the full catalogue.
+        """
+        raise NotImplementedError
+
+    def get_changes(self, user: book_dtos.User | None, since: int,
+                    limit: int) -> book_dtos.ChangeSet:
+        """
+        Returns up to `limit` changes after the change `since`, merged per
+        object and loaded in their current state. Without a user only the
+        changes visible to everyone are returned. Raises
+        ChangesExpiredException when changes after `since` were pruned.
+        """
         raise NotImplementedError
 
     def add_to_favourite(self, user_id: int, book_id: int) -> None:
+        """
+        Raises AlreadyExistsException when the book is already a favourite
+        and ObjectDoesNotExist when there is no such book.
+        """
         raise NotImplementedError
 
     def create_review(self, user: book_dtos.User,
                       review: book_dtos.BookReview) -> book_dtos.BookReview:
+        """
+        Raises AlreadyExistsException when the user has already reviewed
+        the book and ObjectDoesNotExist when there is no such book.
+        """
         raise NotImplementedError
 
     def get_book_review(self, user_id: int,
                         book_id: int) -> book_dtos.BookReview | None:
         raise NotImplementedError
 
+    def get_book_reviews(self, book_id: int, before: int | None,
+                         limit: int) -> book_dtos.ReviewPage:
+        """
+        Returns the reviews of a book with ids below `before`, newest
+        first, archived reviews included. Raises ObjectDoesNotExist when
+        there is no such book.
+        """
+        raise NotImplementedError
+
+    def archive_reviews(self, created_before: datetime.datetime,
+                        batch_size: int) -> int:
+        """
+        Moves the reviews created before `created_before` to the archive,
+        returns their number.
+        """
+        raise NotImplementedError
+
+    def prune_changes(self, created_before: datetime.datetime,
+                      batch_size: int) -> int:
+        """
+        Removes the change log entries made before `created_before`,
+        returns their number.
+        """
+        raise NotImplementedError
+
     def is_user_favourite(self, user_id: int, book_id: int) -> bool:
         raise NotImplementedError
 
 
 class BookRepository(IBookRepository):
 
-    def list_books(self, user: book_dtos.User,
+    def list_books(self, user: book_dtos.User | None,
                    created_before: datetime.datetime | None,
                    created_after: datetime.datetime | None,
                    authors: list[int] | None,
                    categories: list[str] | None) -> list[book_dtos.BookInfo]:
+        lookups = lookups_cache.snapshot()
+        if settings.BOOKS_LIST_FROM_INDEX:
+            category_ids = None
+            if categories:
+                category_ids = lookups.category_ids(categories)
+            book_ids = catalogue_cache.get(self.get_catalogue).filter(
+                created_before=created_before,
+                created_after=created_after,
+                author_ids=authors or None,
+                category_ids=category_ids)
+            return self.get_books(user=user, book_ids=book_ids.tolist())
+        if settings.BOOKS_LIST_FROM_LISTING:
+            return self._list_books_from_listing(user=user,
+                                                 created_before=created_before,
+                                                 created_after=created_after,
+                                                 authors=authors,
+                                                 categories=categories)
+        book_qs = self._filter_books(created_before=created_before,
+                                     created_after=created_after,
+                                     authors=authors,
+                                     categories=categories)
+        book_qs = book_qs.annotate(avg_rating=_average_rating())
+        favourites = self._favourites(user)
+        books = []
+        for book in book_qs.values("id", "name", "author_id", "category_id",
+                                   "avg_rating"):
+            books.append(
+                book_dtos.BookInfo(author=lookups.author(book["author_id"]),
+                                   category=lookups.category(
+                                       book["category_id"]).name,
+                                   name=book["name"],
+                                   id=book["id"],
+                                   favourite=book["id"] in favourites,
+                                   average_rating=book["avg_rating"]))
+        return books
+
+    def _list_books_from_listing(
+            self, user: book_dtos.User | None,
+            created_before: datetime.datetime | None,
+            created_after: datetime.datetime | None, authors: list[int] | None,
+            categories: list[str] | None) -> list[book_dtos.BookInfo]:
         filters = {}
         if created_before:
             filters["created_at__lte"] = created_before
@@ -54,41 +308,178 @@ class BookRepository(IBookRepository):
         if authors:
             filters["author_id__in"] = authors
         if categories:
-            filters["category__name__in"] = categories
-
-        book_qs = models.Book.objects.all()
-        if filters:
-            book_qs = book_qs.filter(**filters)
+            filters["category_name__in"] = categories
 
-        user = User.objects.get(id=user.id)
-        book_qs = book_qs.annotate(avg_rating=Avg(
-            'reviews__rating', output_field=FloatField(), default=0)).annotate(
-                is_favourite=Case(When(users=user, then=True),
-                                  default=False,
-                                  output_field=FloatField()))
+        listing_qs = models.BookListing.objects.filter(
+            **filters).order_by("book_id")
+        favourites = self._favourites(user)
         books = []
-        for book in book_qs.all():
-            author_dto = book_dtos.Author(author_id=book.author.id,
-                                          first_name=book.author.first_name,
-                                          last_name=book.author.last_name,
-                                          created_at=book.author.created_at)
+        for row in listing_qs.values("book_id", "name", "author_id",
+                                     "author_first_name", "author_last_name",
+                                     "author_created_at", "category_name",
+                                     "rating_sum", "review_count"):
+            average_rating = 0.0
+            if row["review_count"]:
+                average_rating = row["rating_sum"] / row["review_count"]
             books.append(
-                book_dtos.BookInfo(author=author_dto,
-                                   category=book.category.name,
-                                   name=book.name,
-                                   id=book.id,
-                                   favourite=book.is_favourite,
-                                   average_rating=book.avg_rating))
+                book_dtos.BookInfo(author=book_dtos.Author(
+                    author_id=row["author_id"],
+                    first_name=row["author_first_name"],
+                    last_name=row["author_last_name"],
+                    created_at=row["author_created_at"]),
+                                   category=row["category_name"],
+                                   name=row["name"],
+                                   id=row["book_id"],
+                                   favourite=row["book_id"] in favourites,
+                                   average_rating=average_rating))
         return books
 
-    def get_book_detail(self, user: book_dtos.User,
+    def refresh_book_listings(self, book_ids: list[int]) -> None:
+        self._save_book_listings(
+            list(
+                self._build_book_listings(
+                    models.Book.objects.filter(id__in=book_ids))))
+
+    def refresh_listing_ratings(self, book_id: int) -> None:
+        ratings = models.BookReview.objects.filter(book_id=book_id).aggregate(
+            rating_sum=Sum("rating", default=0), review_count=Count("id"))
+        archived = models.ArchivedRatings.objects.filter(
+            book_id=book_id).values("rating_sum", "review_count").first()
+        if archived:
+            ratings["rating_sum"] += archived["rating_sum"]
+            ratings["review_count"] += archived["review_count"]
+        models.BookListing.objects.filter(book_id=book_id).update(**ratings)
+
+    def rebuild_book_listing(self, batch_size: int) -> int:
+        rebuilt = 0
+        for batch in self._book_listing_batches(batch_size):
+            self._save_book_listings(batch)
+            rebuilt += len(batch)
+        models.BookListing.objects.filter(~Exists(
+            models.Book.objects.filter(id=OuterRef("book_id")))).delete()
+        return rebuilt
+
+    def find_stale_listings(self, batch_size: int) -> list[int]:
+        fields = [
+            field.attname for field in models.BookListing._meta.concrete_fields
+        ]
+        stale = []
+        for batch in self._book_listing_batches(batch_size):
+            stored = {
+                row["book_id"]: row
+                for row in models.BookListing.objects.filter(
+                    book_id__in=[listing.book_id
+                                 for listing in batch]).values(*fields)
+            }
+            stale.extend(listing.book_id for listing in batch
+                         if stored.get(listing.book_id) !=
+                         {field: getattr(listing, field)
+                          for field in fields})
+        return stale
+
+    def _book_listing_batches(
+            self, batch_size: int) -> Iterator[list[models.BookListing]]:
+        last_id = 0
+        while True:
+            batch = list(
+                self._build_book_listings(
+                    models.Book.objects.filter(
+                        id__gt=last_id).order_by("id")[:batch_size]))
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1].book_id
+
+    def _build_book_listings(
+            self,
+            book_qs: QuerySet[models.Book]) -> Iterator[models.BookListing]:
+        book_qs = book_qs.annotate(
+            rating_sum=Sum("reviews__rating", default=0) +
+            Coalesce("archived_ratings__rating_sum", 0),
+            review_count=Count("reviews") +
+            Coalesce("archived_ratings__review_count", 0))
+        for row in book_qs.values("id", "name", "created_at", "author_id",
+                                  "author__first_name", "author__last_name",
+                                  "author__created_at", "category__name",
+                                  "rating_sum", "review_count"):
+            yield models.BookListing(
+                book_id=row["id"],
+                name=row["name"],
+                author_id=row["author_id"],
+                author_first_name=row["author__first_name"],
+                author_last_name=row["author__last_name"],
+                author_created_at=row["author__created_at"],
+                category_name=row["category__name"],
+                rating_sum=row["rating_sum"],
+                review_count=row["review_count"],
+                created_at=row["created_at"])
+
+    def _save_book_listings(self, batch: list[models.BookListing]) -> None:
+        models.BookListing.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=["book"],
+            update_fields=[
+                field.name
+                for field in models.BookListing._meta.concrete_fields
+                if not field.primary_key
+            ])
+
+    def count_facets(self, facets: list[str],
+                     created_before: datetime.datetime | None,
+                     created_after: datetime.datetime | None,
+                     authors: list[int] | None,
+                     categories: list[str] | None) -> book_dtos.Facets:
+        lookups = lookups_cache.snapshot()
+        book_qs = self._filter_books(created_before=created_before,
+                                     created_after=created_after,
+                                     authors=authors,
+                                     categories=categories).order_by()
+        result: book_dtos.Facets = {}
+        if "category" in facets:
+            result["category"] = [
+                book_dtos.FacetValue(id=row["category_id"],
+                                     name=lookups.category(
+                                         row["category_id"]).name,
+                                     count=row["count"])
+                for row in book_qs.values("category_id").annotate(
+                    count=Count("id")).order_by("-count")
+            ]
+        if "author" in facets:
+            result["author"] = [
+                book_dtos.FacetValue(id=row["author_id"],
+                                     name=lookups.author(
+                                         row["author_id"]).full_name,
+                                     count=row["count"])
+                for row in book_qs.values("author_id").annotate(
+                    count=Count("id")).order_by("-count")
+            ]
+        if "rating_bucket" in facets:
+            # From the rating statistics: averaging the reviews here would
+            # aggregate them for every matching book on each request.
+            average = Coalesce(
+                Cast("stats__rating_sum", FloatField()) /
+                NullIf("stats__review_count", 0), 0.0)
+            result["rating_bucket"] = [
+                book_dtos.FacetValue(id=int(row["bucket"]),
+                                     name=str(int(row["bucket"])),
+                                     count=row["count"])
+                for row in book_qs.annotate(
+                    bucket=Floor(average)).values("bucket").annotate(
+                        count=Count("id")).order_by("-bucket")
+            ]
+        return result
+
+    def get_book_detail(self, user: book_dtos.User | None,
                         book_id: int) -> book_dtos.BookDetail:
-        book_db = models.Book.objects.get(id=book_id)
+        lookups = lookups_cache.snapshot()
+        book_db = models.Book.objects.annotate(
+            avg_rating=_average_rating()).get(id=book_id)
 
-        is_favourite = book_db.users.filter(id=user.id).exists()
-        average_rating = book_db.reviews.aggregate(
-            avg_rating=Avg('rating', default=0))
+        is_favourite = bool(user) and book_db.id in favourites_cache.get(
+            user.id)
 
+        # Archived reviews are only read page by page, see get_book_reviews.
         reviews = [
             book_dtos.BookReview(book_id=book_db.id,
                                  rating=review.rating,
@@ -97,26 +488,415 @@ class BookRepository(IBookRepository):
             for review in models.BookReview.objects.filter(book=book_db)
         ]
 
-        author_db = book_db.author
-        author = book_dtos.Author(author_id=author_db.id,
-                                  first_name=author_db.first_name,
-                                  last_name=author_db.last_name,
-                                  created_at=author_db.created_at)
-
-        return book_dtos.BookDetail(
-            id=book_db.id,
-            name=book_db.name,
-            category=book_db.category.name,
-            description=book_db.description,
-            created_at=book_db.created_at,
-            author=author,
-            reviews=reviews,
-            favourite=is_favourite,
-            average_rating=average_rating.get("avg_rating"))
+        return book_dtos.BookDetail(id=book_db.id,
+                                    name=book_db.name,
+                                    category=lookups.category(
+                                        book_db.category_id).name,
+                                    description=book_db.description,
+                                    created_at=book_db.created_at,
+                                    author=lookups.author(book_db.author_id),
+                                    reviews=reviews,
+                                    favourite=is_favourite,
+                                    average_rating=book_db.avg_rating)
+
+    def get_book_details(
+            self, user: book_dtos.User, book_ids: list[int],
+            reviews_limit: int) -> list[book_dtos.BookDetail | None]:
+        lookups = lookups_cache.snapshot()
+        books_qs = models.Book.objects.filter(id__in=book_ids).annotate(
+            avg_rating=_average_rating())
+
+        reviews_qs = models.BookReview.objects.filter(
+            book_id__in=book_ids).annotate(position=Window(
+                RowNumber(),
+                partition_by=F("book_id"),
+                order_by=(F("rating").desc(), F("created_at").desc()),
+            )).filter(position__lte=reviews_limit).order_by(
+                "book_id", "position")
+        reviews: dict[int, list[book_dtos.BookReview]] = {}
+        for review in reviews_qs.values("book_id", "rating", "review",
+                                        "created_at"):
+            reviews.setdefault(review["book_id"],
+                               []).append(book_dtos.BookReview(**review))
+
+        favourites = favourites_cache.get(user.id)
+        details = {
+            book_db.id:
+            book_dtos.BookDetail(id=book_db.id,
+                                 name=book_db.name,
+                                 category=lookups.category(
+                                     book_db.category_id).name,
+                                 description=book_db.description,
+                                 created_at=book_db.created_at,
+                                 author=lookups.author(book_db.author_id),
+                                 reviews=reviews.get(book_db.id, []),
+                                 favourite=book_db.id in favourites,
+                                 average_rating=book_db.avg_rating)
+            for book_db in books_qs
+        }
+        return [details.get(book_id) for book_id in book_ids]
 
     def is_user_favourite(self, user_id: int, book_id: int) -> bool:
-        return User.objects.get(id=user_id).favourites.filter(
-            id=book_id).exists()
+        return book_id in favourites_cache.get(user_id)
+
+    def get_book_stats(self, book_id: int) -> book_dtos.BookStats:
+        try:
+            stats_db = models.BookStats.objects.get(book_id=book_id)
+        except ObjectDoesNotExist:
+            # No reviews processed yet, only a missing book is an error.
+            models.Book.objects.only("id").get(id=book_id)
+            stats_db = models.BookStats(book_id=book_id)
+
+        return rating_stats.to_dto(stats_db)
+
+    def update_book_stats(
+            self, book_id: int,
+            ratings: list[tuple[int, datetime.datetime]]) -> None:
+        with transaction.atomic():
+            models.BookStats.objects.get_or_create(book_id=book_id)
+            stats_db = models.BookStats.objects.select_for_update().get(
+                book_id=book_id)
+            for rating, created_at in ratings:
+                rating_stats.fold(stats_db, rating, created_at)
+            stats_db.save()
+
+    def rebuild_book_stats(self, batch_size: int) -> int:
+        rebuilt = 0
+        last_id = 0
+        while True:
+            book_ids = list(
+                models.Book.objects.filter(
+                    id__gt=last_id).order_by("id").values_list(
+                        "id", flat=True)[:batch_size])
+            if not book_ids:
+                return rebuilt
+            rebuilt += self._rebuild_book_stats(book_ids)
+            last_id = book_ids[-1]
+
+    def _rebuild_book_stats(self, book_ids: list[int]) -> int:
+        # Reviews whose REVIEW_CREATED event is still queued are left out,
+        # the outbox worker folds them in afterwards.
+        with transaction.atomic():
+            # Locked before the reviews are read: a worker folding ratings
+            # into these books has either committed and deleted its events,
+            # or waits for the rebuild with its events still queued.
+            models.BookStats.objects.bulk_create(
+                (models.BookStats(book_id=book_id) for book_id in book_ids),
+                ignore_conflicts=True)
+            list(models.BookStats.objects.select_for_update().filter(
+                book_id__in=book_ids).values_list("book_id"))
+            # Archived reviews come first within a book, they are the oldest.
+            reviews = list(
+                heapq.merge(
+                    *(model.objects.filter(book_id__in=book_ids).order_by(
+                        "book_id", "created_at", "id").values_list(
+                            "book_id", "created_at", "id", "rating")
+                      for model in (models.ArchivedReview,
+                                    models.BookReview))))
+            # Read after the reviews, so an event queued in between belongs
+            # to a review that was not counted. Events given up on are
+            # never folded, their reviews are counted.
+            queued = dict(
+                models.OutboxEvent.objects.filter(
+                    topic=outbox.REVIEW_CREATED,
+                    book_id__in=book_ids,
+                    attempts__lt=outbox.MAX_ATTEMPTS).values_list(
+                        "payload__review_id", "book_id"))
+
+            stats = {
+                book_id: models.BookStats(book_id=book_id)
+                for book_id in book_ids
+            }
+            for book_id, created_at, review_id, rating in reviews:
+                if review_id not in queued:
+                    rating_stats.fold(stats[book_id], rating, created_at)
+            kept = [
+                stats_db for stats_db in stats.values() if
+                stats_db.review_count or stats_db.book_id in queued.values()
+            ]
+            models.BookStats.objects.bulk_update(kept, [
+                field.name for field in models.BookStats._meta.concrete_fields
+                if not field.primary_key
+            ])
+            # bulk_update does not send post_save, see books.signals
+            changes.record(changes.STATS,
+                           [stats_db.book_id for stats_db in kept])
+            models.BookStats.objects.filter(book_id__in=book_ids).exclude(
+                book_id__in=[stats_db.book_id for stats_db in kept]).delete()
+        return len(kept)
+
+    def get_similar_books(self, user: book_dtos.User,
+                          book_id: int) -> list[book_dtos.BookInfo]:
+        lookups = lookups_cache.snapshot()
+        rows = models.SimilarBook.objects.filter(
+            book_id=book_id).order_by("rank").values(
+                "similar_book_id", "similar_book__name",
+                "similar_book__author_id", "similar_book__category_id",
+                "similar_book__stats__rating_sum",
+                "similar_book__stats__review_count")
+        favourites = favourites_cache.get(user.id)
+        books = []
+        for row in rows:
+            average_rating = 0.0
+            if row["similar_book__stats__review_count"]:
+                average_rating = (row["similar_book__stats__rating_sum"] /
+                                  row["similar_book__stats__review_count"])
+            books.append(
+                book_dtos.BookInfo(
+                    id=row["similar_book_id"],
+                    name=row["similar_book__name"],
+                    author=lookups.author(row["similar_book__author_id"]),
+                    category=lookups.category(
+                        row["similar_book__category_id"]).name,
+                    favourite=row["similar_book_id"] in favourites,
+                    average_rating=average_rating))
+        if not books:
+            models.Book.objects.only("id").get(id=book_id)
+        return books
+
+    def get_interactions(self, min_rating: int) -> np.ndarray:
+        favourites = User.favourites.through.objects.values_list(
+            "customuser_id", "book_id")
+        reviews = models.BookReview.objects.filter(
+            rating__gte=min_rating).values_list("user_id", "book_id")
+        archived_reviews = models.ArchivedReview.objects.filter(
+            rating__gte=min_rating).values_list("user_id", "book_id")
+        pairs = itertools.chain.from_iterable(
+            itertools.chain(favourites.iterator(chunk_size=10_000),
+                            reviews.iterator(chunk_size=10_000),
+                            archived_reviews.iterator(chunk_size=10_000)))
+        return np.fromiter(pairs, dtype=np.int64).reshape(-1, 2)
+
+    def replace_similar_books(self, similar: Iterable[Neighbours],
+                              batch_size: int) -> int:
+        saved = 0
+        batch: list[models.SimilarBook] = []
+        with transaction.atomic():
+            models.SimilarBook.objects.all().delete()
+            for book_id, neighbour_ids, scores in similar:
+                batch.extend(
+                    models.SimilarBook(book_id=book_id,
+                                       similar_book_id=int(neighbour_id),
+                                       rank=rank,
+                                       score=float(score))
+                    for rank, (neighbour_id, score) in enumerate(
+                        zip(neighbour_ids, scores), start=1))
+                if len(batch) >= batch_size:
+                    models.SimilarBook.objects.bulk_create(batch)
+                    saved += len(batch)
+                    batch = []
+            models.SimilarBook.objects.bulk_create(batch)
+        return saved + len(batch)
+
+    def get_catalogue(self, book_ids: list[int] | None = None) -> Catalogue:
+        book_qs = models.Book.objects.all()
+        if book_ids is not None:
+            book_qs = book_qs.filter(id__in=book_ids)
+        rows = book_qs.order_by("id").values_list("id", "author_id",
+                                                  "category_id",
+                                                  "stats__rating_sum",
+                                                  "stats__review_count",
+                                                  "created_at")
+        ids, author_ids, category_ids, ratings, created_at = [], [], [], [], []
+        for row in rows.iterator(chunk_size=10_000):
+            rating_sum, review_count = row[3], row[4]
+            ids.append(row[0])
+            author_ids.append(row[1])
+            category_ids.append(row[2])
+            ratings.append(rating_sum / review_count if review_count else 0)
+            created_at.append(to_timestamp(row[5]))
+        return Catalogue.from_columns(book_ids=np.array(ids, dtype=np.int64),
+                                      author_ids=np.array(author_ids,
+                                                          dtype=np.int64),
+                                      category_ids=np.array(category_ids,
+                                                            dtype=np.int64),
+                                      ratings=np.array(ratings,
+                                                       dtype=np.float32),
+                                      created_at=np.array(created_at,
+                                                          dtype=np.int64))
+
+    def get_suggest_index(self,
+                          book_ids: list[int] | None = None) -> SuggestIndex:
+        lookups = lookups_cache.snapshot()
+        book_qs = models.Book.objects.all()
+        if book_ids is not None:
+            book_qs = book_qs.filter(id__in=book_ids)
+        rows = book_qs.values_list("id", "name", "author_id", "category_id",
+                                   "stats__rating_sum", "stats__review_count")
+        return SuggestIndex.from_books(
+            SuggestBook(id=row[0],
+                        name=row[1],
+                        author_id=row[2],
+                        author_name=lookups.author(row[2]).full_name,
+                        category_id=row[3],
+                        category_name=lookups.category(row[3]).name,
+                        rating_sum=row[4] or 0,
+                        review_count=row[5] or 0)
+            for row in rows.iterator(chunk_size=10_000))
+
+    def get_books(self, user: book_dtos.User | None,
+                  book_ids: list[int]) -> list[book_dtos.BookInfo]:
+        lookups = lookups_cache.snapshot()
+        favourites = self._favourites(user)
+        books = {}
+        for start in range(0, len(book_ids), HYDRATE_BATCH_SIZE):
+            rows = models.Book.objects.filter(
+                id__in=book_ids[start:start + HYDRATE_BATCH_SIZE]).values(
+                    "id", "name", "author_id", "category_id",
+                    "stats__rating_sum", "stats__review_count")
+            for row in rows:
+                average_rating = 0.0
+                if row["stats__review_count"]:
+                    average_rating = (row["stats__rating_sum"] /
+                                      row["stats__review_count"])
+                books[row["id"]] = book_dtos.BookInfo(
+                    id=row["id"],
+                    name=row["name"],
+                    author=lookups.author(row["author_id"]),
+                    category=lookups.category(row["category_id"]).name,
+                    favourite=row["id"] in favourites,
+                    average_rating=average_rating)
+        return [books[book_id] for book_id in book_ids if book_id in books]
+
+    def get_user_affinity(self, user_id: int) -> book_dtos.UserAffinity:
+        try:
+            affinity_db = models.UserAffinity.objects.get(user_id=user_id)
+        except ObjectDoesNotExist:
+            return book_dtos.UserAffinity(user_id=user_id)
+        return book_dtos.UserAffinity(
+            user_id=user_id,
+            authors={
+                int(author_id): weight
+                for author_id, weight in affinity_db.authors.items()
+            },
+            categories={
+                int(category_id): weight
+                for category_id, weight in affinity_db.categories.items()
+            })
+
+    def update_user_affinities(self, book_id: int,
+                               weights: list[tuple[int, float]]) -> None:
+        book_db = models.Book.objects.filter(id=book_id).only(
+            "author_id", "category_id").first()
+        if book_db is None:
+            return
+        author_key = str(book_db.author_id)
+        category_key = str(book_db.category_id)
+        with transaction.atomic():
+            for user_id, weight in weights:
+                models.UserAffinity.objects.get_or_create(user_id=user_id)
+                affinity_db = models.UserAffinity.objects.select_for_update(
+                ).get(user_id=user_id)
+                affinity_db.authors[author_key] = affinity_db.authors.get(
+                    author_key, 0) + weight
+                affinity_db.categories[
+                    category_key] = affinity_db.categories.get(
+                        category_key, 0) + weight
+                affinity_db.save()
+
+    def get_favourite_ids(self, user_id: int) -> list[int]:
+        return list(favourites_cache.get(user_id))
+
+    def get_change_token(self) -> str:
+        # Taken behind the settle window like get_changes, so changes in
+        # flight are served again rather than skipped.
+        last_id = models.Change.objects.filter(
+            created_at__lte=_changes_settled_at()).aggregate(
+                last_id=Max("id"))["last_id"]
+        return str(max(last_id or 0, changes.pruned_through()))
+
+    def get_changes(self, user: book_dtos.User | None, since: int,
+                    limit: int) -> book_dtos.ChangeSet:
+        lookups = lookups_cache.snapshot()
+        # Sequence numbers are taken at insert and become visible at commit,
+        # so the newest entries are held back until concurrent transactions
+        # that took lower numbers have committed.
+        rows = list(
+            models.Change.objects.filter(
+                Q(user_id__isnull=True)
+                | Q(user_id=user.id if user else None),
+                id__gt=since,
+                created_at__lte=_changes_settled_at()).order_by(
+                    "id").values_list("id", "entity", "object_id",
+                                      "deleted")[:limit + 1])
+        # Read after the entries, a pruning that removed some of them has
+        # committed by then.
+        if since < changes.pruned_through():
+            raise ChangesExpiredException(message=changes.EXPIRED_MESSAGE)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        live, deleted = changes.merge(row[1:] for row in rows)
+
+        change_set = book_dtos.ChangeSet(
+            token=str(rows[-1][0] if rows else since), has_more=has_more)
+        favourites = self._favourites(user)
+        found_books = set()
+        for book_db in models.Book.objects.filter(
+                id__in=live.get(changes.BOOK, [])).select_related("stats"):
+            found_books.add(book_db.id)
+            stats_db = getattr(book_db, "stats", None)
+            average_rating = 0.0
+            if stats_db and stats_db.review_count:
+                average_rating = stats_db.rating_sum / stats_db.review_count
+            change_set.books.append(
+                book_dtos.BookDetail(id=book_db.id,
+                                     name=book_db.name,
+                                     category=lookups.category(
+                                         book_db.category_id).name,
+                                     description=book_db.description,
+                                     created_at=book_db.created_at,
+                                     updated_at=book_db.updated_at,
+                                     author=lookups.author(book_db.author_id),
+                                     favourite=book_db.id in favourites,
+                                     average_rating=average_rating))
+        change_set.reviews = [
+            book_dtos.BookReview(**review)
+            for review in models.BookReview.objects.filter(
+                id__in=live.get(changes.REVIEW, [])).values(
+                    "id", "book_id", "rating", "review", "created_at",
+                    "updated_at")
+        ]
+        change_set.stats = [
+            rating_stats.to_dto(stats_db)
+            for stats_db in models.BookStats.objects.filter(
+                book_id__in=live.get(changes.STATS, []))
+        ]
+        change_set.favourites = live.get(changes.FAVOURITE, [])
+        # Objects deleted after the changes on this page show up as
+        # deleted right away, their tombstones follow on a later page.
+        change_set.deleted_books = deleted.get(changes.BOOK, []) + [
+            book_id for book_id in live.get(changes.BOOK, [])
+            if book_id not in found_books
+        ]
+        change_set.deleted_reviews = deleted.get(changes.REVIEW, [])
+        change_set.deleted_stats = deleted.get(changes.STATS, [])
+        change_set.deleted_favourites = deleted.get(changes.FAVOURITE, [])
+        return change_set
+
+    def _favourites(self, user: book_dtos.User | None) -> Container[int]:
+        if user is None:
+            return frozenset()
+        return favourites_cache.get(user.id)
+
+    def _filter_books(self, created_before: datetime.datetime | None,
+                      created_after: datetime.datetime | None,
+                      authors: list[int] | None,
+                      categories: list[str] | None) -> QuerySet[models.Book]:
+        filters = {}
+        if created_before:
+            filters["created_at__lte"] = created_before
+        if created_after:
+            filters["created_at__gte"] = created_after
+        if authors:
+            filters["author_id__in"] = authors
+        if categories:
+            filters["category_id__in"] = lookups_cache.category_ids(categories)
+
+        book_qs = models.Book.objects.all()
+        if filters:
+            book_qs = book_qs.filter(**filters)
+        return book_qs
 
     def get_book_review(self, user_id: int,
                         book_id: int) -> book_dtos.BookReview | None:
@@ -124,22 +904,228 @@ class BookRepository(IBookRepository):
             review_db = models.BookReview.objects.get(user_id=user_id,
                                                       book_id=book_id)
         except ObjectDoesNotExist:
-            return None
+            archived_db = models.ArchivedReview.objects.filter(
+                user_id=user_id, book_id=book_id).first()
+            if archived_db is None:
+                return None
+            return book_dtos.BookReview(book_id=archived_db.book_id,
+                                        rating=archived_db.rating,
+                                        review=_decompress(archived_db.review),
+                                        created_at=archived_db.created_at)
         return book_dtos.BookReview(book_id=review_db.book_id,
                                     rating=review_db.rating,
                                     review=review_db.review,
                                     created_at=review_db.created_at)
 
+    def get_book_reviews(self, book_id: int, before: int | None,
+                         limit: int) -> book_dtos.ReviewPage:
+        reviews_qs = models.BookReview.objects.filter(book_id=book_id)
+        archived_qs = models.ArchivedReview.objects.filter(book_id=book_id)
+        if before is not None:
+            reviews_qs = reviews_qs.filter(id__lt=before)
+            archived_qs = archived_qs.filter(id__lt=before)
+        reviews = [
+            book_dtos.BookReview(**row)
+            for row in reviews_qs.order_by("-id").values(
+                "id", "book_id", "rating", "review", "created_at",
+                "updated_at")[:limit + 1]
+        ]
+        if len(reviews) > limit:
+            # Archived reviews are older, on recent pages this finds none
+            # and nothing is decompressed.
+            archived_qs = archived_qs.filter(id__gt=reviews[-1].id)
+        reviews.extend(
+            book_dtos.BookReview(id=archived_db.id,
+                                 book_id=archived_db.book_id,
+                                 rating=archived_db.rating,
+                                 review=_decompress(archived_db.review),
+                                 created_at=archived_db.created_at,
+                                 updated_at=archived_db.updated_at)
+            for archived_db in archived_qs.order_by("-id")[:limit + 1])
+        reviews.sort(key=lambda review: review.id, reverse=True)
+        if not reviews:
+            models.Book.objects.only("id").get(id=book_id)
+        has_more = len(reviews) > limit
+        reviews = reviews[:limit]
+        return book_dtos.ReviewPage(reviews=reviews,
+                                    next=reviews[-1].id if has_more else None)
+
+    def archive_reviews(self, created_before: datetime.datetime,
+                        batch_size: int) -> int:
+        archived = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    models.BookReview.objects.select_for_update().filter(
+                        id__gt=last_id,
+                        created_at__lt=created_before).order_by(
+                            "id")[:batch_size])
+                if not batch:
+                    return archived
+                # Ratings first, averages read both tables.
+                self._fold_archived_ratings(batch)
+                models.ArchivedReview.objects.bulk_create(
+                    models.ArchivedReview(id=review_db.id,
+                                          user_id=review_db.user_id,
+                                          book_id=review_db.book_id,
+                                          rating=review_db.rating,
+                                          review=_compress(review_db.review),
+                                          created_at=review_db.created_at,
+                                          updated_at=review_db.updated_at)
+                    for review_db in batch)
+                _delete_reviews([review_db.id for review_db in batch])
+                changes.record(changes.REVIEW,
+                               [review_db.id for review_db in batch],
+                               deleted=True)
+                for book_id in {review_db.book_id for review_db in batch}:
+                    book_detail_cache.invalidate(book_id)
+            archived += len(batch)
+            last_id = batch[-1].id
+
+    def _fold_archived_ratings(self, batch: list[models.BookReview]) -> None:
+        ratings: dict[int, models.ArchivedRatings] = {
+            ratings_db.book_id: ratings_db
+            for ratings_db in models.ArchivedRatings.objects.select_for_update(
+            ).filter(book_id__in={review_db.book_id
+                                  for review_db in batch})
+        }
+        existing = list(ratings.values())
+        for review_db in batch:
+            ratings_db = ratings.setdefault(
+                review_db.book_id,
+                models.ArchivedRatings(book_id=review_db.book_id))
+            ratings_db.review_count += 1
+            ratings_db.rating_sum += review_db.rating
+        models.ArchivedRatings.objects.bulk_update(
+            existing, ["review_count", "rating_sum"])
+        models.ArchivedRatings.objects.bulk_create(
+            ratings_db for ratings_db in ratings.values()
+            if ratings_db not in existing)
+
+    def prune_changes(self, created_before: datetime.datetime,
+                      batch_size: int) -> int:
+        pruned = 0
+        while True:
+            with transaction.atomic():
+                # Entries come about in the order of their ids, so only the
+                # head of the log is read and the run stops at the first
+                # entry to keep.
+                rows = list(
+                    models.Change.objects.order_by("id").values_list(
+                        "id", "created_at")[:batch_size])
+                ids = [
+                    change_id for change_id, created_at in itertools.takewhile(
+                        lambda row: row[1] < created_before, rows)
+                ]
+                if not ids:
+                    return pruned
+                deleted, _ = models.Change.objects.filter(
+                    id__lte=ids[-1]).delete()
+                models.PrunedChanges.objects.update_or_create(
+                    id=1, defaults={"last_id": ids[-1]})
+            pruned += deleted
+            if len(ids) < batch_size:
+                return pruned
+
     def create_review(self, user: book_dtos.User,
                       review: book_dtos.BookReview) -> book_dtos.BookReview:
-        models.Book.objects.get(id=review.book_id)
-        created = models.BookReview.objects.create(user_id=user.id,
-                                                   book_id=review.book_id,
-                                                   review=review.review,
-                                                   rating=review.rating)
+        try:
+            with transaction.atomic():
+                created = models.BookReview.objects.create(
+                    user_id=user.id,
+                    book_id=review.book_id,
+                    review=review.review,
+                    rating=review.rating)
+                self._check_not_archived(user.id, review.book_id)
+                outbox.publish(outbox.REVIEW_CREATED,
+                               book_id=review.book_id,
+                               payload={
+                                   "review_id": created.id,
+                                   "user_id": user.id,
+                                   "rating": review.rating,
+                                   "created_at":
+                                   created.created_at.isoformat()
+                               })
+        except IntegrityError:
+            # Only a failed insert pays for finding out which constraint
+            # it hit.
+            if not models.Book.objects.filter(id=review.book_id).exists():
+                raise models.Book.DoesNotExist
+            raise AlreadyExistsException(
+                message="Пользователь уже оставил отзыв")
+        review.id = created.id
         review.created_at = created.created_at
+        review.updated_at = created.updated_at
         return review
 
+    def _check_not_archived(self, user_id: int, book_id: int) -> None:
+        # The unique constraint of the reviews table misses archived reviews.
+        # Called after the insert, in its transaction: the insert takes the
+        # write lock first (SQLite cannot upgrade a read transaction while
+        # another writer waits), and waits for an archiving of the same
+        # review to commit (the unique index entry of the moved row), so
+        # the archived row is seen here. Raising rolls the insert back.
+        if models.ArchivedReview.objects.filter(user_id=user_id,
+                                                book_id=book_id).exists():
+            raise AlreadyExistsException(
+                message="Пользователь уже оставил отзыв")
+
     def add_to_favourite(self, user_id: int, book_id: int) -> None:
-        book = models.Book.objects.get(id=book_id)
-        User.objects.get(id=user_id).favourites.add(book)
+        try:
+            with transaction.atomic():
+                User.favourites.through.objects.create(customuser_id=user_id,
+                                                       book_id=book_id)
+                # Auto-created through models send no post_save.
+                changes.record(changes.FAVOURITE, [book_id], user_id=user_id)
+                outbox.publish(outbox.FAVOURITE_ADDED,
+                               book_id=book_id,
+                               payload={"user_id": user_id})
+        except IntegrityError:
+            if not models.Book.objects.filter(id=book_id).exists():
+                raise models.Book.DoesNotExist
+            raise AlreadyExistsException(message="Уже добавлен в избранные")
+        favourites_cache.add(user_id=user_id, book_id=book_id)
+
+
+def get_book_repository() -> IBookRepository:
+    """
+    Returns the implementation selected by settings.BOOKS_REPOSITORY.
+    """
+    return import_string(settings.BOOKS_REPOSITORY)()
+
+
+def _average_rating() -> Coalesce:
+    """
+    Average rating of Book rows over the reviews table and the archived
+    ratings.
+    """
+    rating_sum = Sum("reviews__rating", default=0) + Coalesce(
+        "archived_ratings__rating_sum", 0)
+    review_count = Count("reviews") + Coalesce(
+        "archived_ratings__review_count", 0)
+    return Coalesce(Cast(rating_sum, FloatField()) / NullIf(review_count, 0),
+                    0.0,
+                    output_field=FloatField())
+
+
+def _delete_reviews(review_ids: list[int]) -> None:
+    # Without the post_delete signals: the rating statistics and the book
+    # listing keep archived reviews, the change log gets its tombstones
+    # from archive_reviews.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {models.BookReview._meta.db_table} "
+            f"WHERE id IN ({', '.join(['%s'] * len(review_ids))})", review_ids)
+
+
+def _compress(text: str) -> bytes:
+    return zlib.compress(text.encode())
+
+
+def _decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode()
+
+
+def _changes_settled_at() -> datetime.datetime:
+    return timezone.now() - datetime.timedelta(seconds=CHANGES_SETTLE_SECONDS)
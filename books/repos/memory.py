@@ -0,0 +1,604 @@
+"""
+IBookRepository kept in process memory, for fast tests of the use cases.
+
+Rows live in dicts keyed by id, with the secondary indexes the queries
+need: books per author and per category, reviews per book and per (user,
+book), favourites per user. Semantics follow BookRepository: the same
+exceptions for duplicates and missing books, the same averages, the same
+change log entries, and the cache invalidations books.signals makes for
+ORM writes. Rating statistics and user affinities are folded in on write
+instead of by the outbox worker, and change log entries are served at
+once, there are no concurrent writers to wait for.
+
+Archived reviews stay in place with a flag. There is no denormalized book
+listing, lists are always computed from the rows, so the listing methods
+have nothing to do.
+"""
+import dataclasses
+import datetime
+import itertools
+import math
+from typing import Iterable
+
+import numpy as np
+from django.utils import timezone
+
+from books import changes
+from books import models
+from books import rating_stats
+from books.caches.book_detail import book_detail_cache
+from books.caches.book_list import book_list_cache
+from books.caches.catalogue import catalogue_cache
+from books.catalogue import Catalogue, to_timestamp
+from books.dtos import book as book_dtos
+from books.exceptions import AlreadyExistsException, ChangesExpiredException
+from books.recommendations import FAVOURITE_AFFINITY, Neighbours, review_affinity
+from books.repos.book import IBookRepository
+from books.suggest import SuggestBook, SuggestIndex
+
+
+@dataclasses.dataclass
+class _Book:
+    id: int
+    name: str
+    author_id: int
+    category_id: int
+    description: str
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
+
+
+@dataclasses.dataclass
+class _Review:
+    id: int
+    user_id: int
+    book_id: int
+    rating: int
+    review: str
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
+    archived: bool = False
+
+
+@dataclasses.dataclass
+class _Change:
+    id: int
+    entity: str
+    object_id: int
+    user_id: int | None
+    deleted: bool
+    created_at: datetime.datetime
+
+
+class InMemoryBookRepository(IBookRepository):
+
+    def __init__(self):
+        self._author_seq = itertools.count(1)
+        self._category_seq = itertools.count(1)
+        self._book_seq = itertools.count(1)
+        self._review_seq = itertools.count(1)
+        self._authors: dict[int, book_dtos.Author] = {}
+        self._categories: dict[int, book_dtos.Category] = {}
+        self._category_ids: dict[str, int] = {}
+        self._books: dict[int, _Book] = {}
+        self._books_by_author: dict[int, set[int]] = {}
+        self._books_by_category: dict[int, set[int]] = {}
+        self._reviews: dict[int, _Review] = {}
+        self._reviews_by_book: dict[int, list[_Review]] = {}
+        self._user_reviews: dict[tuple[int, int], int] = {}
+        self._favourite_ids: dict[int, set[int]] = {}
+        self._stats: dict[int, models.BookStats] = {}
+        self._affinities: dict[int, book_dtos.UserAffinity] = {}
+        self._similar: dict[int, list[int]] = {}
+        self._changes: list[_Change] = []
+        self._change_seq = itertools.count(1)
+        self._pruned_through = 0
+
+    def add_author(self, first_name: str, last_name: str) -> book_dtos.Author:
+        author = book_dtos.Author(author_id=next(self._author_seq),
+                                  first_name=first_name,
+                                  last_name=last_name,
+                                  created_at=timezone.now())
+        self._authors[author.author_id] = author
+        return author
+
+    def add_category(self, name: str) -> book_dtos.Category:
+        category = book_dtos.Category(id=next(self._category_seq), name=name)
+        self._categories[category.id] = category
+        self._category_ids[name] = category.id
+        return category
+
+    def add_book(self,
+                 name: str,
+                 author_id: int,
+                 category_id: int,
+                 description: str = "",
+                 created_at: datetime.datetime | None = None) -> int:
+        if (author_id not in self._authors
+                or category_id not in self._categories):
+            raise models.Book.DoesNotExist
+        created_at = created_at or timezone.now()
+        book = _Book(id=next(self._book_seq),
+                     name=name,
+                     author_id=author_id,
+                     category_id=category_id,
+                     description=description,
+                     created_at=created_at,
+                     updated_at=created_at)
+        self._books[book.id] = book
+        self._books_by_author.setdefault(author_id, set()).add(book.id)
+        self._books_by_category.setdefault(category_id, set()).add(book.id)
+        self._book_changed(book.id)
+        self._record(changes.BOOK, book.id)
+        return book.id
+
+    def list_books(self, user: book_dtos.User | None,
+                   created_before: datetime.datetime | None,
+                   created_after: datetime.datetime | None,
+                   authors: list[int] | None,
+                   categories: list[str] | None) -> list[book_dtos.BookInfo]:
+        favourites = self._favourites(user)
+        return [
+            self._book_info(book, self._review_average(book.id), favourites)
+            for book in self._filter_books(created_before=created_before,
+                                           created_after=created_after,
+                                           authors=authors,
+                                           categories=categories)
+        ]
+
+    def count_facets(self, facets: list[str],
+                     created_before: datetime.datetime | None,
+                     created_after: datetime.datetime | None,
+                     authors: list[int] | None,
+                     categories: list[str] | None) -> book_dtos.Facets:
+        books = self._filter_books(created_before=created_before,
+                                   created_after=created_after,
+                                   authors=authors,
+                                   categories=categories)
+        result: book_dtos.Facets = {}
+        if "category" in facets:
+            counts = _count(book.category_id for book in books)
+            result["category"] = [
+                book_dtos.FacetValue(id=category_id,
+                                     name=self._categories[category_id].name,
+                                     count=count)
+                for category_id, count in sorted(counts.items(),
+                                                 key=lambda item: -item[1])
+            ]
+        if "author" in facets:
+            counts = _count(book.author_id for book in books)
+            result["author"] = [
+                book_dtos.FacetValue(id=author_id,
+                                     name=self._authors[author_id].full_name,
+                                     count=count)
+                for author_id, count in sorted(counts.items(),
+                                               key=lambda item: -item[1])
+            ]
+        if "rating_bucket" in facets:
+            counts = _count(
+                math.floor(self._stats_average(book.id)) for book in books)
+            result["rating_bucket"] = [
+                book_dtos.FacetValue(id=bucket, name=str(bucket), count=count)
+                for bucket, count in sorted(counts.items(), reverse=True)
+            ]
+        return result
+
+    def refresh_book_listings(self, book_ids: list[int]) -> None:
+        pass
+
+    def refresh_listing_ratings(self, book_id: int) -> None:
+        pass
+
+    def rebuild_book_listing(self, batch_size: int) -> int:
+        return len(self._books)
+
+    def find_stale_listings(self, batch_size: int) -> list[int]:
+        return []
+
+    def get_book_detail(self, user: book_dtos.User | None,
+                        book_id: int) -> book_dtos.BookDetail:
+        book = self._get_book(book_id)
+        return self._book_detail(book, self._hot_reviews(book_id),
+                                 self._favourites(user))
+
+    def get_book_details(
+            self, user: book_dtos.User, book_ids: list[int],
+            reviews_limit: int) -> list[book_dtos.BookDetail | None]:
+        favourites = self._favourites(user)
+        details = []
+        for book_id in book_ids:
+            book = self._books.get(book_id)
+            if book is None:
+                details.append(None)
+                continue
+            reviews = sorted(self._hot_reviews(book_id),
+                             key=lambda review:
+                             (review.rating, review.created_at),
+                             reverse=True)[:reviews_limit]
+            details.append(self._book_detail(book, reviews, favourites))
+        return details
+
+    def get_book_stats(self, book_id: int) -> book_dtos.BookStats:
+        self._get_book(book_id)
+        return rating_stats.to_dto(
+            self._stats.get(book_id, models.BookStats(book_id=book_id)))
+
+    def update_book_stats(
+            self, book_id: int,
+            ratings: list[tuple[int, datetime.datetime]]) -> None:
+        stats = self._stats.setdefault(book_id,
+                                       models.BookStats(book_id=book_id))
+        for rating, created_at in ratings:
+            rating_stats.fold(stats, rating, created_at)
+        catalogue_cache.record_change(book_id)
+        book_list_cache.invalidate()
+        self._record(changes.STATS, book_id)
+
+    def rebuild_book_stats(self, batch_size: int) -> int:
+        self._stats = {}
+        for book_id, reviews in self._reviews_by_book.items():
+            if reviews:
+                self.update_book_stats(
+                    book_id,
+                    [(review.rating, review.created_at) for review in sorted(
+                        reviews, key=lambda review: review.created_at)])
+        return len(self._stats)
+
+    def get_similar_books(self, user: book_dtos.User,
+                          book_id: int) -> list[book_dtos.BookInfo]:
+        self._get_book(book_id)
+        return self.get_books(user=user,
+                              book_ids=self._similar.get(book_id, []))
+
+    def get_interactions(self, min_rating: int) -> np.ndarray:
+        pairs = [(user_id, book_id)
+                 for user_id, book_ids in self._favourite_ids.items()
+                 for book_id in book_ids]
+        pairs.extend((review.user_id, review.book_id)
+                     for review in self._reviews.values()
+                     if review.rating >= min_rating)
+        return np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+    def replace_similar_books(self, similar: Iterable[Neighbours],
+                              batch_size: int) -> int:
+        self._similar = {
+            book_id: [int(neighbour_id) for neighbour_id in neighbour_ids]
+            for book_id, neighbour_ids, _ in similar
+        }
+        return sum(len(neighbours) for neighbours in self._similar.values())
+
+    def get_catalogue(self, book_ids: list[int] | None = None) -> Catalogue:
+        if book_ids is None:
+            book_ids = list(self._books)
+        books = [
+            self._books[book_id] for book_id in sorted(book_ids)
+            if book_id in self._books
+        ]
+        return Catalogue.from_columns(
+            book_ids=np.array([book.id for book in books], dtype=np.int64),
+            author_ids=np.array([book.author_id for book in books],
+                                dtype=np.int64),
+            category_ids=np.array([book.category_id for book in books],
+                                  dtype=np.int64),
+            ratings=np.array([self._stats_average(book.id) for book in books],
+                             dtype=np.float32),
+            created_at=np.array(
+                [to_timestamp(book.created_at) for book in books],
+                dtype=np.int64))
+
+    def get_suggest_index(self,
+                          book_ids: list[int] | None = None) -> SuggestIndex:
+        if book_ids is None:
+            book_ids = list(self._books)
+        books = []
+        for book_id in book_ids:
+            book = self._books.get(book_id)
+            if book is None:
+                continue
+            stats = self._stats.get(book_id, models.BookStats(book_id=book_id))
+            books.append(
+                SuggestBook(
+                    id=book.id,
+                    name=book.name,
+                    author_id=book.author_id,
+                    author_name=self._authors[book.author_id].full_name,
+                    category_id=book.category_id,
+                    category_name=self._categories[book.category_id].name,
+                    rating_sum=stats.rating_sum,
+                    review_count=stats.review_count))
+        return SuggestIndex.from_books(books)
+
+    def get_books(self, user: book_dtos.User | None,
+                  book_ids: list[int]) -> list[book_dtos.BookInfo]:
+        favourites = self._favourites(user)
+        return [
+            self._book_info(self._books[book_id], self._stats_average(book_id),
+                            favourites) for book_id in book_ids
+            if book_id in self._books
+        ]
+
+    def get_user_affinity(self, user_id: int) -> book_dtos.UserAffinity:
+        affinity = self._affinities.get(user_id)
+        if affinity is None:
+            return book_dtos.UserAffinity(user_id=user_id)
+        return book_dtos.UserAffinity(user_id=user_id,
+                                      authors=dict(affinity.authors),
+                                      categories=dict(affinity.categories))
+
+    def update_user_affinities(self, book_id: int,
+                               weights: list[tuple[int, float]]) -> None:
+        book = self._books.get(book_id)
+        if book is None:
+            return
+        for user_id, weight in weights:
+            affinity = self._affinities.setdefault(
+                user_id, book_dtos.UserAffinity(user_id=user_id))
+            affinity.authors[book.author_id] = affinity.authors.get(
+                book.author_id, 0) + weight
+            affinity.categories[book.category_id] = affinity.categories.get(
+                book.category_id, 0) + weight
+
+    def get_favourite_ids(self, user_id: int) -> list[int]:
+        return sorted(self._favourite_ids.get(user_id, ()))
+
+    def get_change_token(self) -> str:
+        if not self._changes:
+            return str(self._pruned_through)
+        return str(self._changes[-1].id)
+
+    def get_changes(self, user: book_dtos.User | None, since: int,
+                    limit: int) -> book_dtos.ChangeSet:
+        if since < self._pruned_through:
+            raise ChangesExpiredException(message=changes.EXPIRED_MESSAGE)
+        rows = [
+            change for change in self._changes if change.id > since and (
+                change.user_id is None
+                or user is not None and change.user_id == user.id)
+        ][:limit + 1]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        live, deleted = changes.merge(
+            (change.entity, change.object_id, change.deleted)
+            for change in rows)
+
+        favourites = self._favourites(user)
+        change_set = book_dtos.ChangeSet(
+            token=str(rows[-1].id if rows else since), has_more=has_more)
+        for book_id in live.get(changes.BOOK, []):
+            book = self._books.get(book_id)
+            if book is None:
+                change_set.deleted_books.append(book_id)
+                continue
+            change_set.books.append(
+                book_dtos.BookDetail(
+                    id=book.id,
+                    name=book.name,
+                    category=self._categories[book.category_id].name,
+                    description=book.description,
+                    created_at=book.created_at,
+                    updated_at=book.updated_at,
+                    author=self._authors[book.author_id],
+                    favourite=book.id in favourites,
+                    average_rating=self._stats_average(book.id)))
+        change_set.reviews = [
+            book_dtos.BookReview(id=review.id,
+                                 book_id=review.book_id,
+                                 rating=review.rating,
+                                 review=review.review,
+                                 created_at=review.created_at,
+                                 updated_at=review.updated_at)
+            for review in (self._reviews.get(review_id)
+                           for review_id in live.get(changes.REVIEW, []))
+            if review is not None and not review.archived
+        ]
+        change_set.stats = [
+            rating_stats.to_dto(self._stats[book_id])
+            for book_id in live.get(changes.STATS, [])
+            if book_id in self._stats
+        ]
+        change_set.favourites = live.get(changes.FAVOURITE, [])
+        change_set.deleted_books = (deleted.get(changes.BOOK, []) +
+                                    change_set.deleted_books)
+        change_set.deleted_reviews = deleted.get(changes.REVIEW, [])
+        change_set.deleted_stats = deleted.get(changes.STATS, [])
+        change_set.deleted_favourites = deleted.get(changes.FAVOURITE, [])
+        return change_set
+
+    def add_to_favourite(self, user_id: int, book_id: int) -> None:
+        self._get_book(book_id)
+        favourites = self._favourite_ids.setdefault(user_id, set())
+        if book_id in favourites:
+            raise AlreadyExistsException(message="Уже добавлен в избранные")
+        favourites.add(book_id)
+        self._record(changes.FAVOURITE, book_id, user_id=user_id)
+        self.update_user_affinities(book_id, [(user_id, FAVOURITE_AFFINITY)])
+
+    def create_review(self, user: book_dtos.User,
+                      review: book_dtos.BookReview) -> book_dtos.BookReview:
+        self._get_book(review.book_id)
+        if (user.id, review.book_id) in self._user_reviews:
+            raise AlreadyExistsException(
+                message="Пользователь уже оставил отзыв")
+        now = timezone.now()
+        created = _Review(id=next(self._review_seq),
+                          user_id=user.id,
+                          book_id=review.book_id,
+                          rating=review.rating,
+                          review=review.review,
+                          created_at=now,
+                          updated_at=now)
+        self._reviews[created.id] = created
+        self._reviews_by_book.setdefault(review.book_id, []).append(created)
+        self._user_reviews[(user.id, review.book_id)] = created.id
+        book_detail_cache.invalidate(review.book_id)
+        book_list_cache.invalidate()
+        self._record(changes.REVIEW, created.id)
+        self.update_book_stats(review.book_id, [(review.rating, now)])
+        self.update_user_affinities(
+            review.book_id, [(user.id, review_affinity(review.rating))])
+
+        review.id = created.id
+        review.created_at = now
+        review.updated_at = now
+        return review
+
+    def get_book_review(self, user_id: int,
+                        book_id: int) -> book_dtos.BookReview | None:
+        review_id = self._user_reviews.get((user_id, book_id))
+        if review_id is None:
+            return None
+        review = self._reviews[review_id]
+        return book_dtos.BookReview(book_id=review.book_id,
+                                    rating=review.rating,
+                                    review=review.review,
+                                    created_at=review.created_at)
+
+    def get_book_reviews(self, book_id: int, before: int | None,
+                         limit: int) -> book_dtos.ReviewPage:
+        self._get_book(book_id)
+        reviews = [
+            book_dtos.BookReview(id=review.id,
+                                 book_id=review.book_id,
+                                 rating=review.rating,
+                                 review=review.review,
+                                 created_at=review.created_at,
+                                 updated_at=review.updated_at)
+            for review in reversed(self._reviews_by_book.get(book_id, []))
+            if before is None or review.id < before
+        ][:limit + 1]
+        has_more = len(reviews) > limit
+        reviews = reviews[:limit]
+        return book_dtos.ReviewPage(reviews=reviews,
+                                    next=reviews[-1].id if has_more else None)
+
+    def archive_reviews(self, created_before: datetime.datetime,
+                        batch_size: int) -> int:
+        archived = 0
+        for review in self._reviews.values():
+            if not review.archived and review.created_at < created_before:
+                review.archived = True
+                book_detail_cache.invalidate(review.book_id)
+                self._record(changes.REVIEW, review.id, deleted=True)
+                archived += 1
+        return archived
+
+    def prune_changes(self, created_before: datetime.datetime,
+                      batch_size: int) -> int:
+        pruned = 0
+        while (pruned < len(self._changes)
+               and self._changes[pruned].created_at < created_before):
+            pruned += 1
+        if pruned:
+            self._pruned_through = self._changes[pruned - 1].id
+            del self._changes[:pruned]
+        return pruned
+
+    def is_user_favourite(self, user_id: int, book_id: int) -> bool:
+        return book_id in self._favourite_ids.get(user_id, ())
+
+    def _get_book(self, book_id: int) -> _Book:
+        book = self._books.get(book_id)
+        if book is None:
+            raise models.Book.DoesNotExist
+        return book
+
+    def _book_changed(self, book_id: int) -> None:
+        book_detail_cache.invalidate(book_id)
+        catalogue_cache.record_change(book_id)
+        book_list_cache.invalidate()
+
+    def _record(self,
+                entity: str,
+                object_id: int,
+                deleted: bool = False,
+                user_id: int | None = None) -> None:
+        self._changes.append(
+            _Change(id=next(self._change_seq),
+                    entity=entity,
+                    object_id=object_id,
+                    user_id=user_id,
+                    deleted=deleted,
+                    created_at=timezone.now()))
+
+    def _hot_reviews(self, book_id: int) -> list[_Review]:
+        return [
+            review for review in self._reviews_by_book.get(book_id, [])
+            if not review.archived
+        ]
+
+    def _favourites(self, user: book_dtos.User | None) -> set[int]:
+        if user is None:
+            return set()
+        return self._favourite_ids.get(user.id, set())
+
+    def _filter_books(self, created_before: datetime.datetime | None,
+                      created_after: datetime.datetime | None,
+                      authors: list[int] | None,
+                      categories: list[str] | None) -> list[_Book]:
+        book_ids: set[int] | None = None
+        if authors:
+            book_ids = set().union(*(self._books_by_author.get(author_id, ())
+                                     for author_id in authors))
+        if categories:
+            by_category = set().union(
+                *(self._books_by_category.get(self._category_ids[name], ())
+                  for name in categories if name in self._category_ids))
+            book_ids = (by_category if book_ids is None else book_ids
+                        & by_category)
+        if book_ids is None:
+            book_ids = set(self._books)
+        return [
+            self._books[book_id] for book_id in sorted(book_ids)
+            if (created_before is None
+                or self._books[book_id].created_at <= created_before) and (
+                    created_after is None
+                    or self._books[book_id].created_at >= created_after)
+        ]
+
+    def _book_info(self, book: _Book, average_rating: float,
+                   favourites: set[int]) -> book_dtos.BookInfo:
+        return book_dtos.BookInfo(
+            id=book.id,
+            name=book.name,
+            author=self._authors[book.author_id],
+            category=self._categories[book.category_id].name,
+            favourite=book.id in favourites,
+            average_rating=average_rating)
+
+    def _book_detail(self, book: _Book, reviews: list[_Review],
+                     favourites: set[int]) -> book_dtos.BookDetail:
+        return book_dtos.BookDetail(
+            id=book.id,
+            name=book.name,
+            category=self._categories[book.category_id].name,
+            description=book.description,
+            created_at=book.created_at,
+            author=self._authors[book.author_id],
+            reviews=[
+                book_dtos.BookReview(book_id=review.book_id,
+                                     rating=review.rating,
+                                     review=review.review,
+                                     created_at=review.created_at)
+                for review in reviews
+            ],
+            favourite=book.id in favourites,
+            average_rating=self._review_average(book.id))
+
+    def _review_average(self, book_id: int) -> float:
+        reviews = self._reviews_by_book.get(book_id)
+        if not reviews:
+            return 0.0
+        return sum(review.rating for review in reviews) / len(reviews)
+
+    def _stats_average(self, book_id: int) -> float:
+        stats = self._stats.get(book_id)
+        if stats is None or not stats.review_count:
+            return 0.0
+        return stats.rating_sum / stats.review_count
+
+
+def _count(values: Iterable[int]) -> dict[int, int]:
+    counts: dict[int, int] = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return counts
@@ -0,0 +1,252 @@
+"""
+IBookRepository over hand-written SQL.
+
+BookRepository goes through the ORM, which compiles every query and builds
+model instances on each call. SqlBookRepository runs fixed, parameterized
+statements for the book list, the book detail and the writes, and maps
+cursor rows straight into DTOs. Everything else is inherited from
+BookRepository. Select it with settings.BOOKS_REPOSITORY.
+
+The statements only use SQL understood by both SQLite and PostgreSQL.
+Review inserts send the post_save signal the ORM would, so the caches and
+the change log behind books.signals stay in step.
+"""
+import datetime
+import functools
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from books.caches.favourites import favourites_cache
+from books.caches.lookups import lookups_cache
+from books.dtos import book as book_dtos
+from books.exceptions import AlreadyExistsException
+from books.repos.book import BookRepository, User
+from books import changes
+from books import models
+from books import outbox
+
+BOOKS = models.Book._meta.db_table
+REVIEWS = models.BookReview._meta.db_table
+FAVOURITES = User.favourites.through._meta.db_table
+ARCHIVED_RATINGS = models.ArchivedRatings._meta.db_table
+
+# Averages count the archived ratings, see models.ArchivedRatings.
+BOOK_DETAIL_SQL = f"""
+SELECT b.id, b.name, b.author_id, b.category_id, b.description, b.created_at,
+       COALESCE(
+           (r.rating_sum + COALESCE(a.rating_sum, 0)) * 1.0
+           / NULLIF(r.review_count + COALESCE(a.review_count, 0), 0),
+           0)
+FROM {BOOKS} b
+CROSS JOIN (SELECT COALESCE(SUM(rating), 0) AS rating_sum,
+                   COUNT(*) AS review_count
+            FROM {REVIEWS} WHERE book_id = %s) r
+LEFT JOIN {ARCHIVED_RATINGS} a ON a.book_id = b.id
+WHERE b.id = %s
+"""
+
+BOOK_REVIEWS_SQL = f"""
+SELECT rating, review, created_at FROM {REVIEWS} WHERE book_id = %s
+"""
+
+BOOK_EXISTS_SQL = f"SELECT 1 FROM {BOOKS} WHERE id = %s"
+
+INSERT_REVIEW_SQL = f"""
+INSERT INTO {REVIEWS} (user_id, book_id, rating, review, created_at,
+                       updated_at)
+VALUES (%s, %s, %s, %s, %s, %s)
+RETURNING id
+"""
+
+INSERT_FAVOURITE_SQL = f"""
+INSERT INTO {FAVOURITES} (customuser_id, book_id)
+VALUES (%s, %s)
+"""
+
+
+@functools.lru_cache(maxsize=128)
+def list_books_sql(created_before: bool, created_after: bool, authors: int,
+                   categories: int) -> str:
+    """
+    Returns the list statement for a shape of filters: whether the dates
+    are set and how many authors and categories are given.
+    """
+    conditions = []
+    if created_before:
+        conditions.append("b.created_at <= %s")
+    if created_after:
+        conditions.append("b.created_at >= %s")
+    if authors:
+        conditions.append(f"b.author_id IN ({', '.join(['%s'] * authors)})")
+    if categories:
+        conditions.append(
+            f"b.category_id IN ({', '.join(['%s'] * categories)})")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"""
+SELECT b.id, b.name, b.author_id, b.category_id,
+       COALESCE(
+           (COALESCE(SUM(r.rating), 0) + COALESCE(a.rating_sum, 0)) * 1.0
+           / NULLIF(COUNT(r.id) + COALESCE(a.review_count, 0), 0),
+           0)
+FROM {BOOKS} b
+LEFT JOIN {REVIEWS} r ON r.book_id = b.id
+LEFT JOIN {ARCHIVED_RATINGS} a ON a.book_id = b.id
+{where}
+GROUP BY b.id, b.name, b.author_id, b.category_id, a.rating_sum,
+         a.review_count
+"""
+
+
+class SqlBookRepository(BookRepository):
+
+    def list_books(self, user: book_dtos.User | None,
+                   created_before: datetime.datetime | None,
+                   created_after: datetime.datetime | None,
+                   authors: list[int] | None,
+                   categories: list[str] | None) -> list[book_dtos.BookInfo]:
+        lookups = lookups_cache.snapshot()
+        if settings.BOOKS_LIST_FROM_INDEX or settings.BOOKS_LIST_FROM_LISTING:
+            return super().list_books(user=user,
+                                      created_before=created_before,
+                                      created_after=created_after,
+                                      authors=authors,
+                                      categories=categories)
+        category_ids = []
+        if categories:
+            category_ids = lookups.category_ids(categories)
+            if not category_ids:
+                return []
+        params = []
+        if created_before:
+            params.append(_to_db(created_before))
+        if created_after:
+            params.append(_to_db(created_after))
+        params.extend(authors or [])
+        params.extend(category_ids)
+        sql = list_books_sql(bool(created_before), bool(created_after),
+                             len(authors or []), len(category_ids))
+
+        favourites = self._favourites(user)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return [
+            book_dtos.BookInfo(author=lookups.author(row[2]),
+                               category=lookups.category(row[3]).name,
+                               name=row[1],
+                               id=row[0],
+                               favourite=row[0] in favourites,
+                               average_rating=float(row[4])) for row in rows
+        ]
+
+    def get_book_detail(self, user: book_dtos.User | None,
+                        book_id: int) -> book_dtos.BookDetail:
+        lookups = lookups_cache.snapshot()
+        with connection.cursor() as cursor:
+            cursor.execute(BOOK_DETAIL_SQL, [book_id, book_id])
+            row = cursor.fetchone()
+            if row is None:
+                raise models.Book.DoesNotExist
+            cursor.execute(BOOK_REVIEWS_SQL, [book_id])
+            reviews = [
+                book_dtos.BookReview(book_id=book_id,
+                                     rating=rating,
+                                     review=review,
+                                     created_at=_from_db(created_at))
+                for rating, review, created_at in cursor.fetchall()
+            ]
+
+        return book_dtos.BookDetail(
+            id=row[0],
+            name=row[1],
+            category=lookups.category(row[3]).name,
+            description=row[4],
+            created_at=_from_db(row[5]),
+            author=lookups.author(row[2]),
+            reviews=reviews,
+            favourite=bool(user) and row[0] in favourites_cache.get(user.id),
+            average_rating=float(row[6]))
+
+    def create_review(self, user: book_dtos.User,
+                      review: book_dtos.BookReview) -> book_dtos.BookReview:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(INSERT_REVIEW_SQL, [
+                        user.id, review.book_id, review.rating, review.review,
+                        _to_db(now),
+                        _to_db(now)
+                    ])
+                    review_id = cursor.fetchone()[0]
+                self._check_not_archived(user.id, review.book_id)
+                outbox.publish(outbox.REVIEW_CREATED,
+                               book_id=review.book_id,
+                               payload={
+                                   "review_id": review_id,
+                                   "user_id": user.id,
+                                   "rating": review.rating,
+                                   "created_at": now.isoformat()
+                               })
+                _send_created(
+                    models.BookReview(id=review_id,
+                                      user_id=user.id,
+                                      book_id=review.book_id,
+                                      rating=review.rating,
+                                      review=review.review,
+                                      created_at=now,
+                                      updated_at=now))
+        except IntegrityError:
+            if not self._book_exists(review.book_id):
+                raise models.Book.DoesNotExist
+            raise AlreadyExistsException(
+                message="Пользователь уже оставил отзыв")
+        review.id = review_id
+        review.created_at = now
+        review.updated_at = now
+        return review
+
+    def add_to_favourite(self, user_id: int, book_id: int) -> None:
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(INSERT_FAVOURITE_SQL, [user_id, book_id])
+                changes.record(changes.FAVOURITE, [book_id], user_id=user_id)
+                outbox.publish(outbox.FAVOURITE_ADDED,
+                               book_id=book_id,
+                               payload={"user_id": user_id})
+        except IntegrityError:
+            if not self._book_exists(book_id):
+                raise models.Book.DoesNotExist
+            raise AlreadyExistsException(message="Уже добавлен в избранные")
+        favourites_cache.add(user_id=user_id, book_id=book_id)
+
+    def _book_exists(self, book_id: int) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute(BOOK_EXISTS_SQL, [book_id])
+            return cursor.fetchone() is not None
+
+
+def _send_created(instance: models.BookReview) -> None:
+    post_save.send(sender=models.BookReview,
+                   instance=instance,
+                   created=True,
+                   update_fields=None,
+                   raw=False,
+                   using=connection.alias)
+
+
+def _to_db(value: datetime.datetime):
+    return connection.ops.adapt_datetimefield_value(value)
+
+
+def _from_db(value) -> datetime.datetime:
+    # SQLite hands back naive UTC datetimes, or strings for expressions.
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, datetime.timezone.utc)
+    return value
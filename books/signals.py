@@ -0,0 +1,164 @@
+import functools
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from books.caches.book_detail import book_detail_cache
+from books.caches.book_list import book_list_cache
+from books.caches.catalogue import catalogue_cache
+from books.caches.favourites import favourites_cache
+from books.caches.lookups import lookups_cache
+from books import changes
+from books import models
+from books.repos.book import BookRepository
+
+Favourite = get_user_model().favourites.through
+
+
+@receiver(post_save, sender=models.Author)
+@receiver(post_delete, sender=models.Author)
+@receiver(post_save, sender=models.Category)
+@receiver(post_delete, sender=models.Category)
+def invalidate_lookups(sender, **kwargs):
+    lookups_cache.invalidate()
+
+
+@receiver(post_save, sender=models.Book)
+@receiver(post_delete, sender=models.Book)
+def invalidate_book_detail(sender, instance, **kwargs):
+    book_detail_cache.invalidate(instance.id)
+    catalogue_cache.record_change(instance.id)
+
+
+@receiver(post_save, sender=models.BookReview)
+@receiver(post_delete, sender=models.BookReview)
+def invalidate_review_book_detail(sender, instance, **kwargs):
+    book_detail_cache.invalidate(instance.book_id)
+
+
+@receiver(post_save, sender=models.Author)
+@receiver(post_save, sender=models.Category)
+def invalidate_catalogue_names(sender, instance, created, **kwargs):
+    # Renames reach the typeahead index through the catalogue changes, see
+    # books.caches.suggest. Too rare to patch book by book.
+    if not created:
+        transaction.on_commit(catalogue_cache.invalidate)
+
+
+@receiver(post_save, sender=models.Book)
+def refresh_book_listing(sender, instance, **kwargs):
+    BookRepository().refresh_book_listings([instance.id])
+
+
+@receiver(post_save, sender=models.Author)
+@receiver(post_save, sender=models.Category)
+def refresh_related_book_listings(sender, instance, created, **kwargs):
+    if not created:
+        BookRepository().refresh_book_listings(
+            list(instance.books.values_list("id", flat=True)))
+
+
+@receiver(post_save, sender=models.BookReview)
+@receiver(post_delete, sender=models.BookReview)
+def refresh_review_listing_ratings(sender, instance, created=False, **kwargs):
+    # New reviews are counted by the outbox worker, see books.handlers.
+    if not created:
+        BookRepository().refresh_listing_ratings(instance.book_id)
+
+
+@receiver(post_save, sender=models.Book)
+@receiver(post_delete, sender=models.Book)
+@receiver(post_save, sender=models.Author)
+@receiver(post_delete, sender=models.Author)
+@receiver(post_save, sender=models.Category)
+@receiver(post_delete, sender=models.Category)
+@receiver(post_save, sender=models.BookReview)
+@receiver(post_delete, sender=models.BookReview)
+@receiver(post_save, sender=models.BookStats)
+def invalidate_book_list(sender, **kwargs):
+    book_list_cache.invalidate()
+
+
+@receiver(post_save, sender=models.Book)
+def record_book_change(sender, instance, **kwargs):
+    changes.record(changes.BOOK, [instance.id])
+
+
+@receiver(post_save, sender=models.Author)
+@receiver(post_save, sender=models.Category)
+def record_related_book_changes(sender, instance, created, **kwargs):
+    if not created:
+        changes.record(changes.BOOK, instance.books.values_list("id",
+                                                                flat=True))
+
+
+@receiver(post_save, sender=models.BookReview)
+def record_review_change(sender, instance, **kwargs):
+    changes.record(changes.REVIEW, [instance.id])
+
+
+@receiver(post_save, sender=models.BookStats)
+def record_stats_change(sender, instance, **kwargs):
+    changes.record(changes.STATS, [instance.book_id])
+
+
+@receiver(post_delete, sender=models.Book)
+def record_book_delete(sender, instance, **kwargs):
+    changes.record(changes.BOOK, [instance.id], deleted=True)
+
+
+@receiver(post_delete, sender=models.BookReview)
+def record_review_delete(sender, instance, **kwargs):
+    changes.record(changes.REVIEW, [instance.id], deleted=True)
+
+
+@receiver(post_delete, sender=models.BookStats)
+def record_stats_delete(sender, instance, **kwargs):
+    changes.record(changes.STATS, [instance.book_id], deleted=True)
+
+
+@receiver(m2m_changed, sender=Favourite)
+def invalidate_favourites(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Favourites changed through the related managers, such as the user
+    admin. The repository updates the cache for its own inserts.
+    """
+    if reverse and action == "pre_clear":
+        user_ids = list(instance.users.values_list("id", flat=True))
+    elif reverse and action in ("post_add", "post_remove"):
+        user_ids = list(pk_set)
+    elif not reverse and action in ("post_add", "post_remove", "post_clear"):
+        user_ids = [instance.id]
+    else:
+        return
+    for user_id in user_ids:
+        transaction.on_commit(
+            functools.partial(favourites_cache.invalidate, user_id))
+
+
+@receiver(m2m_changed, sender=Favourite)
+def record_favourites_changed(sender, instance, action, reverse, pk_set,
+                              **kwargs):
+    """
+    Favourites changed through the related managers, such as the user
+    admin. The auto-created through model sends no post_save or
+    post_delete, the repository records its own inserts.
+    """
+    if action == "pre_clear":
+        related = instance.users if reverse else instance.favourites
+        pk_set = set(related.values_list("id", flat=True))
+    elif action not in ("post_add", "post_remove"):
+        return
+    deleted = action != "post_add"
+    if reverse:
+        for user_id in pk_set:
+            changes.record(changes.FAVOURITE, [instance.id],
+                           deleted=deleted,
+                           user_id=user_id)
+    else:
+        changes.record(changes.FAVOURITE,
+                       pk_set,
+                       deleted=deleted,
+                       user_id=instance.id)
@@ -0,0 +1,262 @@
+"""
+Prefix index of book names, author names and category names for typeahead.
+
+Every name is normalized (case folded, `ё` read as `е`, whitespace
+collapsed) and indexed under each of its word suffixes, so "мир" finds
+"Война и мир". The keys are kept in one sorted list and a prefix is
+answered with two binary searches. Matches are ranked by weight: the
+rating of a book damped by its number of reviews, and for authors and
+categories the sum over their books.
+
+Short prefixes match thousands of keys. Their best matches are computed
+when the index is built or patched, for every prefix matching more than
+SCAN_LIMIT keys, so a lookup never ranks more than SCAN_LIMIT keys.
+
+Authors and categories are only indexed while they have books.
+"""
+import bisect
+import dataclasses
+import heapq
+import math
+from typing import Iterable
+
+from books.dtos import book as book_dtos
+
+BOOK = "book"
+AUTHOR = "author"
+CATEGORY = "category"
+
+# Suggestions returned by one lookup at most
+MAX_LIMIT = 20
+# Prefixes matching more keys have their best matches precomputed
+SCAN_LIMIT = 256
+
+# Sorts after every character a name may contain
+_LAST = "\U0010ffff"
+
+# (type, id) of a suggestion
+Ref = tuple[str, int]
+# (key, type, id)
+Entry = tuple[str, str, int]
+
+
+@dataclasses.dataclass(frozen=True)
+class SuggestBook:
+    id: int
+    name: str
+    author_id: int
+    author_name: str
+    category_id: int
+    category_name: str
+    rating_sum: int = 0
+    review_count: int = 0
+
+    @property
+    def weight(self) -> float:
+        if not self.review_count:
+            return 0.0
+        return (self.rating_sum / self.review_count *
+                math.log1p(self.review_count))
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.casefold().replace("ё", "е").split())
+
+
+def keys_of(text: str) -> set[str]:
+    words = normalize(text).split(" ")
+    return {" ".join(words[start:]) for start in range(len(words))} - {""}
+
+
+class SuggestIndex:
+    """
+    Immutable once built, patch returns a new index.
+    """
+
+    def __init__(self, books: dict[int, SuggestBook], members: dict[Ref,
+                                                                    set[int]],
+                 texts: dict[Ref, str], weights: dict[Ref, float],
+                 entries: list[Entry], tops: dict[str, list[Ref]]):
+        self._books = books
+        # Books of every indexed author and category
+        self._members = members
+        self._texts = texts
+        self._weights = weights
+        self._entries = entries
+        self._tops = tops
+
+    @classmethod
+    def from_books(cls, books: Iterable[SuggestBook]) -> "SuggestIndex":
+        index = cls(books={},
+                    members={},
+                    texts={},
+                    weights={},
+                    entries=[],
+                    tops={})
+        refs = index._add_books(books)
+        index._entries = sorted(index._entries_of(refs))
+        index._visit("", 0, len(index._entries))
+        return index
+
+    def suggest(self, prefix: str, limit: int) -> list[book_dtos.Suggestion]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        refs = self._tops.get(prefix)
+        if refs is None:
+            refs = self._best(*self._range(prefix))
+        return [
+            book_dtos.Suggestion(type=ref[0], id=ref[1], text=self._texts[ref])
+            for ref in refs[:limit]
+        ]
+
+    def patch(self, book_ids: Iterable[int],
+              changed: "SuggestIndex") -> "SuggestIndex":
+        """
+        Returns a copy with the books of `book_ids` replaced by the books
+        of `changed`. Ids missing from `changed` are removed.
+        """
+        index = SuggestIndex(books=dict(self._books),
+                             members={
+                                 ref: set(members)
+                                 for ref, members in self._members.items()
+                             },
+                             texts=dict(self._texts),
+                             weights=dict(self._weights),
+                             entries=self._entries,
+                             tops=dict(self._tops))
+        refs = set()
+        for book_id in book_ids:
+            book = index._books.pop(int(book_id), None)
+            if book is not None:
+                refs |= index._remove_book(book)
+        refs |= index._add_books(changed._books.values())
+
+        removed = list(self._entries_of(refs))
+        added = list(index._entries_of(refs))
+        index._entries = list(self._entries)
+        for entry in removed:
+            del index._entries[bisect.bisect_left(index._entries, entry)]
+        for entry in added:
+            bisect.insort(index._entries, entry)
+        index._refresh_tops({entry[0]
+                             for entry in removed + added}, refs, self)
+        return index
+
+    def _add_books(self, books: Iterable[SuggestBook]) -> set[Ref]:
+        refs = set()
+        for book in books:
+            self._books[book.id] = book
+            self._texts[(BOOK, book.id)] = book.name
+            self._texts[(AUTHOR, book.author_id)] = book.author_name
+            self._texts[(CATEGORY, book.category_id)] = book.category_name
+            for ref in ((AUTHOR, book.author_id), (CATEGORY,
+                                                   book.category_id)):
+                self._members.setdefault(ref, set()).add(book.id)
+            refs |= self._refs_of(book)
+        self._weigh(refs)
+        return refs
+
+    def _remove_book(self, book: SuggestBook) -> set[Ref]:
+        refs = self._refs_of(book)
+        del self._texts[(BOOK, book.id)]
+        for ref in refs - {(BOOK, book.id)}:
+            self._members[ref].discard(book.id)
+            if not self._members[ref]:
+                del self._members[ref]
+                del self._texts[ref]
+        self._weigh(refs)
+        return refs
+
+    def _weigh(self, refs: set[Ref]) -> None:
+        for ref in refs:
+            if ref not in self._texts:
+                self._weights.pop(ref, None)
+            elif ref[0] == BOOK:
+                self._weights[ref] = self._books[ref[1]].weight
+            else:
+                self._weights[ref] = sum(self._books[book_id].weight
+                                         for book_id in self._members[ref])
+
+    def _entries_of(self, refs: set[Ref]) -> Iterable[Entry]:
+        for ref in refs:
+            if ref in self._texts:
+                for key in keys_of(self._texts[ref]):
+                    yield (key, *ref)
+
+    def _range(self, prefix: str) -> tuple[int, int]:
+        return (bisect.bisect_left(self._entries, (prefix, )),
+                bisect.bisect_left(self._entries, (prefix + _LAST, )))
+
+    def _best(self, start: int, end: int) -> list[Ref]:
+        refs = {entry[1:] for entry in self._entries[start:end]}
+        return heapq.nsmallest(MAX_LIMIT, refs, key=self._rank)
+
+    def _rank(self, ref: Ref) -> tuple[float, str, Ref]:
+        return (-self._weights[ref], self._texts[ref], ref)
+
+    def _visit(self, prefix: str, start: int, end: int) -> None:
+        # Precomputes the best matches of `prefix` and of its extensions
+        # that match more than SCAN_LIMIT keys.
+        if end - start <= SCAN_LIMIT:
+            return
+        if prefix:
+            self._tops[prefix] = self._best(start, end)
+        position = start
+        while position < end:
+            key = self._entries[position][0]
+            if len(key) == len(prefix):
+                position += 1
+                continue
+            child = key[:len(prefix) + 1]
+            child_end = bisect.bisect_left(self._entries, (child + _LAST, ),
+                                           position, end)
+            self._visit(child, position, child_end)
+            position = child_end
+
+    def _refresh_tops(self, keys: set[str], refs: set[Ref],
+                      previous: "SuggestIndex") -> None:
+        prefixes = {
+            key[:length]
+            for key in keys
+            for length in range(1,
+                                len(key) + 1)
+        }
+        # Shorter first, the extensions of a light prefix are light too.
+        light = set()
+        for prefix in sorted(prefixes, key=len):
+            if prefix[:-1] in light:
+                start, end = 0, 0
+            else:
+                start, end = self._range(prefix)
+            if end - start <= SCAN_LIMIT:
+                light.add(prefix)
+                self._tops.pop(prefix, None)
+                continue
+            top = self._tops.get(prefix)
+            if top is not None:
+                top = self._merge_top(prefix, top, refs, previous)
+            self._tops[prefix] = top or self._best(start, end)
+
+    def _merge_top(self, prefix: str, top: list[Ref], refs: set[Ref],
+                   previous: "SuggestIndex") -> list[Ref] | None:
+        """
+        Returns the best matches of `prefix` from its previous ones and the
+        changed `refs`, or None when that is not enough to tell them.
+        Unchanged refs outside the previous top rank after its last one.
+        """
+        if len(top) < MAX_LIMIT:
+            return None
+        cutoff = previous._rank(top[-1])
+        candidates = {ref for ref in top if ref not in refs}
+        candidates.update(ref for ref in refs if ref in self._texts and any(
+            key.startswith(prefix) for key in keys_of(self._texts[ref])))
+        ranked = sorted(candidates, key=self._rank)[:MAX_LIMIT]
+        if len(ranked) < MAX_LIMIT or self._rank(ranked[-1]) > cutoff:
+            return None
+        return ranked
+
+    @staticmethod
+    def _refs_of(book: SuggestBook) -> set[Ref]:
+        return {(BOOK, book.id), (AUTHOR, book.author_id),
+                (CATEGORY, book.category_id)}
@@ -1,2 +1,1629 @@
+import collections
+import dataclasses
+import datetime
+import io
+import itertools
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from books import backfill, models
+from books.api.throttles import BookDetailThrottle, BookListThrottle
+from books import outbox
+from books.caches import favourites as favourites_module
+from books.caches.book_detail import book_detail_cache
+from books.caches.favourites import FavouritesSet, favourites_cache
+from books.caches.lookups import lookups_cache
+from books.catalogue import EPOCH, Catalogue
+from books.recommendations import similar_books
+from books.suggest import MAX_LIMIT, SuggestBook, SuggestIndex
+from books.dtos.book import BookReview, User
+from books.exceptions import AlreadyExistsException, ChangesExpiredException
+from books.repos.book import BookRepository, IBookRepository
+from books.repos.memory import InMemoryBookRepository
+from books.repos.sql import SqlBookRepository
+from books.use_cases.books import add_to_favourite_use_case, create_review_use_case, get_book_use_case, get_feed_use_case, list_books_use_case
+from books_project import profiling, throttling
+from books_project.middleware import AdmissionControlMiddleware, ProfilingMiddleware
+from users.models import CustomUser
+
+
+def race(write, threads: int = 10) -> dict[str, int]:
+    """
+    Runs `write` from `threads` threads at once, returns the number of
+    each outcome: "created", "already exists" or the name of any other
+    exception raised.
+    """
+    outcomes = collections.Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        barrier.wait()
+        try:
+            write()
+            outcome = "created"
+        except AlreadyExistsException:
+            outcome = "already exists"
+        except Exception as error:
+            outcome = type(error).__name__
+        finally:
+            connection.close()
+        with lock:
+            outcomes[outcome] += 1
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return dict(outcomes)
+
+
+def create_user(email: str) -> User:
+    user = CustomUser.objects.create_user(email=email, password="password")
+    return User(id=user.id, email=user.email)
+
+
+def create_book(name: str = "Война и мир") -> models.Book:
+    author, _ = models.Author.objects.get_or_create(first_name="Лев",
+                                                    last_name="Толстой")
+    category, _ = models.Category.objects.get_or_create(name="classics")
+    return models.Book.objects.create(author=author,
+                                      category=category,
+                                      name=name,
+                                      description="...")
+
+
+class FakeClock:
+    """
+    Stands in for the time module of the code under test. Every reading
+    moves it on by `tick` seconds, sleeping moves it on by the time slept.
+    """
+
+    def __init__(self, now: float = 1_000_000.0, tick: float = 0.0):
+        self.now = now
+        self.tick = tick
+
+    def time(self) -> float:
+        now = self.now
+        self.now += self.tick
+        return now
+
+    monotonic = perf_counter = time
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def patch_clock(test: SimpleTestCase, module: str, **kwargs) -> FakeClock:
+    clock = FakeClock(**kwargs)
+    patcher = mock.patch(f"{module}.time", clock)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    return clock
+
+
+def token_headers(email: str) -> dict[str, str]:
+    user = CustomUser.objects.create_user(email=email, password="password")
+    return {"Authorization": f"Token {Token.objects.create(user=user).key}"}
+
+
+class ClearCachesMixin:
+    """
+    The book caches are process wide and keyed by ids and filters only,
+    every test starts from an empty shared cache. The in-process copies
+    follow its version counters and reload.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+
+class ConcurrentWritesMixin:
+    """
+    For tests racing writes from several threads. They need a database
+    that lets writers wait for each other: SQLite in memory shares its
+    cache between connections and fails on a lock instead of waiting.
+    """
+
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("SQLite in memory does not wait for locks, run "
+                          "with --settings=books_project.test_settings")
+        super().setUp()
+
+
+class CreateReviewRaceTests(ConcurrentWritesMixin, ClearCachesMixin,
+                            TransactionTestCase):
+    repositories = (BookRepository, SqlBookRepository)
+
+    def setUp(self):
+        super().setUp()
+        self.book = create_book()
+
+    def create_review(self, repo, user: User) -> None:
+        create_review_use_case(repo,
+                               user=user,
+                               review=BookReview(book_id=self.book.id,
+                                                 rating=5,
+                                                 review="..."))
+
+    def test_parallel_duplicates(self):
+        for repo_class in self.repositories:
+            with self.subTest(repo=repo_class.__name__):
+                user = create_user(f"{repo_class.__name__}@example.com")
+                outcomes = race(lambda: self.create_review(repo_class(), user))
+                self.assertEqual(outcomes, {"created": 1, "already exists": 9})
+                self.assertEqual(
+                    models.BookReview.objects.filter(user_id=user.id).count(),
+                    1)
+
+    def test_parallel_missing_book(self):
+        for repo_class in self.repositories:
+            with self.subTest(repo=repo_class.__name__):
+                user = create_user(f"{repo_class.__name__}@example.com")
+                outcomes = race(lambda: create_review_use_case(
+                    repo_class(),
+                    user=user,
+                    review=BookReview(book_id=0, rating=5, review="...")))
+                self.assertEqual(outcomes, {"DoesNotExist": 10})
+
+
+class ArchivedReviewTests(ClearCachesMixin, TestCase):
+    repositories = (BookRepository, SqlBookRepository)
+
+    def setUp(self):
+        super().setUp()
+        self.book = create_book()
+
+    def test_archived_review_is_a_duplicate(self):
+        for repo_class in self.repositories:
+            with self.subTest(repo=repo_class.__name__):
+                repo = repo_class()
+                user = create_user(f"{repo_class.__name__}@example.com")
+                review = BookReview(book_id=self.book.id,
+                                    rating=5,
+                                    review="...")
+                repo.create_review(user=user, review=review)
+                BookRepository().archive_reviews(
+                    created_before=timezone.now() +
+                    datetime.timedelta(seconds=1),
+                    batch_size=100)
+
+                with self.assertRaises(AlreadyExistsException):
+                    repo.create_review(user=user, review=review)
+                self.assertFalse(
+                    models.BookReview.objects.filter(user_id=user.id).exists())
+                self.assertEqual(
+                    models.ArchivedReview.objects.filter(
+                        user_id=user.id).count(), 1)
+
+
+class AddToFavouriteRaceTests(ConcurrentWritesMixin, ClearCachesMixin,
+                              TransactionTestCase):
+    repositories = (BookRepository, SqlBookRepository)
+
+    def setUp(self):
+        super().setUp()
+        self.book = create_book()
+
+    def test_parallel_duplicates(self):
+        for repo_class in self.repositories:
+            with self.subTest(repo=repo_class.__name__):
+                user = create_user(f"{repo_class.__name__}@example.com")
+                outcomes = race(lambda: add_to_favourite_use_case(
+                    repo_class(), user=user, book_id=self.book.id))
+                self.assertEqual(outcomes, {"created": 1, "already exists": 9})
+                self.assertEqual(
+                    CustomUser.favourites.through.objects.filter(
+                        customuser_id=user.id).count(), 1)
+                self.assertTrue(repo_class().is_user_favourite(
+                    user_id=user.id, book_id=self.book.id))
+
+    def test_parallel_missing_book(self):
+        for repo_class in self.repositories:
+            with self.subTest(repo=repo_class.__name__):
+                user = create_user(f"{repo_class.__name__}@example.com")
+                outcomes = race(lambda: add_to_favourite_use_case(
+                    repo_class(), user=user, book_id=0))
+                self.assertEqual(outcomes, {"DoesNotExist": 10})
+
+
+class LookupCacheTests(ClearCachesMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(20):
+            create_book(f"Книга {i}")
+
+    def test_one_version_check_per_list(self):
+        for repo in (BookRepository(), SqlBookRepository()):
+            with self.subTest(repo=type(repo).__name__):
+                repo.list_books(user=None,
+                                created_before=None,
+                                created_after=None,
+                                authors=None,
+                                categories=["classics"])
+                with mock.patch.object(cache, "get",
+                                       wraps=cache.get) as cache_get:
+                    books = repo.list_books(user=None,
+                                            created_before=None,
+                                            created_after=None,
+                                            authors=None,
+                                            categories=["classics"])
+                self.assertEqual(len(books), 20)
+                self.assertLessEqual(cache_get.call_count, 2)
+
+    def test_version_moves_after_commit(self):
+        category = models.Category.objects.get(name="classics")
+        lookups_cache.snapshot()
+        with transaction.atomic():
+            category.name = "classic"
+            category.save()
+            # A reader outside the transaction would reload the old name
+            self.assertEqual(
+                lookups_cache.snapshot().category(category.id).name,
+                "classics")
+        self.assertEqual(lookups_cache.snapshot().category(category.id).name,
+                         "classic")
+
+
+class BookDetailCacheTests(ClearCachesMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.book = create_book()
+        self.user = create_user("reader@example.com")
+
+    def get_name(self) -> str:
+        return get_book_use_case(BookRepository(),
+                                 user=self.user,
+                                 book_id=self.book.id).name
+
+    def rename(self, name: str) -> None:
+        with transaction.atomic():
+            self.book.name = name
+            self.book.save()
+
+    def test_invalidated_on_commit(self):
+        self.assertEqual(self.get_name(), "Война и мир")
+        with transaction.atomic():
+            self.book.name = "Война и мир, том 1"
+            self.book.save()
+            self.assertTrue(cache.has_key(f"books:detail:{self.book.id}"))
+        self.assertEqual(self.get_name(), "Война и мир, том 1")
+
+    def test_load_overlapping_a_write_is_not_stored(self):
+
+        def load_then_write():
+            detail = BookRepository().get_book_detail(user=None,
+                                                      book_id=self.book.id)
+            self.rename("Война и мир, том 1")
+            return detail
+
+        detail = book_detail_cache.get_or_load(self.book.id, load_then_write)
+        self.assertEqual(detail.name, "Война и мир")
+        self.assertEqual(self.get_name(), "Война и мир, том 1")
+
+    def test_new_review_invalidates(self):
+        self.get_name()
+        BookRepository().create_review(user=self.user,
+                                       review=BookReview(book_id=self.book.id,
+                                                         rating=4,
+                                                         review="..."))
+        detail = get_book_use_case(BookRepository(),
+                                   user=self.user,
+                                   book_id=self.book.id)
+        self.assertEqual([review.rating for review in detail.reviews], [4])
+
+
+class OutboxTests(TestCase):
+    topic = "test_event"
+
+    def setUp(self):
+        self.calls: list[tuple[int, list[int]]] = []
+        self.failing: set[int] = set()
+        patcher = mock.patch.dict(outbox._handlers,
+                                  {self.topic: [self.handle]})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def handle(self, book_id: int, events: list[models.OutboxEvent]) -> None:
+        # Writes first, so a failure shows whether they were rolled back
+        for event in events:
+            models.Change.objects.create(entity="test",
+                                         object_id=event.payload["n"])
+        if book_id in self.failing:
+            raise RuntimeError(book_id)
+        self.calls.append((book_id, [event.payload["n"] for event in events]))
+
+    def publish(self, book_id: int, n: int) -> None:
+        outbox.publish(self.topic, book_id=book_id, payload={"n": n})
+
+    def test_groups_per_book(self):
+        for book_id, n in ((1, 1), (2, 2), (1, 3)):
+            self.publish(book_id, n)
+        self.assertEqual(outbox.process_batch(), 3)
+        self.assertEqual(self.calls, [(1, [1, 3]), (2, [2])])
+        self.assertFalse(models.OutboxEvent.objects.exists())
+        self.assertEqual(outbox.process_batch(), 0)
+
+    def test_failed_group_is_rolled_back_alone(self):
+        self.publish(1, 1)
+        self.publish(2, 2)
+        self.failing = {1}
+        with self.assertLogs("books.outbox", "ERROR"):
+            outbox.process_batch()
+        self.assertEqual(self.calls, [(2, [2])])
+        self.assertEqual(
+            list(models.Change.objects.values_list("object_id", flat=True)),
+            [2])
+        self.assertEqual(
+            list(
+                models.OutboxEvent.objects.values_list("payload__n",
+                                                       "attempts")), [(1, 1)])
+
+    def test_retried_until_given_up(self):
+        self.failing = {1}
+        self.publish(1, 1)
+        with self.assertLogs("books.outbox", "ERROR"):
+            outbox.process_batch()
+            # Joins the group of the failed event, keeping its own count
+            self.publish(1, 2)
+            for _ in range(outbox.MAX_ATTEMPTS - 1):
+                outbox.process_batch()
+        self.assertEqual(
+            dict(
+                models.OutboxEvent.objects.values_list("payload__n",
+                                                       "attempts")),
+            {
+                1: outbox.MAX_ATTEMPTS,
+                2: outbox.MAX_ATTEMPTS - 1
+            })
+
+        self.failing = set()
+        self.assertEqual(outbox.process_batch(), 1)
+        self.assertEqual(self.calls, [(1, [2])])
+        # The event given up on stays, for inspection
+        self.assertEqual(outbox.process_batch(), 0)
+        self.assertEqual(
+            list(
+                models.OutboxEvent.objects.values_list("payload__n",
+                                                       flat=True)), [1])
+
+
+class BackfillTests(TestCase):
+    name = "test_authors"
+
+    def setUp(self):
+        self.ids = [
+            models.Author.objects.create(first_name=f"author-{i}",
+                                         last_name="...").id for i in range(8)
+        ]
+        # A gap in the keys
+        models.Author.objects.filter(id=self.ids.pop(1)).delete()
+        self.chunks: list[list[int]] = []
+        self.fail_at: int | None = None
+        self.clock = patch_clock(self, "books.backfill")
+        self.clock.sleep = mock.Mock(side_effect=self.clock.sleep)
+        patcher = mock.patch.dict(backfill._backfills)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        backfill.register(self.name, models.Author)(self.fill)
+
+    def fill(self, authors) -> None:
+        ids = list(authors.order_by("id").values_list("id", flat=True))
+        authors.update(last_name="filled")
+        if self.fail_at in ids:
+            raise RuntimeError(self.fail_at)
+        self.chunks.append(ids)
+        # Each chunk takes 0.1 s
+        self.clock.now += 0.1
+
+    def filled(self) -> list[int]:
+        return list(
+            models.Author.objects.filter(
+                last_name="filled").order_by("id").values_list("id",
+                                                               flat=True))
+
+    def test_chunks_up_to_the_last_key_at_start(self):
+
+        def fill_and_insert(authors):
+            self.fill(authors)
+            models.Author.objects.create(first_name=f"new-{len(self.chunks)}",
+                                         last_name="...")
+
+        backfill._backfills[self.name] = dataclasses.replace(
+            backfill.get(self.name), fn=fill_and_insert)
+        progress = backfill.run(self.name, chunk_size=3)
+        self.assertEqual(self.chunks,
+                         [self.ids[:3], self.ids[3:6], self.ids[6:]])
+        self.assertTrue(progress.finished)
+        self.assertEqual(progress.rows, 7)
+        self.assertEqual(progress.last_pk, self.ids[-1])
+        self.assertEqual(self.filled(), self.ids)
+
+    def test_resumes_after_a_failed_chunk(self):
+        self.fail_at = self.ids[4]
+        with self.assertRaises(RuntimeError):
+            backfill.run(self.name, chunk_size=3)
+        # The failed chunk rolled back with its checkpoint
+        checkpoint = models.BackfillCheckpoint.objects.get(name=self.name)
+        self.assertEqual(checkpoint.last_pk, self.ids[2])
+        self.assertEqual(checkpoint.rows, 3)
+        self.assertEqual(self.filled(), self.ids[:3])
+
+        self.fail_at = None
+        progress = backfill.run(self.name, chunk_size=3)
+        self.assertEqual(self.chunks,
+                         [self.ids[:3], self.ids[3:6], self.ids[6:]])
+        self.assertEqual(progress.rows, 7)
+        self.assertEqual(progress.run_rows, 4)
+
+    def test_command_restarts(self):
+        out = io.StringIO()
+        call_command("backfill", self.name, "--chunk-size", "4", stdout=out)
+        call_command("backfill", self.name, "--chunk-size", "4", stdout=out)
+        self.assertEqual(len(self.chunks), 2)
+        self.assertIn("finished", out.getvalue())
+
+        call_command("backfill",
+                     self.name,
+                     "--chunk-size",
+                     "4",
+                     "--restart",
+                     stdout=out)
+        self.assertEqual(self.chunks, [self.ids[:4], self.ids[4:]] * 2)
+
+    def test_sleeps_to_keep_the_rate(self):
+        backfill.run(self.name, chunk_size=3, max_rows_per_second=10)
+        # 3 rows take 0.3 s at 10 rows/s, the chunk itself took 0.1 s.
+        # There is no sleep after the last chunk.
+        sleeps = [call.args[0] for call in self.clock.sleep.call_args_list]
+        self.assertEqual(len(sleeps), 2)
+        for slept in sleeps:
+            self.assertAlmostEqual(slept, 0.2)
+
+        backfill.reset(self.name)
+        self.clock.sleep.reset_mock()
+        backfill.run(self.name,
+                     chunk_size=3,
+                     max_rows_per_second=10,
+                     pause=0.5)
+        self.assertEqual(
+            [call.args[0] for call in self.clock.sleep.call_args_list],
+            [0.5, 0.5])
+
+
+class RebuildBookStatsTests(ClearCachesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.book = create_book()
+        self.repo = BookRepository()
+
+    def review(self, email: str, rating: int) -> None:
+        self.repo.create_review(user=create_user(email),
+                                review=BookReview(book_id=self.book.id,
+                                                  rating=rating,
+                                                  review="..."))
+
+    def review_count(self) -> int:
+        return self.repo.get_book_stats(self.book.id).review_count
+
+    def test_queued_reviews_are_left_to_the_worker(self):
+        self.review("first@example.com", 5)
+        outbox.process_batch()
+        self.review("second@example.com", 3)
+
+        self.assertEqual(self.repo.rebuild_book_stats(batch_size=10), 1)
+        self.assertEqual(self.review_count(), 1)
+        outbox.process_batch()
+        stats = self.repo.get_book_stats(self.book.id)
+        self.assertEqual(stats.review_count, 2)
+        self.assertEqual(stats.average_rating, 4)
+
+    def test_reviews_given_up_on_are_counted(self):
+        self.review("first@example.com", 5)
+        models.OutboxEvent.objects.update(attempts=outbox.MAX_ATTEMPTS)
+        self.repo.rebuild_book_stats(batch_size=10)
+        self.assertEqual(self.review_count(), 1)
+
+    def test_books_without_reviews_lose_their_stats(self):
+        models.BookStats.objects.create(book=self.book, review_count=3)
+        self.assertEqual(self.repo.rebuild_book_stats(batch_size=10), 0)
+        self.assertFalse(models.BookStats.objects.exists())
+
+
+class FavouritesCacheTests(ClearCachesMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.book = create_book()
+        self.other = create_book("Анна Каренина")
+        self.user = create_user("reader@example.com")
+
+    def test_write_during_cold_load(self):
+        writes = [
+            lambda: BookRepository().add_to_favourite(user_id=self.user.id,
+                                                      book_id=self.book.id)
+        ]
+
+        class LoadThenWrite(FavouritesSet):
+            # The set is read from the database, then another worker adds
+            # a favourite before the reader publishes it.
+            def __init__(self, book_ids=()):
+                super().__init__(book_ids)
+                if writes:
+                    writes.pop()()
+
+        with mock.patch.object(favourites_module, "FavouritesSet",
+                               LoadThenWrite):
+            self.assertNotIn(self.book.id, favourites_cache.get(self.user.id))
+        self.assertIn(self.book.id, favourites_cache.get(self.user.id))
+
+    def test_add_updates_cached_set(self):
+        self.assertEqual(list(favourites_cache.get(self.user.id)), [])
+        BookRepository().add_to_favourite(user_id=self.user.id,
+                                          book_id=self.book.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(list(favourites_cache.get(self.user.id)),
+                             [self.book.id])
+
+    def test_related_manager_changes(self):
+        user = CustomUser.objects.get(id=self.user.id)
+        user.favourites.add(self.book, self.other)
+        self.assertEqual(sorted(favourites_cache.get(self.user.id)),
+                         sorted([self.book.id, self.other.id]))
+        user.favourites.remove(self.book)
+        self.assertEqual(list(favourites_cache.get(self.user.id)),
+                         [self.other.id])
+        self.other.users.clear()
+        self.assertEqual(list(favourites_cache.get(self.user.id)), [])
+        self.book.users.add(user)
+        self.assertEqual(list(favourites_cache.get(self.user.id)),
+                         [self.book.id])
+        user.favourites.clear()
+        self.assertEqual(list(favourites_cache.get(self.user.id)), [])
+
+
+class RepositoryContract(ClearCachesMixin):
+    """
+    Behaviour every IBookRepository shares, run against each of them by
+    the test cases below. They are transaction test cases, SQLite only
+    checks foreign keys at commit.
+    """
+
+    def make_repo(self) -> IBookRepository:
+        raise NotImplementedError
+
+    def add_author(self, first_name: str, last_name: str) -> int:
+        return models.Author.objects.create(first_name=first_name,
+                                            last_name=last_name).id
+
+    def add_category(self, name: str) -> int:
+        return models.Category.objects.create(name=name).id
+
+    def add_book(self, name: str, author_id: int, category_id: int) -> int:
+        return models.Book.objects.create(name=name,
+                                          author_id=author_id,
+                                          category_id=category_id,
+                                          description="...").id
+
+    def settle(self) -> None:
+        """
+        Applies the derived updates the outbox worker makes.
+        """
+        while outbox.process_batch():
+            pass
+
+    def setUp(self):
+        super().setUp()
+        self.repo = self.make_repo()
+        self.tolstoy = self.add_author("Лев", "Толстой")
+        self.pushkin = self.add_author("Александр", "Пушкин")
+        self.classics = self.add_category("classics")
+        self.poetry = self.add_category("poetry")
+        self.war_and_peace = self.add_book("Война и мир", self.tolstoy,
+                                           self.classics)
+        self.anna = self.add_book("Анна Каренина", self.tolstoy, self.classics)
+        self.onegin = self.add_book("Евгений Онегин", self.pushkin,
+                                    self.poetry)
+        self.reader = create_user("reader@example.com")
+        self.critic = create_user("critic@example.com")
+
+    def review(self, user: User, book_id: int, rating: int) -> BookReview:
+        return self.repo.create_review(user=user,
+                                       review=BookReview(book_id=book_id,
+                                                         rating=rating,
+                                                         review="..."))
+
+    def list_books(self, **filters) -> list[tuple]:
+        options = dict(created_before=None,
+                       created_after=None,
+                       authors=None,
+                       categories=None)
+        options.update(filters)
+        return [(book.id, book.name, book.author.full_name, book.category,
+                 book.average_rating, book.favourite)
+                for book in self.repo.list_books(user=self.reader, **options)]
+
+    def test_list_books(self):
+        self.review(self.reader, self.anna, 4)
+        self.review(self.critic, self.anna, 1)
+        self.repo.add_to_favourite(user_id=self.reader.id, book_id=self.onegin)
+        self.settle()
+
+        self.assertEqual(self.list_books(), [
+            (self.war_and_peace, "Война и мир", "Толстой Лев", "classics", 0.0,
+             False),
+            (self.anna, "Анна Каренина", "Толстой Лев", "classics", 2.5,
+             False),
+            (self.onegin, "Евгений Онегин", "Пушкин Александр", "poetry", 0.0,
+             True),
+        ])
+        self.assertEqual(
+            [book[0] for book in self.list_books(authors=[self.tolstoy])],
+            [self.war_and_peace, self.anna])
+        self.assertEqual(
+            [book[0] for book in self.list_books(categories=["poetry"])],
+            [self.onegin])
+        self.assertEqual(
+            self.list_books(authors=[self.pushkin], categories=["classics"]),
+            [])
+        self.assertEqual(
+            self.list_books(created_before=timezone.now() -
+                            datetime.timedelta(days=1)), [])
+
+    def test_count_facets(self):
+        self.review(self.reader, self.anna, 4)
+        self.settle()
+        facets = self.repo.count_facets(
+            facets=["category", "author", "rating_bucket"],
+            created_before=None,
+            created_after=None,
+            authors=None,
+            categories=None)
+        self.assertEqual([(value.id, value.count)
+                          for value in facets["category"]],
+                         [(self.classics, 2), (self.poetry, 1)])
+        self.assertEqual([(value.id, value.count)
+                          for value in facets["author"]], [(self.tolstoy, 2),
+                                                           (self.pushkin, 1)])
+        self.assertEqual([(value.id, value.count)
+                          for value in facets["rating_bucket"]], [(4, 1),
+                                                                  (0, 2)])
+
+    def test_book_detail(self):
+        self.review(self.reader, self.anna, 5)
+        self.review(self.critic, self.anna, 2)
+        self.settle()
+        detail = self.repo.get_book_detail(user=None, book_id=self.anna)
+        self.assertEqual(
+            (detail.name, detail.author.full_name, detail.category,
+             detail.average_rating, detail.favourite),
+            ("Анна Каренина", "Толстой Лев", "classics", 3.5, False))
+        self.assertEqual(sorted(review.rating for review in detail.reviews),
+                         [2, 5])
+        with self.assertRaises(ObjectDoesNotExist):
+            self.repo.get_book_detail(user=None, book_id=0)
+
+    def test_book_details(self):
+        self.review(self.reader, self.anna, 5)
+        self.settle()
+        details = self.repo.get_book_details(user=self.reader,
+                                             book_ids=[self.anna, 0],
+                                             reviews_limit=5)
+        self.assertEqual(details[0].id, self.anna)
+        self.assertEqual(details[0].average_rating, 5.0)
+        self.assertIsNone(details[1])
+
+    def test_create_review(self):
+        created = self.review(self.reader, self.anna, 4)
+        self.assertIsNotNone(created.id)
+        with self.assertRaises(AlreadyExistsException):
+            self.review(self.reader, self.anna, 5)
+        with self.assertRaises(ObjectDoesNotExist):
+            self.review(self.reader, 0, 5)
+        review = self.repo.get_book_review(user_id=self.reader.id,
+                                           book_id=self.anna)
+        self.assertEqual((review.book_id, review.rating), (self.anna, 4))
+        self.assertIsNone(
+            self.repo.get_book_review(user_id=self.critic.id,
+                                      book_id=self.anna))
+
+    def test_add_to_favourite(self):
+        self.repo.add_to_favourite(user_id=self.reader.id, book_id=self.anna)
+        with self.assertRaises(AlreadyExistsException):
+            self.repo.add_to_favourite(user_id=self.reader.id,
+                                       book_id=self.anna)
+        with self.assertRaises(ObjectDoesNotExist):
+            self.repo.add_to_favourite(user_id=self.reader.id, book_id=0)
+        self.assertTrue(
+            self.repo.is_user_favourite(user_id=self.reader.id,
+                                        book_id=self.anna))
+        self.assertFalse(
+            self.repo.is_user_favourite(user_id=self.critic.id,
+                                        book_id=self.anna))
+        self.assertEqual(self.repo.get_favourite_ids(user_id=self.reader.id),
+                         [self.anna])
+
+    def test_book_stats(self):
+        for user, rating in ((self.reader, 5), (self.critic, 2)):
+            self.review(user, self.anna, rating)
+        self.settle()
+        stats = self.repo.get_book_stats(book_id=self.anna)
+        self.assertEqual(stats.review_count, 2)
+        self.assertEqual(stats.average_rating, 3.5)
+        self.assertEqual(stats.histogram, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+        with self.assertRaises(ObjectDoesNotExist):
+            self.repo.get_book_stats(book_id=0)
+
+    def test_user_affinity_and_feed(self):
+        self.repo.add_to_favourite(user_id=self.reader.id, book_id=self.anna)
+        self.review(self.reader, self.war_and_peace, 5)
+        self.review(self.reader, self.onegin, 1)
+        self.settle()
+        affinity = self.repo.get_user_affinity(user_id=self.reader.id)
+        self.assertEqual(affinity.authors, {
+            self.tolstoy: 2.0,
+            self.pushkin: -1.0
+        })
+        self.assertEqual(affinity.categories, {
+            self.classics: 2.0,
+            self.poetry: -1.0
+        })
+        feed = get_feed_use_case(self.repo, user=self.reader, limit=10)
+        self.assertEqual([book.id for book in feed],
+                         [self.war_and_peace, self.onegin])
+
+    def test_book_reviews_pages_through_archive(self):
+        users = [self.reader, self.critic
+                 ] + [create_user(f"user{i}@example.com") for i in range(3)]
+        ids = [self.review(user, self.anna, 4).id for user in users]
+        self.settle()
+        archived = self.repo.archive_reviews(created_before=timezone.now() +
+                                             datetime.timedelta(seconds=1),
+                                             batch_size=2)
+        self.assertEqual(archived, 5)
+        # One more after archiving, so pages span both tables
+        ids.append(
+            self.review(create_user("late@example.com"), self.anna, 1).id)
+
+        seen = []
+        before = None
+        while True:
+            page = self.repo.get_book_reviews(book_id=self.anna,
+                                              before=before,
+                                              limit=4)
+            seen.extend(review.id for review in page.reviews)
+            if page.next is None:
+                break
+            before = page.next
+        self.assertEqual(seen, sorted(ids, reverse=True))
+        detail = self.repo.get_book_detail(user=None, book_id=self.anna)
+        self.assertEqual(len(detail.reviews), 1)
+        self.assertEqual(detail.average_rating, 3.5)
+        with self.assertRaises(AlreadyExistsException):
+            self.review(self.reader, self.anna, 5)
+        with self.assertRaises(ObjectDoesNotExist):
+            self.repo.get_book_reviews(book_id=0, before=None, limit=4)
+
+    @mock.patch("books.repos.book.CHANGES_SETTLE_SECONDS", 0)
+    def test_changes(self):
+        token = int(self.repo.get_change_token())
+        created = self.review(self.reader, self.anna, 4)
+        self.repo.add_to_favourite(user_id=self.reader.id, book_id=self.onegin)
+        self.settle()
+
+        change_set = self.repo.get_changes(user=self.reader,
+                                           since=token,
+                                           limit=100)
+        self.assertFalse(change_set.has_more)
+        self.assertEqual([review.id for review in change_set.reviews],
+                         [created.id])
+        self.assertEqual([stats.book_id for stats in change_set.stats],
+                         [self.anna])
+        self.assertEqual(change_set.favourites, [self.onegin])
+        self.assertEqual(change_set.token, self.repo.get_change_token())
+
+        others = self.repo.get_changes(user=self.critic,
+                                       since=token,
+                                       limit=100)
+        self.assertEqual(others.favourites, [])
+        first = self.repo.get_changes(user=self.reader, since=token, limit=1)
+        self.assertTrue(first.has_more)
+
+    @mock.patch("books.repos.book.CHANGES_SETTLE_SECONDS", 0)
+    def test_archived_reviews_are_deleted_changes(self):
+        created = self.review(self.reader, self.anna, 4)
+        self.settle()
+        token = int(self.repo.get_change_token())
+        self.repo.archive_reviews(created_before=timezone.now() +
+                                  datetime.timedelta(seconds=1),
+                                  batch_size=10)
+        change_set = self.repo.get_changes(user=None, since=token, limit=100)
+        self.assertEqual(change_set.deleted_reviews, [created.id])
+
+    @mock.patch("books.repos.book.CHANGES_SETTLE_SECONDS", 0)
+    def test_pruned_changes(self):
+        token = int(self.repo.get_change_token())
+        self.review(self.reader, self.anna, 4)
+        self.settle()
+        now = timezone.now() + datetime.timedelta(seconds=1)
+        self.assertGreater(
+            self.repo.prune_changes(created_before=now, batch_size=2), 2)
+        self.assertEqual(
+            self.repo.prune_changes(created_before=now, batch_size=2), 0)
+        with self.assertRaises(ChangesExpiredException):
+            self.repo.get_changes(user=None, since=token, limit=100)
+        # A new token is never older than the pruned entries.
+        token = self.repo.get_change_token()
+        self.assertGreater(int(token), 0)
+        self.assertEqual(
+            self.repo.get_changes(user=None, since=int(token),
+                                  limit=100).token, token)
+
+    def test_similar_books(self):
+        lonely = self.add_book("Пиковая дама", self.pushkin, self.classics)
+        third = create_user("third@example.com")
+        fourth = create_user("fourth@example.com")
+        for user, book_ids in ((self.reader,
+                                [self.anna, self.war_and_peace, self.onegin]),
+                               (self.critic, [self.anna, self.war_and_peace]),
+                               (fourth, [self.anna, self.war_and_peace]),
+                               (create_user("loner@example.com"), [lonely])):
+            for book_id in book_ids:
+                self.repo.add_to_favourite(user_id=user.id, book_id=book_id)
+        self.review(third, self.anna, 5)
+        self.review(third, self.onegin, 4)
+        # Too low to count as a like
+        self.review(third, self.war_and_peace, 3)
+        self.settle()
+
+        pairs = self.repo.get_interactions(min_rating=4)
+        self.assertEqual(len(pairs), 10)
+        self.repo.replace_similar_books(similar_books(pairs,
+                                                      top_k=20,
+                                                      min_common=2),
+                                        batch_size=2)
+
+        def similar(book_id: int) -> list[int]:
+            return [
+                book.id
+                for book in self.repo.get_similar_books(user=self.reader,
+                                                        book_id=book_id)
+            ]
+
+        # 3 of 4 and 3 readers in common against 2 of 4 and 2
+        self.assertEqual(similar(self.anna), [self.war_and_peace, self.onegin])
+        # Onegin shares a single reader with War and Peace
+        self.assertEqual(similar(self.war_and_peace), [self.anna])
+        self.assertEqual(similar(self.onegin), [self.anna])
+        self.assertEqual(similar(lonely), [])
+        with self.assertRaises(ObjectDoesNotExist):
+            self.repo.get_similar_books(user=self.reader, book_id=0)
+
+    def test_list_cache_is_per_test(self):
+        self.assertEqual(
+            len(
+                list_books_use_case(self.repo,
+                                    user=self.reader,
+                                    created_before=None,
+                                    created_after=None,
+                                    authors=None,
+                                    categories=None)), 3)
+
+
+class BookRepositoryContractTests(RepositoryContract, TransactionTestCase):
+
+    def make_repo(self) -> IBookRepository:
+        return BookRepository()
+
+
+class SqlBookRepositoryContractTests(RepositoryContract, TransactionTestCase):
+
+    def make_repo(self) -> IBookRepository:
+        return SqlBookRepository()
+
+
+class InMemoryBookRepositoryContractTests(RepositoryContract,
+                                          TransactionTestCase):
+
+    def make_repo(self) -> IBookRepository:
+        return InMemoryBookRepository()
+
+    def add_author(self, first_name: str, last_name: str) -> int:
+        return self.repo.add_author(first_name, last_name).author_id
+
+    def add_category(self, name: str) -> int:
+        return self.repo.add_category(name).id
+
+    def add_book(self, name: str, author_id: int, category_id: int) -> int:
+        return self.repo.add_book(name, author_id, category_id)
+
+    def settle(self) -> None:
+        pass
+
+
+class SqlParityTests(ClearCachesMixin, TestCase):
+    """
+    SqlBookRepository returns what BookRepository returns for the queries
+    it rewrites, on a catalogue with archived reviews and favourites.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = [
+            models.Author.objects.create(first_name=f"Имя {i}",
+                                         last_name=f"Фамилия {i}")
+            for i in range(3)
+        ]
+        categories = [
+            models.Category.objects.create(name=name)
+            for name in ("classics", "poetry", "drama")
+        ]
+        cls.start = timezone.now() - datetime.timedelta(days=30)
+        cls.book_ids = []
+        for i in range(12):
+            book = models.Book.objects.create(name=f"Книга {i}",
+                                              author=authors[i % 3],
+                                              category=categories[i % 4 % 3],
+                                              description=f"Описание {i}")
+            models.Book.objects.filter(id=book.id).update(
+                created_at=cls.start + datetime.timedelta(days=i))
+            cls.book_ids.append(book.id)
+        cls.users = [create_user(f"user{i}@example.com") for i in range(5)]
+        ratings = itertools.cycle([5, 3, 4, 1, 2, 5, 4])
+        for i, book_id in enumerate(cls.book_ids):
+            for user in cls.users[:i % 6]:
+                models.BookReview.objects.create(user_id=user.id,
+                                                 book_id=book_id,
+                                                 rating=next(ratings),
+                                                 review=f"Отзыв {i}")
+        for book_id in cls.book_ids[::4]:
+            CustomUser.favourites.through.objects.create(
+                customuser_id=cls.users[0].id, book_id=book_id)
+        # The oldest reviews move to the archive, the rest stay hot.
+        oldest = models.BookReview.objects.order_by("id")[10].created_at
+        BookRepository().archive_reviews(created_before=oldest, batch_size=4)
+
+    def assertSameResult(self, call):
+        self.assertEqual(call(BookRepository()), call(SqlBookRepository()))
+
+    def test_list_books(self):
+        filters = [
+            {},
+            dict(authors=[models.Author.objects.first().id]),
+            dict(categories=["poetry", "drama"]),
+            dict(categories=["missing"]),
+            dict(created_after=self.start + datetime.timedelta(days=3),
+                 created_before=self.start + datetime.timedelta(days=8)),
+        ]
+        for options in filters:
+            for user in (None, self.users[0], self.users[1]):
+                with self.subTest(filters=options, user=user):
+                    self.assertSameResult(lambda repo: [
+                        dataclasses.asdict(book)
+                        for book in repo.list_books(user=user,
+                                                    **{
+                                                        "created_before": None,
+                                                        "created_after": None,
+                                                        "authors": None,
+                                                        "categories": None,
+                                                        **options
+                                                    })
+                    ])
+
+    def test_book_detail(self):
+        self.assertEqual(models.ArchivedReview.objects.count(), 10)
+        for book_id in self.book_ids:
+            for user in (None, self.users[0]):
+                with self.subTest(book_id=book_id, user=user):
+                    self.assertSameResult(lambda repo: dataclasses.asdict(
+                        repo.get_book_detail(user=user, book_id=book_id)))
+        for repo in (BookRepository(), SqlBookRepository()):
+            with self.assertRaises(ObjectDoesNotExist):
+                repo.get_book_detail(user=None, book_id=0)
+
+
+class ListingParityTests(ClearCachesMixin, TestCase):
+    """
+    The book list read from book_listing matches the list joined from the
+    normalized tables after every kind of write.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.book = create_book()
+        self.other = create_book("Анна Каренина")
+        self.pushkin = models.Author.objects.create(first_name="Александр",
+                                                    last_name="Пушкин")
+        self.poetry = models.Category.objects.create(name="poetry")
+        self.onegin = models.Book.objects.create(author=self.pushkin,
+                                                 category=self.poetry,
+                                                 name="Евгений Онегин",
+                                                 description="...")
+        self.users = [create_user(f"user{i}@example.com") for i in range(3)]
+        for user, rating in zip(self.users, (5, 2, 4)):
+            BookRepository().create_review(user=user,
+                                           review=BookReview(
+                                               book_id=self.book.id,
+                                               rating=rating,
+                                               review="..."))
+        BookRepository().create_review(user=self.users[0],
+                                       review=BookReview(
+                                           book_id=self.onegin.id,
+                                           rating=3,
+                                           review="..."))
+        while outbox.process_batch():
+            pass
+
+    def list_books(self,
+                   from_listing: bool,
+                   from_index: bool = False,
+                   **filters) -> list[dict]:
+        options = dict(created_before=None,
+                       created_after=None,
+                       authors=None,
+                       categories=None)
+        options.update(filters)
+        with override_settings(BOOKS_LIST_FROM_LISTING=from_listing,
+                               BOOKS_LIST_FROM_INDEX=from_index):
+            return [
+                dataclasses.asdict(book)
+                for book in BookRepository().list_books(user=self.users[0],
+                                                        **options)
+            ]
+
+    def assertListingMatches(self):
+        self.assertEqual(BookRepository().find_stale_listings(batch_size=100),
+                         [])
+        for filters in ({}, dict(authors=[self.pushkin.id]),
+                        dict(categories=["poetry", "classics"]),
+                        dict(created_after=timezone.now() -
+                             datetime.timedelta(days=1))):
+            with self.subTest(filters=filters):
+                self.assertEqual(self.list_books(True, **filters),
+                                 self.list_books(False, **filters))
+
+    def test_after_writes(self):
+        self.assertListingMatches()
+        self.assertEqual(len(self.list_books(True, categories=["classics"])),
+                         2)
+
+    def test_after_renames(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pushkin.last_name = "Пушкин-Гончаров"
+            self.pushkin.save()
+            self.poetry.name = "poems"
+            self.poetry.save()
+            self.book.name = "Война и мир, том 1"
+            self.book.save()
+        self.assertListingMatches()
+
+    def test_after_deletes(self):
+        models.BookReview.objects.filter(user_id=self.users[1].id).delete()
+        self.other.delete()
+        self.assertListingMatches()
+
+    def test_after_archiving(self):
+        BookRepository().archive_reviews(created_before=timezone.now() +
+                                         datetime.timedelta(seconds=1),
+                                         batch_size=2)
+        self.assertListingMatches()
+
+    def test_catalogue_index(self):
+        # Loaded first, then patched by the writes below
+        self.list_books(False, from_index=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.onegin.name = "Онегин"
+            self.onegin.save()
+            self.other.delete()
+            create_book("Воскресение")
+        for filters in ({}, dict(authors=[self.pushkin.id]),
+                        dict(categories=["poetry", "classics"]),
+                        dict(created_before=timezone.now() -
+                             datetime.timedelta(days=1))):
+            with self.subTest(filters=filters):
+                self.assertEqual(
+                    self.list_books(False, from_index=True, **filters),
+                    self.list_books(False, **filters))
+
+    def test_rebuild(self):
+        models.BookListing.objects.all().delete()
+        self.assertEqual(
+            len(BookRepository().find_stale_listings(batch_size=100)), 3)
+        BookRepository().rebuild_book_listing(batch_size=2)
+        self.assertListingMatches()
+
+
+class BookEventsTests(ClearCachesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.book = create_book()
+        self.headers = token_headers("reader@example.com")
+
+    def test_needs_asgi(self):
+        response = self.client.get("/api/v1/books/events/",
+                                   {"books": self.book.id},
+                                   headers=self.headers)
+        self.assertEqual(response.status_code, 501)
+
+    async def test_streams_under_asgi(self):
+        response = await self.async_client.get("/api/v1/books/events/",
+                                               {"books": self.book.id},
+                                               headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+        await stream.aclose()
+
+
+@override_settings(
+    THROTTLE_BUCKETS={
+        "books_read": {
+            "capacity": 10,
+            "refill_rate": 5
+        },
+        "books_write": {
+            "capacity": 1,
+            "refill_rate": 1
+        },
+    })
+class TokenBucketThrottleTests(ClearCachesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.book = create_book()
+        self.headers = token_headers("reader@example.com")
+        self.clock = patch_clock(self, "books_project.throttling")
+
+    def get(self, path: str, headers: dict[str, str] | None = None):
+        return self.client.get(path, headers=headers or self.headers)
+
+    def throttle_request(self):
+        request = RequestFactory().get("/api/v1/books/")
+        request.user = CustomUser.objects.get(email="reader@example.com")
+        return request
+
+    def test_views_take_their_cost_from_the_bucket(self):
+        detail = f"/api/v1/books/{self.book.id}/"
+        # The list takes all 10 tokens, the detail one
+        self.assertEqual(self.get("/api/v1/books/").status_code, 200)
+        response = self.get(detail)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1")
+
+        self.clock.now += 0.25
+        self.assertEqual(self.get(detail).status_code, 200)
+        response = self.get("/api/v1/books/")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "2")
+
+        self.clock.now += 2
+        self.assertEqual(self.get("/api/v1/books/").status_code, 200)
+        # Buckets are per user
+        self.assertEqual(
+            self.get("/api/v1/books/",
+                     token_headers("critic@example.com")).status_code, 200)
+
+    def test_contended_bucket_throttles(self):
+        with mock.patch.object(cache, "add", return_value=False), \
+                mock.patch.object(throttling.local_buckets, "take") as local:
+            throttle = BookDetailThrottle()
+            self.assertFalse(
+                throttle.allow_request(self.throttle_request(), None))
+        local.assert_not_called()
+        self.assertEqual(throttle.wait(),
+                         throttling.shared_buckets.lock_timeout)
+
+    def test_unreachable_cache_uses_local_buckets(self):
+        with mock.patch.object(cache,
+                               "add",
+                               side_effect=ConnectionRefusedError):
+            self.assertTrue(BookListThrottle().allow_request(
+                self.throttle_request(), None))
+            throttle = BookListThrottle()
+            self.assertFalse(
+                throttle.allow_request(self.throttle_request(), None))
+            self.assertEqual(throttle.wait(), 2)
+
+    def test_lock_taken_over_is_left_to_its_owner(self):
+        request = self.throttle_request()
+        lock_key = f"throttle:books_read:user:{request.user.pk}:lock"
+        take_tokens = throttling.take_tokens
+
+        def expire_lock(*args):
+            # The lock expired and another worker took it
+            cache.set(lock_key, "other")
+            return take_tokens(*args)
+
+        with mock.patch.object(throttling,
+                               "take_tokens",
+                               side_effect=expire_lock):
+            self.assertTrue(BookDetailThrottle().allow_request(request, None))
+        self.assertEqual(cache.get(lock_key), "other")
+        cache.delete(lock_key)
+        self.assertTrue(BookDetailThrottle().allow_request(request, None))
+        self.assertIsNone(cache.get(lock_key))
+
+
+@override_settings(ADMISSION_MAX_IN_FLIGHT=1,
+                   ADMISSION_MAX_DB_LATENCY_MS=250,
+                   ADMISSION_RETRY_AFTER=3)
+class AdmissionControlTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def assertShed(self, response):
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "3")
+
+    def test_in_flight_limit(self):
+        inner = []
+
+        def view(request):
+            if request.path.startswith("/api/") and not inner:
+                inner.append(middleware(self.factory.get("/api/v1/books/")))
+                inner.append(middleware(self.factory.get("/admin/")))
+            return HttpResponse()
+
+        middleware = AdmissionControlMiddleware(view)
+        outer = middleware(self.factory.get("/api/v1/books/"))
+        self.assertEqual(outer.status_code, 200)
+        self.assertShed(inner[0])
+        # Only the API is shed
+        self.assertEqual(inner[1].status_code, 200)
+        # The finished request left room for the next one
+        self.assertEqual(
+            middleware(self.factory.get("/api/v1/books/")).status_code, 200)
+
+    def test_slow_database(self):
+        # Every query takes a second on this clock
+        clock = patch_clock(self, "books_project.middleware", tick=1.0)
+
+        def run_queries(count: int):
+
+            def view(request):
+                with connection.cursor() as cursor:
+                    for _ in range(count):
+                        cursor.execute("SELECT 1")
+                return HttpResponse()
+
+            return view
+
+        middleware = AdmissionControlMiddleware(run_queries(2))
+        # The moving average is about 190 ms after two slow queries
+        self.assertEqual(
+            middleware(self.factory.get("/api/v1/books/")).status_code, 200)
+        middleware.get_response = run_queries(1)
+        self.assertEqual(
+            middleware(self.factory.get("/api/v1/books/")).status_code, 200)
+        self.assertShed(middleware(self.factory.get("/api/v1/books/")))
+
+        # Samples older than the window no longer count
+        clock.now += middleware.latency_window
+        middleware.get_response = run_queries(0)
+        self.assertEqual(
+            middleware(self.factory.get("/api/v1/books/")).status_code, 200)
+
+
+@override_settings(PROFILING_SAMPLE_RATE=0,
+                   PROFILING_TOKEN_MAX_AGE=60,
+                   PROFILING_INTERVAL=0.001)
+class ProfilingMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(PROFILING_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.factory = RequestFactory()
+        self.middleware = ProfilingMiddleware(self.view)
+
+    def view(self, request):
+        # Long enough for the sampler to see this frame
+        time.sleep(0.05)
+        return HttpResponse()
+
+    def profile(self, path: str = "/api/v1/books/", **headers):
+        response = self.middleware(self.factory.get(path, headers=headers))
+        self.assertEqual(response.status_code, 200)
+        return response.get("X-Profile-Id")
+
+    def command_token(self, *args) -> str:
+        out = io.StringIO()
+        call_command("profile_token", *args, stdout=out)
+        header, _, token = out.getvalue().splitlines()[0].partition(": ")
+        self.assertEqual(header, "X-Profile")
+        return token
+
+    def test_token(self):
+        capture_id = self.profile(x_profile=self.command_token())
+        self.assertIsNotNone(capture_id)
+        self.assertEqual(
+            sorted(path.name for path in self.directory.iterdir()),
+            [f"{capture_id}.cpu.folded", f"{capture_id}.json"])
+        stacks = list(
+            profiling.read_folded(self.directory / f"{capture_id}.cpu.folded"))
+        self.assertTrue(
+            any(stack[-1].endswith("ProfilingMiddlewareTests.view")
+                for stack, _ in stacks))
+        metadata = json.loads(
+            (self.directory / f"{capture_id}.json").read_text())
+        self.assertEqual((metadata["id"], metadata["method"], metadata["path"],
+                          metadata["status"], metadata["samples"]),
+                         (capture_id, "GET", "/api/v1/books/", 200,
+                          sum(weight for _, weight in stacks)))
+        self.assertIsNone(metadata["allocated_bytes"])
+
+    def test_memory_token(self):
+        capture_id = self.profile(x_profile=self.command_token("--memory"))
+        self.assertTrue(
+            (self.directory / f"{capture_id}.alloc.folded").exists())
+        metadata = json.loads(
+            (self.directory / f"{capture_id}.json").read_text())
+        self.assertIsNotNone(metadata["peak_bytes"])
+
+    def test_rejected_tokens(self):
+        clock = patch_clock(self, "django.core.signing")
+        token = profiling.make_token()
+        self.assertIsNone(self.profile(x_profile=token + "x"))
+        self.assertIsNone(
+            self.profile(x_profile=signing.TimestampSigner(
+                salt="other").sign(profiling.CPU)))
+        clock.now += 61
+        self.assertIsNone(self.profile(x_profile=token))
+        clock.now -= 2
+        self.assertIsNotNone(self.profile(x_profile=token))
+        # Only the API is profiled
+        self.assertIsNone(self.profile("/admin/", x_profile=token))
+        self.assertEqual(len(list(self.directory.glob("*.json"))), 1)
+
+    @mock.patch("books_project.middleware.random.random", return_value=0.5)
+    def test_sample_rate(self, _):
+        self.assertIsNone(self.profile())
+        with override_settings(PROFILING_SAMPLE_RATE=0.6):
+            self.assertIsNotNone(self.profile())
+            self.assertIsNone(self.profile("/admin/"))
+            with override_settings(PROFILING_DIR=None):
+                self.assertIsNone(self.profile())
+        self.assertEqual(len(list(self.directory.glob("*.json"))), 1)
+
+
+class SiteOnlyMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.client = Client(enforce_csrf_checks=True)
+
+    def test_api_skips_sessions_csrf_and_messages(self):
+        response = self.client.get("/api/v1/books/",
+                                   headers=token_headers("reader@example.com"))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(hasattr(response.wsgi_request, "session"))
+        self.assertFalse(hasattr(response.wsgi_request, "_messages"))
+        self.assertNotIn("csrftoken", response.cookies)
+        self.assertNotIn("sessionid", response.cookies)
+
+    def test_admin_keeps_them(self):
+        CustomUser.objects.create_superuser(email="admin@example.com",
+                                            password="password")
+        response = self.client.get("/admin/login/")
+        self.assertTrue(hasattr(response.wsgi_request, "session"))
+        self.assertTrue(hasattr(response.wsgi_request, "_messages"))
+        csrf_token = response.cookies["csrftoken"].value
+
+        credentials = {"username": "admin@example.com", "password": "password"}
+        response = self.client.post("/admin/login/", credentials)
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(
+            "/admin/login/", dict(credentials, csrfmiddlewaretoken=csrf_token))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("sessionid", response.cookies)
+        self.assertEqual(self.client.get("/admin/").status_code, 200)
+
+
+class AdminSearchTests(ClearCachesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name in ("Война и мир", "Война миров", "Анна Каренина"):
+            create_book(name)
+        admin_user = CustomUser.objects.create_superuser(
+            email="admin@example.com", password="password")
+        self.client.force_login(admin_user)
+
+    def search(self, model: str, term: str) -> list[str]:
+        response = self.client.get(f"/admin/books/{model}/", {"q": term})
+        self.assertEqual(response.status_code, 200)
+        return sorted(str(row) for row in response.context["cl"].result_list)
+
+    def test_searches_by_prefix(self):
+        self.assertEqual(self.search("book", "Война"),
+                         ["Война и мир", "Война миров"])
+        self.assertEqual(self.search("book", "Война и"), ["Война и мир"])
+        self.assertEqual(self.search("book", "война"), [])
+        self.assertEqual(len(self.search("author", "Толст")), 1)
+        self.assertEqual(len(self.search("author", "Лев")), 1)
+
+    def test_searches_reviews_by_book_and_user(self):
+        user = create_user("reader@example.com")
+        for book in models.Book.objects.all():
+            models.BookReview.objects.create(user_id=user.id,
+                                             book=book,
+                                             rating=5,
+                                             review="...")
+        self.assertEqual(len(self.search("bookreview", "Война")), 2)
+        self.assertEqual(len(self.search("bookreview", "reader@")), 3)
+        self.assertEqual(len(self.search("bookreview", "admin@")), 0)
+
+    def test_prefix_uses_index(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("Query plans are checked on SQLite")
+        for queryset, index in (
+            (models.Book.objects.filter(name__prefix="Вой"),
+             "books_name_prefix_idx"),
+            (models.Author.objects.filter(last_name__prefix="Толст"),
+             "authors_last_name_prefix_idx"),
+        ):
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn(index, plan)
+
+
+class CataloguePatchTests(SimpleTestCase):
+    """
+    Patching a catalogue gives the catalogue built from the patched rows,
+    whichever path the patch takes.
+    """
+
+    def catalogue(self, rows: dict[int, tuple[int, int, float, int]]):
+        book_ids = sorted(rows)
+        columns = [rows[book_id] for book_id in book_ids]
+        return Catalogue.from_columns(
+            book_ids=np.array(book_ids, dtype=np.int64),
+            author_ids=np.array([row[0] for row in columns], dtype=np.int64),
+            category_ids=np.array([row[1] for row in columns], dtype=np.int64),
+            ratings=np.array([row[2] for row in columns], dtype=np.float32),
+            created_at=np.array([row[3] for row in columns], dtype=np.int64))
+
+    def random_row(self, rng: random.Random) -> tuple[int, int, float, int]:
+        return (rng.randint(1, 8), rng.randint(1, 5), rng.randint(0, 50) / 10,
+                rng.randint(0, 30) * 86_400_000_000)
+
+    def assertSameCatalogue(self, patched: Catalogue, expected: Catalogue,
+                            rng: random.Random):
+        for name in ("book_ids", "author_ids", "category_ids", "ratings",
+                     "created_at"):
+            np.testing.assert_array_equal(getattr(patched, name),
+                                          getattr(expected, name))
+        for _ in range(20):
+            filters = dict(
+                created_after=rng.choice([
+                    None, EPOCH + datetime.timedelta(days=rng.randint(0, 30))
+                ]),
+                created_before=rng.choice([
+                    None, EPOCH + datetime.timedelta(days=rng.randint(0, 30))
+                ]),
+                author_ids=rng.choice(
+                    [None, rng.sample(range(1, 9), rng.randint(0, 3))]),
+                category_ids=rng.choice(
+                    [None, rng.sample(range(1, 6), rng.randint(0, 2))]))
+            np.testing.assert_array_equal(patched.filter(**filters),
+                                          expected.filter(**filters))
+
+    def test_patch_matches_rebuild(self):
+        rng = random.Random(7)
+        for case in range(200):
+            with self.subTest(case=case):
+                rows = {
+                    book_id: self.random_row(rng)
+                    for book_id in rng.sample(range(1, 120), rng.randint(
+                        0, 60))
+                }
+                catalogue = self.catalogue(rows)
+                last_id = max(rows, default=0)
+                # Updates, deletes, appends after the last id and, in
+                # some cases, inserts below it.
+                changed_ids = set(rng.sample(sorted(rows), min(len(rows), 5)))
+                changed_ids.update(
+                    range(last_id + 1, last_id + 1 + rng.randint(0, 3)))
+                if case % 3 == 0:
+                    changed_ids.update(rng.sample(range(1, 120), 3))
+                changed = {}
+                for book_id in changed_ids:
+                    if rng.random() < 0.8:
+                        changed[book_id] = self.random_row(rng)
+                    rows.pop(book_id, None)
+                rows.update(changed)
+
+                patched = catalogue.patch(
+                    np.array(sorted(changed_ids), dtype=np.int64),
+                    self.catalogue(changed))
+                self.assertSameCatalogue(patched, self.catalogue(rows), rng)
+
+
+class SuggestIndexPatchTests(SimpleTestCase):
+    """
+    Patching the typeahead index gives the suggestions of the index built
+    from the patched books, for prefixes answered from the precomputed
+    tops and for the scanned ones.
+    """
+    words = ("война", "мир", "война и мир", "вой", "анна", "мирон", "ворон",
+             "ветер", "весна", "вечер")
+
+    def random_book(self, rng: random.Random, book_id: int) -> SuggestBook:
+        author_id = rng.randint(1, 6)
+        category_id = rng.randint(1, 3)
+        return SuggestBook(id=book_id,
+                           name=f"{rng.choice(self.words)} {book_id}",
+                           author_id=author_id,
+                           author_name=f"Автор {author_id}",
+                           category_id=category_id,
+                           category_name=f"Категория {category_id}",
+                           rating_sum=rng.randint(0, 50),
+                           review_count=rng.randint(0, 10))
+
+    def assertSameSuggestions(self, patched: SuggestIndex,
+                              expected: SuggestIndex):
+        prefixes = ("в", "во", "вой", "войн", "война", "война и", "ве", "м",
+                    "ми", "мир", "мир 1", "а", "ав", "автор", "к", "1", "2",
+                    "x")
+        for prefix in prefixes:
+            self.assertEqual(patched.suggest(prefix, MAX_LIMIT),
+                             expected.suggest(prefix, MAX_LIMIT), prefix)
+
+    def test_patch_matches_rebuild(self):
+        rng = random.Random(11)
+        books = {
+            book_id: self.random_book(rng, book_id)
+            for book_id in range(1, 2000)
+        }
+        index = SuggestIndex.from_books(books.values())
+        next_id = 2000
+        for step in range(30):
+            with self.subTest(step=step):
+                changed_ids = set(rng.sample(sorted(books), 3))
+                changed = {}
+                for book_id in changed_ids:
+                    if rng.random() < 0.7:
+                        changed[book_id] = self.random_book(rng, book_id)
+                if step % 5 == 0:
+                    changed[next_id] = self.random_book(rng, next_id)
+                    changed_ids.add(next_id)
+                    next_id += 1
+                for book_id in changed_ids:
+                    books.pop(book_id, None)
+                books.update(changed)
+
+                index = index.patch(changed_ids,
+                                    SuggestIndex.from_books(changed.values()))
+                self.assertSameSuggestions(
+                    index, SuggestIndex.from_books(books.values()))
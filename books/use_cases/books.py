@@ -1,8 +1,18 @@
+import dataclasses
 from datetime import datetime
 
-from books.dtos.book import BookDetail, User, BookReview, BookInfo
+from django.db import transaction
+
+from books.caches.book_detail import book_detail_cache
+from books.caches.book_list import book_list_cache, canonical_filters
+from books.caches.catalogue import catalogue_cache
+from books.caches.suggest import suggest_cache
+from books.events import REVIEW_CREATED, Event, broker
+from books.dtos.book import BookDetail, BookStats, ChangeSet, Facets, ReviewPage, Suggestion, User, BookReview, BookInfo
+from books.recommendations import rank_feed
 from books.repos.book import IBookRepository
-from books.exceptions import AlreadyExistsException
+
+BATCH_REVIEWS_LIMIT = 5
 
 
 def list_books_use_case(repo: IBookRepository, user: User,
@@ -10,27 +20,99 @@ def list_books_use_case(repo: IBookRepository, user: User,
                         created_after: datetime | None,
                         authors: list[str] | None,
                         categories: list[str] | None) -> list[BookInfo]:
-    return repo.list_books(user=user,
-                           created_before=created_before,
-                           created_after=created_after,
-                           authors=authors,
-                           categories=categories)
+    books = book_list_cache.get_or_load(
+        canonical_filters(created_before=created_before,
+                          created_after=created_after,
+                          authors=authors,
+                          categories=categories),
+        lambda: repo.list_books(user=None,
+                                created_before=created_before,
+                                created_after=created_after,
+                                authors=authors,
+                                categories=categories))
+    favourites = set(repo.get_favourite_ids(user_id=user.id))
+    return [
+        dataclasses.replace(book, favourite=True)
+        if book.id in favourites else book for book in books
+    ]
+
+
+def count_facets_use_case(repo: IBookRepository, facets: list[str],
+                          created_before: datetime | None,
+                          created_after: datetime | None,
+                          authors: list[int] | None,
+                          categories: list[str] | None) -> Facets:
+    return repo.count_facets(facets=facets,
+                             created_before=created_before,
+                             created_after=created_after,
+                             authors=authors,
+                             categories=categories)
 
 
 def get_book_use_case(repo: IBookRepository, user: User,
                       book_id: int) -> BookDetail:
-    return repo.get_book_detail(user=user, book_id=book_id)
+    book = book_detail_cache.get_or_load(
+        book_id, lambda: repo.get_book_detail(user=None, book_id=book_id))
+    return dataclasses.replace(book,
+                               favourite=repo.is_user_favourite(
+                                   user_id=user.id, book_id=book_id))
+
+
+def get_books_use_case(repo: IBookRepository, user: User,
+                       book_ids: list[int]) -> list[BookDetail | None]:
+    return repo.get_book_details(user=user,
+                                 book_ids=book_ids,
+                                 reviews_limit=BATCH_REVIEWS_LIMIT)
+
+
+def get_book_stats_use_case(repo: IBookRepository, book_id: int) -> BookStats:
+    return repo.get_book_stats(book_id=book_id)
+
+
+def get_similar_books_use_case(repo: IBookRepository, user: User,
+                               book_id: int) -> list[BookInfo]:
+    return repo.get_similar_books(user=user, book_id=book_id)
+
+
+def get_feed_use_case(repo: IBookRepository, user: User,
+                      limit: int) -> list[BookInfo]:
+    affinity = repo.get_user_affinity(user_id=user.id)
+    book_ids = rank_feed(catalogue_cache.get(repo.get_catalogue),
+                         authors=affinity.authors,
+                         categories=affinity.categories,
+                         exclude=repo.get_favourite_ids(user_id=user.id),
+                         limit=limit)
+    return repo.get_books(user=user, book_ids=book_ids.tolist())
+
+
+def get_book_reviews_use_case(repo: IBookRepository, book_id: int,
+                              before: int | None, limit: int) -> ReviewPage:
+    return repo.get_book_reviews(book_id=book_id, before=before, limit=limit)
+
+
+def suggest_use_case(repo: IBookRepository, prefix: str,
+                     limit: int) -> list[Suggestion]:
+    return suggest_cache.get(repo.get_suggest_index).suggest(prefix=prefix,
+                                                             limit=limit)
+
+
+def get_changes_use_case(repo: IBookRepository, user: User, since: int,
+                         limit: int) -> ChangeSet:
+    return repo.get_changes(user=user, since=since, limit=limit)
+
+
+def get_change_token_use_case(repo: IBookRepository) -> str:
+    return repo.get_change_token()
 
 
 def add_to_favourite_use_case(repo: IBookRepository, user: User,
                               book_id: int) -> None:
-    if repo.is_user_favourite(user_id=user.id, book_id=book_id):
-        raise AlreadyExistsException(message="Уже добавлен в избранные")
     return repo.add_to_favourite(user_id=user.id, book_id=book_id)
 
 
 def create_review_use_case(repo: IBookRepository, user: User,
                            review: BookReview) -> BookReview:
-    if repo.get_book_review(user_id=user.id, book_id=review.book_id):
-        raise AlreadyExistsException(message="Пользователь уже оставил отзыв")
-    return repo.create_review(user=user, review=review)
+    created = repo.create_review(user=user, review=review)
+    transaction.on_commit(lambda: broker.publish(
+        Event(REVIEW_CREATED, created.book_id, created)))
+    return created
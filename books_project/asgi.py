@@ -3,6 +3,10 @@ ASGI config for books_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serving the project through it is required for the server-sent events of
+/api/v1/books/events/: the streams are async generators consumed by the
+server event loop, so idle streams do not hold a worker thread.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -0,0 +1,99 @@
+"""
+OpenAPI documentation routes.
+
+Imported by books_project.urls only when settings.API_DOCS_ENABLED is set,
+which keeps drf-yasg out of API workers that do not serve the docs.
+
+The schema does not depend on the request, so it is rendered once and
+served as a static artifact: either the file at settings.API_SCHEMA_FILE,
+produced at build time with
+
+    python manage.py generate_swagger openapi.json
+
+or, when it is not set, a copy generated on first use.
+"""
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, Http404
+from django.urls import path
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, yaml_sane_dump
+from drf_yasg.generators import OpenAPISchemaGenerator
+from drf_yasg.utils import swagger_auto_schema
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+from rest_framework.authentication import TokenAuthentication
+
+api_info = openapi.Info(
+    title="Books API",
+    default_version='v1',
+    description="Books",
+)
+
+schema_view = get_schema_view(
+    api_info,
+    public=True,
+    permission_classes=(permissions.AllowAny, ),
+    authentication_classes=(TokenAuthentication, ),
+)
+
+
+def document(view, **schema) -> None:
+    """
+    Attaches an OpenAPI schema to a function view, used by the annotation
+    modules of the apps.
+    """
+    swagger_auto_schema(**schema)(view)
+
+
+_artifacts: dict[str, bytes] = {}
+_artifacts_lock = threading.Lock()
+
+
+def _render_schema() -> bytes:
+    if settings.API_SCHEMA_FILE:
+        return Path(settings.API_SCHEMA_FILE).read_bytes()
+    generator = OpenAPISchemaGenerator(api_info)
+    schema = generator.get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+def get_schema_artifact(format: str) -> bytes:
+    with _artifacts_lock:
+        if format not in _artifacts:
+            rendered = _render_schema()
+            _artifacts[".json"] = rendered
+            _artifacts[".yaml"] = yaml_sane_dump(json.loads(
+                rendered, object_pairs_hook=OrderedDict),
+                                                 binary=True)
+        return _artifacts[format]
+
+
+def schema_artifact(request, format: str):
+    content_types = {
+        ".json": "application/json",
+        ".yaml": "application/yaml",
+    }
+    if format not in content_types:
+        raise Http404
+    return HttpResponse(get_schema_artifact(format),
+                        content_type=content_types[format])
+
+
+urlpatterns = [
+    path('swagger<format>/', schema_artifact, name='schema-json'),
+    path('swagger/',
+         schema_view.with_ui('swagger', cache_timeout=0),
+         name='schema-swagger-ui'),
+    path('redoc/',
+         schema_view.with_ui('redoc', cache_timeout=0),
+         name='schema-redoc'),
+]
+
+# Last, the annotations import document() from here
+from books.api import docs as books_docs  # noqa: E402,F401
+from users.api import docs as users_docs  # noqa: E402,F401
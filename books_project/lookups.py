@@ -0,0 +1,29 @@
+import sys
+
+from django.db import models
+from django.db.models.lookups import StartsWith
+
+
+@models.CharField.register_lookup
+class Prefix(StartsWith):
+    """
+    Case-sensitive prefix match that can use a btree index on the column.
+
+    Elsewhere it is startswith: PostgreSQL uses an index with
+    varchar_pattern_ops for it, MySQL one with a binary collation. SQLite
+    LIKE ignores case and only uses NOCASE indexes, so there it is a range
+    on the column instead.
+    """
+    lookup_name = "prefix"
+
+    def as_sqlite(self, compiler, connection):
+        if (not isinstance(self.rhs, str) or not self.rhs
+                or self.rhs[-1] == chr(sys.maxunicode)):
+            return super().as_sql(compiler, connection)
+        lhs_sql, lhs_params = self.process_lhs(compiler, connection)
+        # Strings starting with the prefix are the ones from it up to the
+        # prefix with its last character moved on, SQLite compares text by
+        # code point.
+        end = self.rhs[:-1] + chr(ord(self.rhs[-1]) + 1)
+        return (f"{lhs_sql} >= %s AND {lhs_sql} < %s", (*lhs_params, self.rhs,
+                                                        *lhs_params, end))
@@ -0,0 +1,171 @@
+import random
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.db import connection
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+
+from books_project import profiling
+
+
+class AdmissionControlMiddleware:
+    """
+    Sheds API requests with 503 before they reach a view when the worker is
+    overloaded: too many requests already in flight, or database queries
+    recently slower than settings.ADMISSION_MAX_DB_LATENCY_MS on average.
+
+    Query latency is tracked as an exponentially weighted moving average.
+    Samples older than `latency_window` seconds are ignored, so once load
+    has been shed long enough requests are admitted again and refresh it.
+    """
+
+    latency_weight = 0.1
+    latency_window = 5.0
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._latency_ms = 0.0
+        self._latency_sampled_at = 0.0
+
+    def __call__(self, request):
+        if not request.path.startswith("/api/"):
+            return self.get_response(request)
+
+        with self._lock:
+            overloaded = (self._in_flight >= settings.ADMISSION_MAX_IN_FLIGHT
+                          or self._database_slow())
+            if not overloaded:
+                self._in_flight += 1
+        if overloaded:
+            return self._reject()
+
+        try:
+            with connection.execute_wrapper(self._time_query):
+                return self.get_response(request)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _database_slow(self) -> bool:
+        age = time.monotonic() - self._latency_sampled_at
+        return (age < self.latency_window
+                and self._latency_ms > settings.ADMISSION_MAX_DB_LATENCY_MS)
+
+    def _time_query(self, execute, sql, params, many, context):
+        started = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            finished = time.monotonic()
+            elapsed_ms = (finished - started) * 1000
+            with self._lock:
+                self._latency_ms += self.latency_weight * (elapsed_ms -
+                                                           self._latency_ms)
+                self._latency_sampled_at = finished
+
+    def _reject(self):
+        response = JsonResponse(
+            {"detail": "Сервер перегружен, повторите запрос позже"},
+            status=503)
+        response["Retry-After"] = str(settings.ADMISSION_RETRY_AFTER)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Captures a CPU and memory profile of single API requests, see
+    books_project.profiling.
+
+    Off unless settings.PROFILING_DIR is set. A request is profiled when it
+    carries an X-Profile header signed by `manage.py profile_token`, or at
+    random with probability settings.PROFILING_SAMPLE_RATE. Allocations are
+    only traced for tokens made with `--memory`, tracing slows the request
+    down several times. One request is profiled at a time per process,
+    others run as usual meanwhile. The capture id is returned in the
+    X-Profile-Id header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        mode = None
+        if settings.PROFILING_DIR and request.path.startswith("/api/"):
+            mode = self._requested_mode(request)
+        if mode is None or not self._lock.acquire(blocking=False):
+            return self.get_response(request)
+
+        try:
+            capture = profiling.Capture(
+                interval=settings.PROFILING_INTERVAL,
+                trace_frames=settings.PROFILING_TRACE_FRAMES
+                if mode == profiling.MEMORY else 0)
+            capture.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                capture.stop()
+            capture.save(
+                Path(settings.PROFILING_DIR), {
+                    "method": request.method,
+                    "path": request.get_full_path(),
+                    "view": getattr(request.resolver_match, "view_name", None),
+                    "status": response.status_code,
+                })
+        finally:
+            self._lock.release()
+        response["X-Profile-Id"] = capture.id
+        return response
+
+    def _requested_mode(self, request) -> str | None:
+        token = request.headers.get("X-Profile")
+        if token:
+            return profiling.read_token(token,
+                                        settings.PROFILING_TOKEN_MAX_AGE)
+        if random.random() < settings.PROFILING_SAMPLE_RATE:
+            return profiling.CPU
+        return None
+
+
+class SiteOnlyMixin:
+    """
+    Passes API requests straight through the middleware. The API
+    authenticates with tokens and its views are exempt from CSRF checks, so
+    sessions, CSRF cookies, request.user and messages are only needed by
+    the admin and the documentation pages.
+    """
+
+    def __call__(self, request):
+        if request.path.startswith("/api/"):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class SiteSessionMiddleware(SiteOnlyMixin, SessionMiddleware):
+    pass
+
+
+class SiteCsrfViewMiddleware(SiteOnlyMixin, CsrfViewMiddleware):
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if request.path.startswith("/api/"):
+            return None
+        return super().process_view(request, callback, callback_args,
+                                    callback_kwargs)
+
+
+class SiteAuthenticationMiddleware(SiteOnlyMixin, AuthenticationMiddleware):
+    pass
+
+
+class SiteMessageMiddleware(SiteOnlyMixin, MessageMiddleware):
+    pass
@@ -0,0 +1,179 @@
+"""
+Per-request CPU and memory captures, see ProfilingMiddleware.
+
+A capture samples the stack of the thread serving the request every
+`interval` seconds, and optionally traces allocations with tracemalloc,
+while the request runs. It is written to settings.PROFILING_DIR as files
+sharing an id:
+
+    <id>.cpu.folded    wall-clock samples per stack
+    <id>.alloc.folded  bytes allocated and still alive per stack
+    <id>.json          request, status, duration, sample and memory totals
+
+Tracing allocations makes every allocation record its traceback, which
+slows the request down several times, in proportion to the frames kept,
+and inflates allocation heavy code in the CPU samples. It is only done
+when asked for with a memory token.
+
+The .folded files are collapsed stacks, one `frame;frame;frame weight`
+line per stack from the outermost frame, the input of flamegraph.pl,
+speedscope and inferno. `manage.py profile_summary` ranks the hottest
+frames across captures.
+"""
+import collections
+import json
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+from typing import Iterator
+
+from django.core import signing
+
+TOKEN_SALT = "books_project.profiling"
+
+CPU = "cpu"
+MEMORY = "memory"
+
+
+def make_token(memory: bool = False) -> str:
+    """
+    Returns a value for the X-Profile header, see ProfilingMiddleware.
+    """
+    return signing.TimestampSigner(
+        salt=TOKEN_SALT).sign(MEMORY if memory else CPU)
+
+
+def read_token(token: str, max_age: int) -> str | None:
+    """
+    Returns CPU or MEMORY for a valid token, None otherwise.
+    """
+    try:
+        return signing.TimestampSigner(salt=TOKEN_SALT).unsign(token,
+                                                               max_age=max_age)
+    except signing.BadSignature:
+        return None
+
+
+class StackSampler(threading.Thread):
+    """
+    Counts the stacks of another thread, cut at the frame the sampler was
+    started from, until stopped.
+    """
+
+    def __init__(self, thread_id: int, root, interval: float):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.stacks: collections.Counter[str] = collections.Counter()
+        self._thread_id = thread_id
+        self._root = root
+        self._interval = interval
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            frames = []
+            while frame is not None and frame is not self._root:
+                frames.append(_frame_label(frame))
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+class Capture:
+    """
+    Profiles the code run by the calling thread between start and stop,
+    and its allocations unless `trace_frames` is 0.
+
+    tracemalloc traces every thread, so allocations of requests served at
+    the same time are counted too.
+    """
+
+    def __init__(self, interval: float, trace_frames: int = 0):
+        self.id = (f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-"
+                   f"{uuid.uuid4().hex[:8]}")
+        self._interval = interval
+        self._trace_frames = trace_frames
+
+    def start(self) -> None:
+        self._started_tracing = False
+        self._baseline = None
+        if self._trace_frames:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if not self._started_tracing:
+                self._baseline = tracemalloc.take_snapshot()
+            else:
+                tracemalloc.start(self._trace_frames)
+            tracemalloc.reset_peak()
+        self._sampler = StackSampler(threading.get_ident(), sys._getframe(1),
+                                     self._interval)
+        self._started_at = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._sampler.stop()
+        self.duration = time.perf_counter() - self._started_at
+        self.allocations = []
+        self.peak_bytes = None
+        if not self._trace_frames:
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        self.peak_bytes = tracemalloc.get_traced_memory()[1]
+        if self._started_tracing:
+            tracemalloc.stop()
+        if self._baseline is None:
+            self.allocations = [(stat.traceback, stat.size)
+                                for stat in snapshot.statistics("traceback")]
+        else:
+            self.allocations = [
+                (stat.traceback, stat.size_diff)
+                for stat in snapshot.compare_to(self._baseline, "traceback")
+                if stat.size_diff > 0
+            ]
+
+    def save(self, directory: Path, metadata: dict) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        _write_folded(directory / f"{self.id}.cpu.folded",
+                      self._sampler.stacks.items())
+        if self._trace_frames:
+            _write_folded(directory / f"{self.id}.alloc.folded",
+                          ((";".join(f"{frame.filename}:{frame.lineno}"
+                                     for frame in traceback), size)
+                           for traceback, size in self.allocations))
+        metadata.update(id=self.id,
+                        duration_ms=round(self.duration * 1000, 3),
+                        interval_ms=self._interval * 1000,
+                        samples=sum(self._sampler.stacks.values()),
+                        allocated_bytes=sum(size
+                                            for _, size in self.allocations)
+                        if self._trace_frames else None,
+                        peak_bytes=self.peak_bytes)
+        (directory / f"{self.id}.json").write_text(json.dumps(metadata))
+
+
+def read_folded(path: Path) -> Iterator[tuple[list[str], int]]:
+    with path.open() as lines:
+        for line in lines:
+            stack, _, weight = line.rstrip("\n").rpartition(" ")
+            yield stack.split(";"), int(weight)
+
+
+def _write_folded(path: Path, stacks) -> None:
+    with path.open("w") as folded:
+        for stack, weight in stacks:
+            folded.write(f"{stack} {weight}\n")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
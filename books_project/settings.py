@@ -27,6 +27,13 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# Serve the OpenAPI schema and the Swagger/ReDoc pages
+API_DOCS_ENABLED = os.environ.get("API_DOCS_ENABLED", "true").lower() == "true"
+
+# Path to a schema prebuilt with `manage.py generate_swagger`, see
+# books_project/docs.py
+API_SCHEMA_FILE = os.environ.get("API_SCHEMA_FILE")
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -40,20 +47,26 @@ INSTALLED_APPS = [
     # third party apps
     "rest_framework",
     "rest_framework.authtoken",
-    "drf_yasg",
 
     # custom apps
     "books",
     "users",
 ]
 
+if API_DOCS_ENABLED:
+    INSTALLED_APPS.append("drf_yasg")
+
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
+    "books_project.middleware.AdmissionControlMiddleware",
+    "books_project.middleware.ProfilingMiddleware",
+    # Sessions, CSRF, request.user and messages are skipped for /api/, see
+    # books_project.middleware.SiteOnlyMixin
+    "books_project.middleware.SiteSessionMiddleware",
     "django.middleware.common.CommonMiddleware",
-    "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
-    "django.contrib.messages.middleware.MessageMiddleware",
+    "books_project.middleware.SiteCsrfViewMiddleware",
+    "books_project.middleware.SiteAuthenticationMiddleware",
+    "books_project.middleware.SiteMessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -87,6 +100,19 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND":
+        os.environ.get("CACHE_BACKEND",
+                       "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION":
+        os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -139,7 +165,72 @@ REST_FRAMEWORK = {
     # ...
 }
 
+# Token buckets of books_project.throttling.TokenBucketThrottle: capacity in
+# tokens and refill rate in tokens per second
+THROTTLE_BUCKETS = {
+    "books_read": {
+        "capacity": 200,
+        "refill_rate": 5,
+    },
+    "books_write": {
+        "capacity": 20,
+        "refill_rate": 0.5,
+    },
+}
+
+# Load shedding, see books_project.middleware.AdmissionControlMiddleware
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 64))
+ADMISSION_MAX_DB_LATENCY_MS = float(
+    os.environ.get("ADMISSION_MAX_DB_LATENCY_MS", 250))
+ADMISSION_RETRY_AFTER = 1
+
+# Filter the book list with the in-process NumPy catalogue index (see
+# books.catalogue) and only hydrate the matching books from the database
+BOOKS_LIST_FROM_INDEX = os.environ.get("BOOKS_LIST_FROM_INDEX",
+                                       "false").lower() == "true"
+
+# Read the book list from the denormalized book_listing table instead of
+# joining the normalized ones. Build it first with
+# `manage.py rebuild_book_listing`
+BOOKS_LIST_FROM_LISTING = os.environ.get("BOOKS_LIST_FROM_LISTING",
+                                         "false").lower() == "true"
+
+# Per-request profiles, see books_project.middleware.ProfilingMiddleware.
+# Profiling is off unless PROFILING_DIR is set
+PROFILING_DIR = os.environ.get("PROFILING_DIR")
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+# Seconds an X-Profile token from `manage.py profile_token` stays valid
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+# Seconds between stack samples, and frames kept per allocation traceback
+# by memory profiles. Tracing cost grows with the frames
+PROFILING_INTERVAL = 0.001
+PROFILING_TRACE_FRAMES = 10
+
+# Implementation of books.repos.book.IBookRepository used by the API.
+# books.repos.sql.SqlBookRepository runs hand-written SQL for the book list,
+# the book detail and the writes instead of the ORM
+BOOKS_REPOSITORY = os.environ.get("BOOKS_REPOSITORY",
+                                  "books.repos.book.BookRepository")
+
+# Server-sent events of /api/v1/books/events/, see books.events. The stream
+# needs the ASGI application, books_project.asgi. Use
+# books.events.ChangeLogBackend when reviews are written or ratings updated
+# by other processes than the one serving the stream
+BOOKS_EVENTS_BACKEND = os.environ.get("BOOKS_EVENTS_BACKEND",
+                                      "books.events.LocalBackend")
+BOOKS_EVENTS_POLL_INTERVAL = 1.0
+# Events queued for a slow client before its stream is closed
+BOOKS_EVENTS_MAX_PENDING = 100
+BOOKS_EVENTS_KEEPALIVE = 15
+# Streams are closed after this many seconds and clients reconnect, so
+# streams of clients gone without notice do not live forever
+BOOKS_EVENTS_MAX_AGE = 300
+
 SWAGGER_SETTINGS = {
+    'DEFAULT_INFO': 'books_project.docs.api_info',
+    'SPEC_URL': ('schema-json', {
+        'format': '.json'
+    }),
     'USE_SESSION_AUTH': False,
     'SECURITY_DEFINITIONS': {
         'Bearer': {
@@ -149,3 +240,9 @@ SWAGGER_SETTINGS = {
         }
     }
 }
+
+REDOC_SETTINGS = {
+    'SPEC_URL': ('schema-json', {
+        'format': '.json'
+    }),
+}
@@ -0,0 +1,13 @@
+from django.test.runner import DiscoverRunner
+
+
+class ParallelDiscoverRunner(DiscoverRunner):
+    """
+    Runs the tests in one process per core unless --parallel says
+    otherwise. Every process gets its own copy of the test database.
+    """
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.set_defaults(parallel="auto")
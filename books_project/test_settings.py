@@ -0,0 +1,55 @@
+"""
+Settings for `manage.py test`, which uses them unless DJANGO_SETTINGS_MODULE
+or --settings says otherwise:
+
+    python manage.py test
+
+The database is a throwaway SQLite file per test process, so tests can
+race writes from several threads on its locks, passwords are hashed with
+a fast hasher and tests run in parallel, one process per core.
+Use cases can be tested without a database at all against
+books.repos.memory.InMemoryBookRepository.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("SECRET_KEY", "test")
+
+from books_project.settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+        "OPTIONS": {
+            "timeout": 30,
+        },
+        "TEST": {
+            "NAME":
+            os.path.join(tempfile.gettempdir(),
+                         f"books-test-{os.getpid()}.sqlite3"),
+        },
+    }
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+TEST_RUNNER = "books_project.test_runner.ParallelDiscoverRunner"
+
+THROTTLE_BUCKETS = {
+    name: {
+        "capacity": 1_000_000,
+        "refill_rate": 1_000_000,
+    }
+    for name in THROTTLE_BUCKETS  # noqa: F405
+}
+
+PROFILING_DIR = None
+PROFILING_SAMPLE_RATE = 0
+BOOKS_EVENTS_BACKEND = "books.events.LocalBackend"
@@ -0,0 +1,149 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+
+class BucketContended(Exception):
+    pass
+
+
+def _cache_errors() -> tuple[type[Exception], ...]:
+    """
+    Returns the exceptions cache backends raise when the cache server is
+    unreachable: socket errors and the errors of the installed clients.
+    """
+    errors: list[type[Exception]] = [OSError]
+    try:
+        from redis.exceptions import RedisError
+        errors.append(RedisError)
+    except ImportError:
+        pass
+    try:
+        from pymemcache.exceptions import MemcacheError
+        errors.append(MemcacheError)
+    except ImportError:
+        pass
+    try:
+        from pylibmc import Error as PylibmcError
+        errors.append(PylibmcError)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+CACHE_ERRORS = _cache_errors()
+
+
+class LocalBuckets:
+    """
+    Process local token buckets. Used when the shared cache is unreachable.
+    """
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, refill_rate: float,
+             cost: float) -> float:
+        with self._lock:
+            state, wait = take_tokens(self._buckets.get(key), capacity,
+                                      refill_rate, cost, time.time())
+            self._buckets[key] = state
+        return wait
+
+
+class SharedBuckets:
+    """
+    Token buckets stored in the shared cache. The read-modify-write of a
+    bucket is guarded by a short lock taken with cache.add. The lock holds
+    a token of its owner, a lock that expired and was taken by another
+    worker is left to it.
+    """
+
+    lock_attempts = 3
+    lock_retry_interval = 0.002
+    lock_timeout = 1
+
+    def take(self, key: str, capacity: float, refill_rate: float,
+             cost: float) -> float:
+        lock_key = f"{key}:lock"
+        lock_token = uuid.uuid4().hex
+        for _ in range(self.lock_attempts):
+            if cache.add(lock_key, lock_token, timeout=self.lock_timeout):
+                break
+            time.sleep(self.lock_retry_interval)
+        else:
+            raise BucketContended(key)
+        try:
+            state, wait = take_tokens(cache.get(key), capacity, refill_rate,
+                                      cost, time.time())
+            cache.set(key, state, timeout=int(capacity / refill_rate) + 1)
+        finally:
+            if cache.get(lock_key) == lock_token:
+                cache.delete(lock_key)
+        return wait
+
+
+def take_tokens(state: tuple[float, float] | None, capacity: float,
+                refill_rate: float, cost: float,
+                now: float) -> tuple[tuple[float, float], float]:
+    """
+    Refills a bucket for the time passed since its last update and takes
+    `cost` tokens from it. Returns the new state and 0 when the tokens
+    were taken, or the seconds until enough tokens are available.
+    """
+    tokens, updated_at = state or (capacity, now)
+    tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+    if tokens >= cost:
+        return (tokens - cost, now), 0
+    return (tokens, now), (cost - tokens) / refill_rate
+
+
+shared_buckets = SharedBuckets()
+local_buckets = LocalBuckets()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Per user token bucket throttle.
+
+    Subclasses set `scope`, a key of settings.THROTTLE_BUCKETS with the
+    bucket capacity and refill rate (tokens per second), and `cost`, the
+    tokens one request takes. Views sharing a scope share the bucket, so
+    expensive endpoints drain it faster.
+
+    Requests of a user that find the shared bucket locked by the user's
+    other requests after a few attempts are throttled for the lock timeout.
+    Only when the shared cache is unreachable the process local buckets
+    are used, which limit each worker on its own.
+    """
+
+    scope: str
+    cost: float = 1
+
+    def __init__(self):
+        self._wait = 0.0
+
+    def allow_request(self, request, view) -> bool:
+        bucket = settings.THROTTLE_BUCKETS[self.scope]
+        if request.user and request.user.is_authenticated:
+            ident = f"user:{request.user.pk}"
+        else:
+            ident = f"ip:{self.get_ident(request)}"
+        key = f"throttle:{self.scope}:{ident}"
+        try:
+            self._wait = shared_buckets.take(key, bucket["capacity"],
+                                             bucket["refill_rate"], self.cost)
+        except BucketContended:
+            self._wait = shared_buckets.lock_timeout
+        except CACHE_ERRORS:
+            self._wait = local_buckets.take(key, bucket["capacity"],
+                                            bucket["refill_rate"], self.cost)
+        return self._wait == 0
+
+    def wait(self) -> float:
+        return self._wait
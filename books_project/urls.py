@@ -14,36 +14,17 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
-from rest_framework import permissions
-from rest_framework.authentication import TokenAuthentication
-
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Books API",
-        default_version='v1',
-        description="Books",
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny, ),
-    authentication_classes=(TokenAuthentication, ),
-)
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/v1/books/", include("books.api.urls")),
     path("api/v1/users/", include("users.api.urls")),
-    path('swagger<format>/',
-         schema_view.without_ui(cache_timeout=0),
-         name='schema-json'),
-    path('swagger/',
-         schema_view.with_ui('swagger', cache_timeout=0),
-         name='schema-swagger-ui'),
-    path('redoc/',
-         schema_view.with_ui('redoc', cache_timeout=0),
-         name='schema-redoc'),
 ]
+
+if settings.API_DOCS_ENABLED:
+    from books_project import docs
+
+    urlpatterns += docs.urlpatterns
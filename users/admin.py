@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from books_project.pagination import EstimatedCountPaginator
 from users.forms import CustomUserCreationForm, CustomUserChangeForm
 from users.models import CustomUser
 
@@ -15,7 +16,6 @@ class CustomUserAdmin(UserAdmin):
         "is_active",
     )
     list_filter = (
-        "email",
         "is_staff",
         "is_active",
     )
@@ -34,6 +34,8 @@ class CustomUserAdmin(UserAdmin):
     }), )
     search_fields = ("email", )
     ordering = ("email", )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(CustomUser, CustomUserAdmin)
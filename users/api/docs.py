@@ -0,0 +1,22 @@
+"""
+OpenAPI annotations for the users API views, see books_project.docs.
+"""
+from books_project.docs import document
+from users.api import views
+from users.api.serializers import UserRegistrationSerializer, UserLoginSerializer
+
+document(views.register_user,
+         method="post",
+         request_body=UserRegistrationSerializer(),
+         responses={
+             201: 'User registered successfully',
+             400: 'Bad request'
+         })
+
+document(views.login_user,
+         method="post",
+         request_body=UserLoginSerializer(),
+         responses={
+             200: 'User logged in successfully',
+             401: 'Unauthorized'
+         })
@@ -4,20 +4,14 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from django.contrib.auth import login, get_user_model
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in
 from rest_framework.authtoken.models import Token
 from users.api.serializers import UserRegistrationSerializer, UserLoginSerializer
-from drf_yasg.utils import swagger_auto_schema
 
 User = get_user_model()
 
 
-@swagger_auto_schema(method="post",
-                     request_body=UserRegistrationSerializer(),
-                     responses={
-                         201: 'User registered successfully',
-                         400: 'Bad request'
-                     })
 @api_view(["POST"])
 @permission_classes([AllowAny])
 def register_user(request):
@@ -25,17 +19,11 @@ def register_user(request):
     if serializer.is_valid():
         user = serializer.save()
         token, _ = Token.objects.get_or_create(user=user)
-        login(request, user)
+        _logged_in(request, user)
         return Response({'token': token.key}, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-@swagger_auto_schema(method="post",
-                     request_body=UserLoginSerializer(),
-                     responses={
-                         200: 'User logged in successfully',
-                         401: 'Unauthorized'
-                     })
 @api_view(["POST"])
 @permission_classes([AllowAny])
 def login_user(request):
@@ -44,6 +32,12 @@ def login_user(request):
     if serializer.is_valid():
         user = serializer.validated_data['user']
         token, _ = Token.objects.get_or_create(user=user)
-        login(request, user)
+        _logged_in(request, user)
         return Response({'token': token.key}, status=status.HTTP_200_OK)
     return Response(serializer.errors, status=status.HTTP_401_UNAUTHORIZED)
+
+
+def _logged_in(request, user):
+    # What login() does minus the session, the API authenticates with the
+    # token. Updates last_login.
+    user_logged_in.send(sender=user.__class__, request=request, user=user)
@@ -0,0 +1,41 @@
+import importlib
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = ("Deletes expired sessions in batches, so the table is not locked "
+            "for the whole purge like by clearsessions")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--pause",
+                            type=float,
+                            default=0.1,
+                            help="Seconds to sleep between batches")
+
+    def handle(self, *args, batch_size, pause, **options):
+        store = importlib.import_module(settings.SESSION_ENGINE).SessionStore
+        if not hasattr(store, "get_model_class"):
+            raise CommandError(
+                f"{settings.SESSION_ENGINE} does not keep sessions in the "
+                "database")
+        session_model = store.get_model_class()
+        expired = session_model.objects.filter(
+            expire_date__lt=timezone.now()).values_list("session_key",
+                                                        flat=True)
+
+        purged = 0
+        while True:
+            keys = list(expired[:batch_size])
+            if not keys:
+                break
+            session_model.objects.filter(session_key__in=keys).delete()
+            purged += len(keys)
+            if len(keys) < batch_size:
+                break
+            time.sleep(pause)
+        self.stdout.write(f"Purged {purged} expired sessions")
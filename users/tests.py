@@ -1,2 +1,82 @@
+import datetime
+import io
 
-# Create your tests here.
+from django.contrib.auth.signals import user_logged_in
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from users.models import CustomUser
+
+
+class TokenLoginTests(TestCase):
+
+    def setUp(self):
+        self.logged_in: list[CustomUser] = []
+
+        def receiver(sender, request, user, **kwargs):
+            self.logged_in.append(user)
+
+        user_logged_in.connect(receiver)
+        self.addCleanup(user_logged_in.disconnect, receiver)
+
+    def test_register(self):
+        response = self.client.post("/api/v1/users/register/", {
+            "email": "reader@example.com",
+            "password": "password"
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertIn("token", response.json())
+        self.assertEqual([user.email for user in self.logged_in],
+                         ["reader@example.com"])
+        self.assertFalse(Session.objects.exists())
+
+    def test_login_fires_user_logged_in_without_a_session(self):
+        user = CustomUser.objects.create_user(email="reader@example.com",
+                                              password="password")
+        response = self.client.post("/api/v1/users/login/", {
+            "email": "reader@example.com",
+            "password": "password"
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.logged_in, [user])
+        user.refresh_from_db()
+        self.assertIsNotNone(user.last_login)
+        self.assertNotIn("sessionid", response.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    def test_wrong_password(self):
+        CustomUser.objects.create_user(email="reader@example.com",
+                                       password="password")
+        response = self.client.post("/api/v1/users/login/", {
+            "email": "reader@example.com",
+            "password": "wrong"
+        })
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.logged_in, [])
+
+
+class PurgeSessionsTests(TestCase):
+
+    def test_deletes_expired_sessions_only(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key=f"expired-{i}",
+                                   session_data="",
+                                   expire_date=now -
+                                   datetime.timedelta(days=1))
+        Session.objects.create(session_key="live",
+                               session_data="",
+                               expire_date=now + datetime.timedelta(days=1))
+        out = io.StringIO()
+        call_command("purge_sessions",
+                     "--batch-size",
+                     "2",
+                     "--pause",
+                     "0",
+                     stdout=out)
+        self.assertEqual(
+            list(Session.objects.values_list("session_key", flat=True)),
+            ["live"])
+        self.assertIn("Purged 5 expired sessions", out.getvalue())